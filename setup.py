@@ -501,6 +501,58 @@ class TestUI(TestBaseCommand):
         TestBaseCommand.run(self)
 
 
+class TestBenchmark(TestBaseCommand):
+    description = "Run performance benchmarks"
+    user_options = TestBaseCommand.user_options + [
+        ("output=", None, "Save results as JSON to the passed path"),
+        ("compare=", None,
+         "Compare results against a JSON file saved with --output, "
+         "and fail if any benchmark regressed"),
+        ("threshold=", None,
+         "Percentage slowdown that --compare reports as a regression "
+         "(default=10)"),
+    ]
+
+    def initialize_options(self):
+        TestBaseCommand.initialize_options(self)
+        self.output = None
+        self.compare = None
+        self.threshold = 10
+
+    def finalize_options(self):
+        TestBaseCommand.finalize_options(self)
+        self.threshold = float(self.threshold)
+
+    def _handle_results(self):
+        from tests.benchmarks import utils as benchutils
+        if self.output:
+            benchutils.save_results(self.output)
+        if not self.compare:
+            return 0
+
+        lines, regressions = benchutils.compare_results(
+                benchutils.load_results(self.compare),
+                benchutils.get_results(), self.threshold)
+        print("\n".join(lines))
+        if regressions:
+            print("%d benchmarks regressed more than %s%%" %
+                  (len(regressions), self.threshold))
+            return 1
+        return 0
+
+    def run(self):
+        self._testfiles = self._find_tests_in_dir("tests/benchmarks",
+                                                  ["utils.py"])
+        self._force_verbose = True
+        try:
+            TestBaseCommand.run(self)
+        except SystemExit as e:
+            err = e.code
+            if not err:
+                err = self._handle_results()
+            sys.exit(err)
+
+
 class TestURLFetch(TestBaseCommand):
     description = "Test fetching kernels and isos from various distro trees"
 
@@ -681,6 +733,7 @@ distutils.core.setup(
         'rpm': my_rpm,
         'test': TestCommand,
         'test_ui': TestUI,
+        'test_benchmark': TestBenchmark,
         'test_urls': TestURLFetch,
         'test_initrd_inject': TestInitrdInject,
         'test_dist': TestDist,
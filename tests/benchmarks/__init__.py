@@ -0,0 +1,2 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
@@ -0,0 +1,86 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import os
+import unittest
+
+from virtinst import Capabilities
+from virtinst import DomainCapabilities
+
+from tests import utils as testutils
+from tests.benchmarks import utils
+
+COUNT = 20
+_CAPSDIR = "tests/capabilities-xml"
+
+
+# Both classes are interned, so constructing them from XML that's been
+# seen before skips parsing. These benchmarks are about the parse, so
+# opt out of that
+class _ParsedCapabilities(Capabilities):
+    _XML_INTERN = False
+
+
+class _ParsedDomainCapabilities(DomainCapabilities):
+    _XML_INTERN = False
+
+
+class TestCapabilities(unittest.TestCase):
+    """
+    Capabilities.guest_lookup for every guest and domain type in the
+    test capabilities XML, the way virt-install and the virt-manager
+    create wizard call it over and over
+    """
+    def setUp(self):
+        self.conn = testutils.URIs.open_testdefault_cached()
+        self.capslist = []
+        for filename in sorted(os.listdir(_CAPSDIR)):
+            if "domcaps" in filename:
+                continue
+            xml = open(os.path.join(_CAPSDIR, filename)).read()
+            self.capslist.append(xml)
+
+    def _lookup_all(self, caps):
+        for guest in caps.guests:
+            for domain in guest.domains:
+                caps.guest_lookup(os_type=guest.os_type, arch=guest.arch,
+                                  typ=domain.hypervisor_type)
+                caps.guest_lookup(arch=guest.arch)
+        try:
+            caps.guest_lookup()
+        except ValueError:
+            pass
+
+    def test_guest_lookup_cold(self):
+        def _run():
+            for dummy in range(COUNT):
+                for xml in self.capslist:
+                    self._lookup_all(_ParsedCapabilities(self.conn, xml))
+        utils.report("guest_lookup %d caps files fresh parse %d times" %
+                     (len(self.capslist), COUNT),
+                     utils.best_time(_run, rounds=3), COUNT)
+
+    def test_guest_lookup_warm(self):
+        capslist = [Capabilities(self.conn, xml) for xml in self.capslist]
+
+        def _run():
+            for dummy in range(COUNT):
+                for caps in capslist:
+                    self._lookup_all(caps)
+        utils.report("guest_lookup %d caps files repeated %d times" %
+                     (len(capslist), COUNT),
+                     utils.best_time(_run, rounds=3), COUNT)
+
+    def test_domcaps_lookup(self):
+        xml = open(os.path.join(_CAPSDIR, "kvm-x86_64-domcaps.xml")).read()
+
+        def _run():
+            for dummy in range(COUNT):
+                domcaps = _ParsedDomainCapabilities(self.conn, xml)
+                domcaps.supports_uefi_xml()
+                domcaps.find_uefi_path_for_arch()
+                domcaps.supports_safe_host_model()
+                domcaps.cpu.get_mode("custom").get_model("Opteron_G4")
+                domcaps.devices.disk.get_enum("bus").get_values()
+        utils.report("domcaps parse and lookup %d times" % COUNT,
+                     utils.best_time(_run, rounds=3), COUNT)
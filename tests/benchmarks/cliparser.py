@@ -0,0 +1,49 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import unittest
+
+from virtinst import Guest
+from virtinst import cli
+
+from tests import utils as testutils
+from tests.benchmarks import utils
+
+COUNT = 2000
+
+_DISK_OPTSTR = ("/tmp/foo.img,device=disk,bus=virtio,cache=none,"
+                "io=native,discard=unmap,serial=abc,"
+                "seclabel0.model=dac,seclabel0.relabel=no,"
+                "seclabel1.model=selinux,seclabel1.label=foo")
+_NETWORK_OPTSTR = ("network=default,model=virtio,mac=52:54:00:11:22:33,"
+                   "driver_name=vhost,driver_queues=4,link_state=up")
+
+
+class TestCLIParser(unittest.TestCase):
+    """
+    Sub-option dispatch for --disk and --network, like virt-install
+    and virt-xml do for every option string passed on the command line
+    """
+    def setUp(self):
+        self.conn = testutils.URIs.open_testdefault_cached()
+        self.guest = Guest(self.conn)
+
+    def test_disk_dispatch(self):
+        # pylint: disable=protected-access
+        def _run():
+            for dummy in range(COUNT):
+                parser = cli.ParserDisk(self.guest, _DISK_OPTSTR)
+                params = parser._optdict_to_param_list(
+                    parser.optdict.copy())
+                self.assertTrue(params)
+        utils.report("--disk dispatch %d options" % COUNT,
+                     utils.best_time(_run), COUNT)
+
+    def test_network_parse(self):
+        def _run():
+            guest = Guest(self.conn)
+            for dummy in range(COUNT):
+                cli.ParserNetwork(guest, _NETWORK_OPTSTR).parse(
+                    None, validate=False)
+        utils.report("--network parse %d options" % COUNT,
+                     utils.best_time(_run, rounds=3), COUNT)
@@ -0,0 +1,78 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import unittest
+
+import virtinst
+from virtinst import util
+
+from tests import utils as testutils
+from tests.benchmarks import utils
+
+COUNT = 50
+# Reading every prop of every device is a lot of xpath lookups
+READ_COUNT = 10
+
+# The biggest domain XML the test suite generates, with every
+# device type virt-install knows about
+_XML = open("tests/cli-test-xml/compare/virt-install-many-devices.xml").read()
+
+
+def _read_all_props(obj):
+    """
+    Read every XMLProperty of obj and its children, like virt-manager's
+    details page and virt-xml do when looking up devices
+    """
+    # pylint: disable=protected-access
+    for propname in obj._all_xml_props():
+        getattr(obj, propname)
+    for propname in obj._all_child_props():
+        for child in util.listify(getattr(obj, propname)):
+            _read_all_props(child)
+
+
+class TestGuest(unittest.TestCase):
+    """
+    Parse, read, edit and render a domain with lots of devices, the
+    hot paths of virt-xml, virt-install and the virt-manager details page
+    """
+    def setUp(self):
+        self.conn = testutils.URIs.open_testdefault_cached()
+
+    def test_parse(self):
+        def _run():
+            for dummy in range(COUNT):
+                virtinst.Guest(self.conn, parsexml=_XML)
+        utils.report("Guest parse many-devices %d times" % COUNT,
+                     utils.best_time(_run, rounds=3), COUNT)
+
+    def test_read_all_props(self):
+        guest = virtinst.Guest(self.conn, parsexml=_XML)
+
+        def _run():
+            for dummy in range(READ_COUNT):
+                _read_all_props(guest)
+        utils.report("Guest read all props many-devices %d times" %
+                     READ_COUNT, utils.best_time(_run, rounds=3), READ_COUNT)
+
+    def test_device_add_remove(self):
+        guest = virtinst.Guest(self.conn, parsexml=_XML)
+
+        def _run():
+            for idx in range(COUNT):
+                disk = virtinst.DeviceDisk(self.conn)
+                disk.path = "/dev/default-pool/bench%d.img" % idx
+                disk.target = "vdz"
+                guest.add_device(disk)
+                guest.get_xml()
+                guest.remove_device(disk)
+                guest.get_xml()
+        utils.report("Guest device add/remove many-devices %d times" % COUNT,
+                     utils.best_time(_run, rounds=3), COUNT)
+
+    def test_parse_get_xml(self):
+        def _run():
+            for dummy in range(COUNT):
+                virtinst.Guest(self.conn, parsexml=_XML).get_xml()
+        utils.report("Guest parse and get_xml many-devices %d times" % COUNT,
+                     utils.best_time(_run, rounds=3), COUNT)
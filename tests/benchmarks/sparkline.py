@@ -0,0 +1,75 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import random
+import unittest
+
+import gi
+gi.require_version("Gtk", "3.0")
+from gi.repository import Gdk
+
+import cairo
+
+from virtManager.graphwidgets import CellRendererSparkline
+
+from tests.benchmarks import utils
+
+ROWS = 1000
+GRAPH_LEN = 40
+
+
+class TestSparkline(unittest.TestCase):
+    """
+    Render the stats column of a 1000 row VM list, like vmmManager does
+    on every stats tick
+    """
+    def setUp(self):
+        rand = random.Random(1)
+        self.rows = [["vm%d" % idx, [rand.random() for dummy in
+                                     range(GRAPH_LEN)]]
+                     for idx in range(ROWS)]
+        self.surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 140, 40)
+        self.cr = cairo.Context(self.surface)
+        self.area = Gdk.Rectangle()
+        self.area.x = 0
+        self.area.y = 0
+        self.area.width = 140
+        self.area.height = 40
+
+    def _make_renderer(self):
+        cell = CellRendererSparkline()
+        cell.set_property("reversed", True)
+        return cell
+
+    def _render_all(self, cell, use_cache):
+        for key, data in self.rows:
+            cell.set_property("cache_key", use_cache and key or None)
+            cell.set_property("data_array", data)
+            cell.do_render(self.cr, None, self.area, self.area, 0)
+
+    def _new_sample(self):
+        for row in self.rows:
+            row[1] = [random.random()] + row[1][:-1]
+
+    def testRenderUncached(self):
+        cell = self._make_renderer()
+        secs = utils.best_time(lambda: self._render_all(cell, False))
+        utils.report("sparkline render %d rows, uncached" % ROWS, secs, ROWS)
+
+    def testRenderCached(self):
+        cell = self._make_renderer()
+        self._render_all(cell, True)
+        secs = utils.best_time(lambda: self._render_all(cell, True))
+        utils.report("sparkline render %d rows, cached" % ROWS, secs, ROWS)
+        self.assertTrue(cell.path_cache.hits >= ROWS)
+
+    def testRenderNewSamples(self):
+        cell = self._make_renderer()
+        self._render_all(cell, True)
+
+        def _tick():
+            self._new_sample()
+            self._render_all(cell, True)
+        secs = utils.best_time(_tick)
+        utils.report("sparkline render %d rows, new samples" % ROWS,
+                     secs, ROWS)
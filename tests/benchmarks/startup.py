@@ -0,0 +1,81 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import os
+import re
+import subprocess
+import sys
+import unittest
+
+from tests.benchmarks import utils
+
+# Command lines to time. Each is run with python -X importtime
+_COMMANDS = [
+    ["virt-install", "--version"],
+    ["virt-clone", "--version"],
+    ["virt-xml", "--version"],
+    ["virt-convert", "--version"],
+    ["virt-xml", "--connect", "test:///default",
+     "--build-xml", "--disk", "/tmp/foo.img"],
+]
+
+# Modules that none of the above commands should need to import
+_UNWANTED_MODULES = ["gi.repository.Libosinfo"]
+
+
+def _parse_importtime(output):
+    """
+    Parse -X importtime output to a list of
+    (module, self usec, cumulative usec, nesting depth)
+    """
+    ret = []
+    for line in output.splitlines():
+        m = re.match(r"import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)", line)
+        if not m:
+            continue
+        ret.append((m.group(4), int(m.group(1)), int(m.group(2)),
+                    len(m.group(3)) // 2))
+    return ret
+
+
+def _run_importtime(cmd):
+    env = os.environ.copy()
+    env["VIRTINST_TEST_SUITE"] = "1"
+    proc = subprocess.Popen(
+        [sys.executable, "-X", "importtime", "./" + cmd[0]] + cmd[1:],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env,
+        universal_newlines=True)
+    dummy, stderr = proc.communicate()
+    return _parse_importtime(stderr)
+
+
+class TestStartup(unittest.TestCase):
+    """
+    Track import time of the command line tools
+    """
+    def _check_command(self, cmd):
+        imports = _run_importtime(cmd)
+        self.assertTrue(imports, "No -X importtime output for %s" % cmd)
+
+        total = sum(cumul for dummy, dummy, cumul, depth in imports
+                    if depth == 0)
+        ours = sum(selfus for name, selfus, dummy, dummy in imports
+                   if name.split(".")[0] in ["virtinst", "virtconv",
+                                             "virtcli"])
+        name = " ".join(cmd)
+        utils.report("startup imports: %s" % name, total / 1000000.0)
+        utils.report("startup imports, virt-manager modules: %s" % name,
+                     ours / 1000000.0)
+
+        slowest = sorted(imports, key=lambda i: -i[1])[:5]
+        for modname, selfus, dummy, dummy in slowest:
+            print("    %-40s %.1f ms" % (modname, selfus / 1000.0))
+
+        imported = [i[0] for i in imports]
+        for modname in _UNWANTED_MODULES:
+            self.assertTrue(modname not in imported,
+                            "%s imported %s" % (name, modname))
+
+    def testStartup(self):
+        for cmd in _COMMANDS:
+            self._check_command(cmd)
@@ -0,0 +1,113 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import collections
+import json
+import platform
+import subprocess
+import time
+
+# Bump if the results file layout changes incompatibly
+RESULTS_VERSION = 1
+
+# name -> {"seconds": ..., "count": ...} for every report() call
+_results = collections.OrderedDict()
+
+
+def best_time(cb, rounds=5):
+    """
+    Run cb @rounds times, return the fastest run time in seconds
+    """
+    ret = None
+    for dummy in range(rounds):
+        start = time.perf_counter()
+        cb()
+        elapsed = time.perf_counter() - start
+        if ret is None or elapsed < ret:
+            ret = elapsed
+    return ret
+
+
+def report(name, seconds, count=None):
+    """
+    Print a benchmark result, and record it for save_results. @name
+    is the key results are compared by, so it should stay stable
+    """
+    msg = "%s: %.4fs" % (name, seconds)
+    if count:
+        msg += " (%.1f usec each)" % (seconds * 1000000 / count)
+    print(msg)
+    _results[name] = {"seconds": seconds, "count": count}
+
+
+######################
+# Results comparison #
+######################
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            stderr=subprocess.DEVNULL).decode("utf-8").strip()
+    except Exception:
+        return None
+
+
+def get_results():
+    """
+    Return the results recorded so far in the saved JSON format
+    """
+    return {
+        "version": RESULTS_VERSION,
+        "commit": _git_commit(),
+        "timestamp": int(time.time()),
+        "python": platform.python_version(),
+        "results": _results,
+    }
+
+
+def save_results(path):
+    with open(path, "w") as f:
+        json.dump(get_results(), f, indent=2, sort_keys=True)
+        f.write("\n")
+    print("Saved benchmark results to %s" % path)
+
+
+def load_results(path):
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("version") != RESULTS_VERSION:
+        raise RuntimeError("%s: unsupported benchmark results version %s" %
+                           (path, data.get("version")))
+    return data
+
+
+def compare_results(old, new, threshold):
+    """
+    Compare two results dicts, as returned by get_results/load_results
+
+    :param threshold: Percentage slowdown that counts as a regression
+    :returns: (report lines, list of regressed benchmark names)
+    """
+    lines = ["Comparing against commit %s" % (old.get("commit") or "?")]
+    regressions = []
+    oldresults = old["results"]
+    for name, newdata in new["results"].items():
+        if name not in oldresults:
+            lines.append("  %s: new" % name)
+            continue
+
+        oldsecs = oldresults[name]["seconds"]
+        newsecs = newdata["seconds"]
+        change = oldsecs and ((newsecs - oldsecs) * 100 / oldsecs) or 0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        lines.append("  %s: %.4fs -> %.4fs (%+.1f%%)%s" %
+                     (name, oldsecs, newsecs, change, flag))
+
+    for name in oldresults:
+        if name not in new["results"]:
+            lines.append("  %s: not run" % name)
+    return lines, regressions
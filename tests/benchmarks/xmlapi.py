@@ -0,0 +1,74 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import unittest
+
+from virtinst import xmlapi
+
+from tests.benchmarks import utils
+
+COUNT = 200
+
+_XML = open("tests/xmlparse-xml/change-disk-in.xml").read()
+
+# Property reads like the ones XMLBuilder does when parsing a domain
+_READ_XPATHS = [
+    "./name",
+    "./memory",
+    "./vcpu/@placement",
+    "./os/type/@arch",
+    "./devices/disk[1]/@type",
+    "./devices/disk[2]/source/@file",
+    "./devices/disk[3]/target/@dev",
+    "./devices/disk[4]/driver/@cache",
+]
+
+
+class TestXMLAPI(unittest.TestCase):
+    """
+    Compare parse, property read, mutate and serialize throughput
+    of the available virtinst.xmlapi backends
+    """
+    def _run_backends(self, desc, cb):
+        for backend in xmlapi.get_backends():
+            origbackend = xmlapi.get_backend()
+            xmlapi.set_backend(backend)
+            try:
+                utils.report("%s %s %d times" % (backend, desc, COUNT),
+                             utils.best_time(cb), COUNT)
+            finally:
+                xmlapi.set_backend(origbackend)
+
+    def test_parse(self):
+        def _run():
+            for dummy in range(COUNT):
+                xmlapi.make_xmlapi(_XML)
+        self._run_backends("parse", _run)
+
+    def test_read(self):
+        def _run():
+            api = xmlapi.make_xmlapi(_XML)
+            for dummy in range(COUNT):
+                for xpath in _READ_XPATHS:
+                    api.get_xpath_content(xpath, False)
+        self._run_backends("read %d props" % len(_READ_XPATHS), _run)
+
+    def test_mutate(self):
+        def _run():
+            api = xmlapi.make_xmlapi(_XML)
+            for idx in range(COUNT):
+                api.set_xpath_content("./description", "desc%d" % idx)
+                api.set_xpath_content(
+                    "./devices/disk[2]/driver/@cache", "none")
+                api.set_xpath_content(
+                    "./devices/disk[2]/driver/@cache", None)
+                api.set_xpath_content("./features/acpi", True)
+                api.set_xpath_content("./features/acpi", False)
+        self._run_backends("mutate", _run)
+
+    def test_serialize(self):
+        def _run():
+            api = xmlapi.make_xmlapi(_XML)
+            for dummy in range(COUNT):
+                api.get_xml(".")
+        self._run_backends("serialize", _run)
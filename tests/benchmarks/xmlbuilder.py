@@ -0,0 +1,55 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import unittest
+
+import virtinst
+
+from tests import utils as testutils
+from tests.benchmarks import utils
+
+COUNT = 100
+DISKS = 200
+
+
+class TestXMLBuilder(unittest.TestCase):
+    """
+    Guest.get_xml for a guest with many devices, the way virt-install
+    and virt-manager call it repeatedly with few changes in between
+    """
+    def setUp(self):
+        self.conn = testutils.URIs.open_testdefault_cached()
+
+    def _build_guest(self):
+        guest = virtinst.Guest(self.conn)
+        guest.name = "bench"
+        guest.memory = 1024
+        for idx in range(DISKS):
+            disk = virtinst.DeviceDisk(self.conn)
+            disk.path = "/dev/default-pool/disk%d.img" % idx
+            disk.target = "vd%d" % idx
+            guest.add_child(disk)
+        return guest
+
+    def test_build_get_xml(self):
+        guest = self._build_guest()
+
+        def _run():
+            for idx in range(COUNT):
+                guest.description = "desc%d" % (idx % 2)
+                guest.get_xml()
+                guest.get_xml()
+        utils.report("build mode get_xml %d disks %d times" % (DISKS, COUNT),
+                     utils.best_time(_run, rounds=3), COUNT)
+
+    def test_parsed_get_xml(self):
+        guest = virtinst.Guest(self.conn,
+                               parsexml=self._build_guest().get_xml())
+
+        def _run():
+            for idx in range(COUNT):
+                guest.description = "desc%d" % (idx % 2)
+                guest.get_xml()
+                guest.get_xml()
+        utils.report("parsed get_xml %d disks %d times" % (DISKS, COUNT),
+                     utils.best_time(_run, rounds=3), COUNT)
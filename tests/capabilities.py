@@ -54,6 +54,36 @@ class TestCapabilities(unittest.TestCase):
         self.assertEqual(len(cells[0].cpus), 8)
         self.assertEqual(cells[0].cpus[3].id, '3')
 
+    def testCapsGuestLookup(self):
+        for filename in sorted(os.listdir("tests/capabilities-xml")):
+            if "domcaps" in filename:
+                continue
+            caps = self._buildCaps(filename)
+            for guest in caps.guests:
+                for domain in guest.domains:
+                    capsinfo = caps.guest_lookup(os_type=guest.os_type,
+                        arch=guest.arch, typ=domain.hypervisor_type)
+                    self.assertEqual(capsinfo.os_type, guest.os_type)
+                    self.assertEqual(capsinfo.arch, guest.arch)
+                    self.assertEqual(capsinfo.hypervisor_type,
+                                     domain.hypervisor_type)
+
+                    # Repeat lookups are memoized
+                    self.assertTrue(capsinfo is caps.guest_lookup(
+                        os_type=guest.os_type, arch=guest.arch,
+                        typ=domain.hypervisor_type))
+
+        # Changing the XML drops the cached lookups
+        caps = self._buildCaps("kvm-x86_64.xml")
+        capsinfo = caps.guest_lookup(arch="x86_64")
+        self.assertEqual(capsinfo.hypervisor_type, "kvm")
+        guest = [g for g in caps.guests if g.arch == "x86_64"][0]
+        guest.domains[1].hypervisor_type = "foo"
+        capsinfo = caps.guest_lookup(arch="x86_64")
+        self.assertEqual(capsinfo.hypervisor_type, "qemu")
+        with self.assertRaises(ValueError):
+            caps.guest_lookup(arch="x86_64", typ="kvm")
+
 
     ####################################
     # Test getCPUModel output handling #
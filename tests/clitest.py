@@ -595,6 +595,7 @@ c.add_valid("--disk pool=default,size=.00001")  # Building 'default' pool
 c.add_valid("--disk /some/new/pool/dir/new,size=.1")  # autocreate the pool
 c.add_valid("--disk %(NEWIMG1)s,sparse=true,size=100000000 --check disk_size=off")  # Don't warn about fully allocated file exceeding disk space
 c.add_valid("--disk %(EXISTIMG1)s,snapshot_policy=no")  # Disable snasphot for disk
+c.add_valid("--disk %(EXISTIMG1)s --check schema=on")  # Validate against libvirt's relaxng schemas, if installed
 c.add_invalid("--file %(NEWIMG1)s --file-size 100000 --nonsparse")  # Nonexisting file, size too big
 c.add_invalid("--file %(NEWIMG1)s --file-size 100000")  # Huge file, sparse, but no prompting
 c.add_invalid("--file %(NEWIMG1)s")  # Nonexisting file, no size
@@ -684,6 +685,10 @@ c.add_valid("--nodisks --pxe", grep="VM performance may suffer")  # os variant w
 c.add_invalid("--hvm --nodisks --pxe foobar")  # Positional arguments error
 c.add_invalid("--nodisks --pxe --name test")  # Colliding name
 c.add_compare("--cdrom %(EXISTIMG1)s --disk size=1 --disk %(EXISTIMG2)s,device=cdrom", "cdrom-double")  # ensure --disk device=cdrom is ordered after --cdrom, this is important for virtio-win installs with a driver ISO
+c.add_valid("--manifest %s/virtinst-manifest.json --dry-run" % XMLDIR, grep="3 guests: 3 succeeded, 0 failed")  # manifest dry run
+c.add_valid("--manifest %s/virtinst-manifest.json --jobs 1" % XMLDIR, grep="Guest 'manifest2': success")  # manifest install
+c.add_invalid("--manifest %s/virtinst-manifest-fail.json" % XMLDIR, grep="Guest 'test': failed")  # one failed guest fails the manifest
+c.add_invalid("--manifest %s/virtinst-manifest-idontexist.json" % XMLDIR)  # missing manifest
 
 
 
@@ -866,6 +871,7 @@ c.add_invalid("test-for-virtxml --edit 5 --tpm /dev/tpm")  # device edit out of
 c.add_invalid("test-for-virtxml --add-device --host-device 0x04b3:0x4485 --update")  # test driver doesn't support attachdevice...
 c.add_invalid("test-for-virtxml --remove-device --host-device 1 --update")  # test driver doesn't support detachdevice...
 c.add_invalid("test-for-virtxml --edit --graphics password=foo --update")  # test driver doesn't support updatdevice...
+c.add_invalid("test-for-virtxml --edit --update --boot menu=on", grep="can't be applied to the running VM")  # non-device change can't be done live
 c.add_invalid("--build-xml --memory 10,maxmemory=20")  # building XML for option that doesn't support it
 c.add_compare("test --print-xml --edit --vcpus 7", "print-xml")  # test --print-xml
 c.add_compare("--edit --cpu host-passthrough", "stdin-edit", input_file=(XMLDIR + "/virtxml-stdin-edit.xml"))  # stdin test
@@ -877,6 +883,13 @@ c.add_compare("test --edit --boot network,cdrom", "edit-bootorder")
 c.add_compare("--confirm test --edit --cpu host-passthrough", "prompt-response")
 c.add_compare("--edit --print-diff --qemu-commandline clearxml=yes", "edit-clearxml-qemu-commandline", input_file=(XMLDIR + "/virtxml-qemu-commandline-clear.xml"))
 c.add_compare("--connect %(URI-KVM)s test-hyperv-uefi --edit --boot uefi", "hyperv-uefi-collision")
+c.add_valid("test test-for-virtxml --edit --vcpus 3 --print-diff", grep="2 domains: 2 succeeded, 0 failed")  # multiple domains
+c.add_valid("test test-for-virtxml --edit --vcpus 3 --print-diff", grep="Domain 'test-for-virtxml':\n--- Original XML")  # parallel output is printed per domain
+c.add_valid("test test-for-virtxml --jobs 1 --edit --boot menu=on --define --print-xml", grep="Domain 'test-for-virtxml': success")  # multiple domains, serial
+c.add_invalid("test idontexist --edit --vcpus 3 --print-diff", grep="Domain 'idontexist': failed: Could not find domain")  # one failed domain fails the batch
+c.add_invalid("test test-for-virtxml --edit --vcpus 3 --confirm")  # --confirm not supported with multiple domains
+c.add_valid("--batch %s/virtxml-batch.json" % XMLDIR, grep="3 domains: 3 succeeded, 0 failed")  # JSON batch file
+c.add_invalid("--batch %s/virtxml-batch-idontexist.json" % XMLDIR)  # missing batch file
 
 
 c = vixml.add_category("simple edit diff", "test-for-virtxml --edit --print-diff --define")
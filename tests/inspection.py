@@ -0,0 +1,139 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+# pylint: disable=protected-access
+from virtManager import inspection
+from virtManager.domain import vmmInspectionData
+
+
+class _FakeDisk(object):
+    def __init__(self, path):
+        self.path = path
+
+
+class _FakeVM(object):
+    """
+    The bits of vmmDomain the inspection disk cache uses
+    """
+    def __init__(self, cachedir, paths):
+        self.cachedir = cachedir
+        self.uuid = "00000000-1111-2222-3333-444444444444"
+        self.active = False
+        self.disks = [_FakeDisk(p) for p in paths]
+
+    def get_cache_dir(self):
+        return self.cachedir
+    def get_uuid(self):
+        return self.uuid
+    def is_active(self):
+        return self.active
+    def get_disk_devices_norefresh(self):
+        return self.disks
+
+
+class TestInspectionCache(unittest.TestCase):
+    """
+    Test the on disk inspection cache in virtManager.inspection
+    """
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="virt-manager-inspection-")
+        self.diskpath = os.path.join(self.tmpdir, "disk.img")
+        self._write_disk(b"\0" * 512)
+        self.vm = _FakeVM(self.tmpdir, [self.diskpath, None])
+        self.cache = inspection._InspectionDiskCache()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write_disk(self, content):
+        with open(self.diskpath, "wb") as f:
+            f.write(content)
+
+    def _make_data(self):
+        data = vmmInspectionData()
+        data.os_type = "linux"
+        data.distro = "fedora"
+        data.major_version = 29
+        data.minor_version = 0
+        data.hostname = "foo.example.com"
+        data.applications = [{"app_name": "bash", "app_version": "4.4"}]
+        data.icon = b"\x89PNG\r\n\x1a\n\xff"
+        return data
+
+    def _store(self):
+        self.cache.save(self.vm, inspection._get_disk_signature(self.vm),
+                        self._make_data())
+
+    def _load(self):
+        return self.cache.load(self.vm,
+                               inspection._get_disk_signature(self.vm))
+
+    def testSignature(self):
+        signature = inspection._get_disk_signature(self.vm)
+        self.assertEqual(len(signature), 1)
+        self.assertEqual(signature[0][0], self.diskpath)
+        self.assertEqual(signature[0][2], 512)
+
+        self.vm.disks.append(_FakeDisk("/nonexistent/disk.img"))
+        signature = inspection._get_disk_signature(self.vm)
+        self.assertEqual(signature[1], ["/nonexistent/disk.img", None, None])
+
+    def testStoreLoad(self):
+        self.assertTrue(self._load() is None)
+        self._store()
+
+        data = self._load()
+        expected = self._make_data()
+        for field in inspection._InspectionDiskCache._FIELDS + ["icon"]:
+            self.assertEqual(getattr(data, field), getattr(expected, field))
+        self.assertTrue(data.errorstr is None)
+
+    def testInvalidate(self):
+        self._store()
+        self.cache.remove(self.vm)
+        self.assertTrue(self._load() is None)
+        # Removing something that isn't there is fine
+        self.cache.remove(self.vm)
+
+        # Different VM reusing the cache dir
+        self._store()
+        self.vm.uuid = "55555555-1111-2222-3333-444444444444"
+        self.assertTrue(self._load() is None)
+
+    def testStaleDisks(self):
+        # Disk contents changing on a shut off VM invalidate the data
+        self._store()
+        self._write_disk(b"\0" * 1024)
+        self.assertTrue(self._load() is None)
+
+        # Same for a different disk list
+        self._store()
+        self.vm.disks.pop(0)
+        self.assertTrue(self._load() is None)
+
+    def testActiveVM(self):
+        # A running VM writes to its disks, that mustn't invalidate
+        # the cache, only changing the disks themselves does
+        self._store()
+        self.vm.active = True
+        self._write_disk(b"\0" * 1024)
+        self.assertTrue(self._load() is not None)
+
+        self.vm.disks[0].path = self.diskpath + ".new"
+        self.assertTrue(self._load() is None)
+
+        # Once shut off, what was written while running counts again
+        self.vm.disks[0].path = self.diskpath
+        self.vm.active = False
+        self.assertTrue(self._load() is None)
+
+    def testCorrupt(self):
+        self._store()
+        with open(self.cache._get_path(self.vm), "w") as f:
+            f.write("{not json")
+        self.assertTrue(self._load() is None)
@@ -3,10 +3,14 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import os
+import shutil
+import tempfile
 import unittest
 
 from virtinst import Guest
 from virtinst import OSDB
+from virtinst import osdict
 from virtinst import urldetect
 
 from tests import utils
@@ -47,3 +51,34 @@ class TestOSDB(unittest.TestCase):
                             "store=%s has conflicting matching_distro=%s " %
                             (store.PRETTY_NAME, distro))
                 seen_distro.append(distro)
+
+    def test_os_index_cache(self):
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, "osinfo-index.json")
+        try:
+            # pylint: disable=protected-access
+            db1 = osdict._OSDB(index_path=path)
+            names = [o.name for o in db1.list_os()]
+            assert names == [o.name for o in OSDB.list_os()]
+            assert os.path.exists(path)
+
+            # Second instance reads the cached index, and shouldn't
+            # touch libosinfo until the Os object is needed
+            db2 = osdict._OSDB(index_path=path)
+            assert [o.name for o in db2.list_os()] == names
+            assert getattr(db2, "_OSDB__os_loader") is None
+
+            f21 = db2.lookup_os("fedora21")
+            orig = OSDB.lookup_os("fedora21")
+            assert f21.full_id == orig.full_id
+            assert f21.label == orig.label
+            assert f21.eol == orig.eol
+            assert f21.supported_netmodels() == orig.supported_netmodels()
+            assert db2.lookup_os_by_full_id(f21.full_id) is f21
+            assert getattr(db2, "_OSDB__os_loader") is None
+
+            # The libosinfo object is loaded on demand
+            assert getattr(f21, "_os").get_id() == f21.full_id
+            assert getattr(db2, "_OSDB__os_loader") is not None
+        finally:
+            shutil.rmtree(tmpdir)
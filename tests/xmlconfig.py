@@ -9,6 +9,7 @@ import unittest
 
 import virtinst
 from virtinst import DeviceDisk
+from virtinst import xmlapi
 
 from tests import utils
 
@@ -215,3 +216,63 @@ class TestXMLMisc(unittest.TestCase):
             self.assertTrue(not bool(fixlist))
         finally:
             os.environ["VIRTINST_TEST_SUITE"] = oldtest
+
+    def test_xml_schema_validate(self):
+        # Tiny stand in for libvirt's domain.rng, so the test doesn't
+        # depend on the host's libvirt version
+        rng = """<grammar xmlns="http://relaxng.org/ns/structure/1.0">
+  <start>
+    <element name="domain">
+      <attribute name="type"/>
+      <element name="name"><text/></element>
+      <zeroOrMore>
+        <element><anyName/><ref name="any"/></element>
+      </zeroOrMore>
+    </element>
+  </start>
+  <define name="any">
+    <zeroOrMore>
+      <choice>
+        <attribute><anyName/></attribute>
+        <text/>
+        <element><anyName/><ref name="any"/></element>
+      </choice>
+    </zeroOrMore>
+  </define>
+</grammar>
+"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            validator = virtinst.XMLValidator(schemadir=tmpdir)
+            if not validator.is_supported():
+                self.skipTest("libxml2 relaxng support not available")
+            with open(os.path.join(tmpdir, "domain.rng"), "w") as f:
+                f.write(rng)
+
+            guest = _make_guest()
+            self.assertEqual(validator.validate(guest), [])
+            self.assertEqual(validator.validate(guest.devices.disk[0]), [])
+            # No schema for <network>, so nothing to check
+            self.assertEqual(validator.validate("<network/>"), [])
+
+            badxml = guest.get_xml().replace("<name>TestGuest</name>", "")
+            ret = validator.validate_bulk([guest, badxml, "<domain"])
+            self.assertEqual(ret[0], [])
+            self.assertTrue(bool(ret[1]))
+            self.assertTrue(bool(ret[2]))
+
+            with self.assertRaises(ValueError) as cm:
+                validator.check([guest, badxml], names=["good", "bad"])
+            self.assertTrue("bad:" in str(cm.exception))
+            self.assertTrue("good:" not in str(cm.exception))
+
+
+class TestXMLMiscETree(TestXMLMisc):
+    """
+    Run all the TestXMLMisc cases with the ElementTree XML backend
+    """
+    def setUp(self):
+        self._origbackend = xmlapi.get_backend()
+        xmlapi.set_backend("etree")
+
+    def tearDown(self):
+        xmlapi.set_backend(self._origbackend)
@@ -8,6 +8,7 @@ import traceback
 import unittest
 
 import virtinst
+from virtinst import xmlapi
 
 from tests import utils
 
@@ -1437,3 +1438,181 @@ class XMLParseTest(unittest.TestCase):
         guest = virtinst.Guest(self.conn, parsexml=open(infile).read())
 
         utils.diff_compare(guest.get_xml(), outfile)
+
+    def testGetXMLCache(self):
+        # get_xml output is cached until something in the document changes
+        infile = "tests/xmlparse-xml/change-disk-in.xml"
+        guest = virtinst.Guest(self.conn, parsexml=open(infile).read())
+        xml1 = guest.get_xml()
+        self.assertTrue(guest.get_xml() is xml1)
+
+        guest.name = "foo-renamed"
+        xml2 = guest.get_xml()
+        self.assertTrue("<name>foo-renamed</name>" in xml2)
+        self.assertTrue(guest.get_xml() is xml2)
+
+        # Changes to a child invalidate the parent's cached XML too
+        disk = guest.devices.disk[0]
+        disk.target = "vdz"
+        self.assertTrue("dev=\"vdz\"" in guest.get_xml())
+        guest.remove_child(disk)
+        self.assertTrue("dev=\"vdz\"" not in guest.get_xml())
+        self.assertTrue("dev=\"vdz\"" in disk.get_xml())
+
+        # A removed child moves to a document with its own generation
+        # counter. Whatever number of changes it takes that counter to
+        # reach the cached generation, get_xml must not return the XML
+        # cached against the old document
+        for count in range(1, 20):
+            guest = virtinst.Guest(self.conn, parsexml=open(infile).read())
+            disk = guest.devices.disk[0]
+            disk.target = "vdq"
+            self.assertTrue("dev=\"vdq\"" in disk.get_xml())
+            guest.remove_child(disk)
+            for idx in range(count):
+                disk.target = "vd%s" % chr(ord("a") + idx)
+            self.assertTrue(("dev=\"vd%s\"" % chr(ord("a") + idx)) in
+                            disk.get_xml())
+
+        # Same for objects built from scratch
+        guest = virtinst.Guest(self.conn)
+        guest.name = "foo"
+        xml1 = guest.get_xml()
+        self.assertTrue(guest.get_xml() is xml1)
+        guest.name = "bar"
+        self.assertTrue("<name>bar</name>" in guest.get_xml())
+        watchdog = virtinst.DeviceWatchdog(self.conn)
+        watchdog.model = "i6300esb"
+        guest.add_child(watchdog)
+        self.assertTrue("<watchdog model=\"i6300esb\"/>" in guest.get_xml())
+
+    def testGetXMLBuildIncremental(self):
+        # Objects built from scratch render later changes into the document
+        # kept from the previous get_xml. The output must match rendering
+        # everything from scratch, whatever the order of changes
+        def _build(render):
+            guest = virtinst.Guest(self.conn)
+            guest.name = "foo"
+            guest.memory = 1024
+            render(guest)
+            for idx in range(3):
+                disk = virtinst.DeviceDisk(self.conn)
+                disk.path = "/dev/default-pool/disk%d.img" % idx
+                disk.target = "vd%s" % chr(ord("a") + idx)
+                guest.add_child(disk)
+            render(guest)
+            guest.title = "title"
+            render(guest)
+            guest.name = "bar"
+            guest.devices.disk[1].target = "vdz"
+            render(guest)
+            guest.memory = None
+            guest.description = "desc"
+            render(guest)
+            guest.remove_child(guest.devices.disk[0])
+            guest.devices.disk[0].path = None
+            render(guest)
+            guest.memory = 2048
+            guest.devices.disk[1].target = "vdy"
+            return guest.get_xml()
+
+        xml = _build(lambda g: g.get_xml())
+        self.assertEqual(xml, _build(lambda g: None))
+        self.assertTrue("<name>bar</name>" in xml)
+        self.assertTrue("vdy" in xml and "disk0.img" not in xml)
+
+    def testDeviceLookups(self):
+        infile = "tests/xmlparse-xml/change-addr-in.xml"
+        guest = virtinst.Guest(self.conn, parsexml=open(infile).read())
+
+        # Child lists are cached read only views
+        disks = guest.devices.disk
+        self.assertTrue(guest.devices.disk is disks)
+        self.assertRaises(RuntimeError, disks.append, disks[0])
+
+        channel = guest.devices.find_by_alias("channel0")
+        self.assertTrue(channel is guest.devices.channel[0])
+        self.assertTrue(guest.devices.find_by_alias("foo2") is disks[0])
+        self.assertTrue(guest.devices.find_by_alias("nosuchalias") is None)
+        self.assertTrue(guest.devices.find_by_target("hda") is disks[0])
+
+        # Lookups notice property changes and removed devices
+        disks[0].target = "vdz"
+        self.assertTrue(guest.devices.find_by_target("hda") is None)
+        self.assertTrue(guest.devices.find_by_target("vdz") is disks[0])
+        guest.remove_device(disks[0])
+        self.assertTrue(guest.devices.find_by_target("vdz") is None)
+        self.assertTrue(disks[0] not in guest.devices.disk)
+        self.assertTrue(disks[0] not in guest.devices.get_all())
+
+    def testXMLDiff(self):
+        infile = "tests/xmlparse-xml/change-disk-in.xml"
+        origxml = open(infile).read()
+        orig = virtinst.Guest(self.conn, parsexml=origxml)
+        guest = virtinst.Guest(self.conn, parsexml=origxml)
+        self.assertTrue(virtinst.XMLDiff(orig, guest).is_noop())
+
+        # Device only changes map to hotplug actions
+        guest.devices.disk[1].driver_cache = "none"
+        guest.remove_device(guest.devices.disk[2])
+        watchdog = virtinst.DeviceWatchdog(self.conn)
+        watchdog.model = "i6300esb"
+        guest.add_device(watchdog)
+        xmldiff = virtinst.XMLDiff(orig, guest)
+        self.assertEqual(
+            [(c.action, c.get_obj().DEVICE_TYPE) for c in xmldiff.changes],
+            [("update", "disk"), ("remove", "disk"), ("add", "watchdog")])
+        self.assertEqual([a for a, dummy in xmldiff.get_hotplug_actions()],
+                         ["update", "hotunplug", "hotplug"])
+        self.assertTrue("<watchdog" in xmldiff.format())
+        self.assertTrue("<name>" not in xmldiff.format())
+
+        # Anything outside of devices needs a define
+        guest.name = "foo-renamed"
+        xmldiff = virtinst.XMLDiff(orig, guest)
+        self.assertTrue(xmldiff.rest_changed())
+        self.assertTrue(xmldiff.get_hotplug_actions() is None)
+        self.assertTrue("<name>foo-renamed</name>" in xmldiff.format())
+
+        # Devices can be looked up from one version in the other
+        origdisks = orig.devices.disk
+        newdisks = guest.devices.disk
+        self.assertTrue(virtinst.XMLDiff.find_match(
+            origdisks[1], origdisks, newdisks) is newdisks[1])
+        self.assertTrue(virtinst.XMLDiff.find_match(
+            origdisks[3], origdisks, newdisks) is newdisks[2])
+        self.assertTrue(virtinst.XMLDiff.find_match(
+            origdisks[2], origdisks, newdisks) is None)
+
+    def testXMLIntern(self):
+        xml = open("tests/storage-xml/pool-dir-vol.xml").read()
+        vol1 = virtinst.StorageVolume(self.conn, parsexml=xml)
+        vol2 = virtinst.StorageVolume(self.conn, parsexml=xml)
+
+        # pylint: disable=protected-access
+        api1 = vol1._xmlstate.xmlapi
+        api2 = vol2._xmlstate.xmlapi
+        self.assertTrue(api1._xmlapi is api2._xmlapi)
+        origxml = vol2.get_xml()
+        self.assertEqual(vol1.get_xml(), origxml)
+        self.assertTrue(api1.is_shared())
+
+        # First change gives vol1 its own copy, vol2 is untouched
+        vol1.name = "renamed"
+        self.assertTrue("<name>renamed</name>" in vol1.get_xml())
+        self.assertFalse(api1.is_shared())
+        self.assertTrue(api2.is_shared())
+        self.assertEqual(vol2.name, "pool-dir-vol")
+        self.assertEqual(vol2.get_xml(), origxml)
+
+
+class XMLParseETreeTest(XMLParseTest):
+    """
+    Run all the XMLParseTest cases with the ElementTree XML backend
+    """
+    def setUp(self):
+        self._origbackend = xmlapi.get_backend()
+        xmlapi.set_backend("etree")
+
+    def tearDown(self):
+        xmlapi.set_backend(self._origbackend)
@@ -372,6 +372,13 @@ class vmmConfig(object):
     def set_libguestfs_inspect_vms(self, val):
         self.conf.set("/enable-libguestfs-vm-inspection", val)
 
+    # This key is not intended to be exposed in the UI yet
+    def get_libguestfs_inspect_workers(self):
+        workers = self.conf.get("/libguestfs-inspect-workers")
+        if workers < 1:
+            return 1
+        return workers
+
 
     # Stats history and interval length
     def get_stats_history_length(self):
@@ -397,6 +404,12 @@ class vmmConfig(object):
     def get_stats_enable_memory_poll(self):
         return self.conf.get("/stats/enable-memory-poll")
 
+    # These keys are not intended to be exposed in the UI yet
+    def get_stats_export_target(self):
+        return self.conf.get("/stats/export-target")
+    def get_stats_export_format(self):
+        return self.conf.get("/stats/export-format")
+
     def set_stats_enable_cpu_poll(self, val):
         self.conf.set("/stats/enable-cpu-poll", val)
     def set_stats_enable_disk_poll(self, val):
@@ -603,6 +616,13 @@ class vmmConfig(object):
 
         self.conf.set("/connections/autoconnect", uris)
 
+    # This key is not intended to be exposed in the UI yet
+    def get_conn_job_pool_size(self):
+        size = self.conf.get("/connections/job-pool-size")
+        if size < 0:
+            return 0
+        return size
+
 
     # Default directory location dealings
     def _get_default_dir_key(self, _type):
@@ -4,6 +4,7 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import concurrent.futures
 import logging
 import os
 import threading
@@ -18,11 +19,16 @@ from virtinst import util
 
 from . import connectauth
 from .baseclass import vmmGObject
+from .connpool import vmmConnectionPool
 from .domain import vmmDomain
+from .eventbatcher import vmmEventBatcher
 from .interface import vmmInterface
+from .ipdiscovery import vmmIPDiscovery
+from .jobmonitor import vmmJobMonitor
 from .libvirtenummap import LibvirtEnumMap
 from .network import vmmNetwork
 from .nodedev import vmmNodeDevice
+from .statsexport import vmmStatsExporter
 from .statsmanager import vmmStatsManager
 from .storagepool import vmmStoragePool
 
@@ -145,6 +151,109 @@ class _ObjectList(vmmGObject):
             return self._objects[:]
 
 
+class _NodeDevIndex(object):
+    """
+    Lookup tables for nodedev queries, so the add hardware and details
+    pages don't need to walk the XML of every nodedev on the host. Keyed
+    by device_type, (device_type, capability_type), and
+    (device_type, vendor_id, product_id). Each table maps to an insertion
+    ordered {connkey: vmmNodeDevice} dict, so results come back in the
+    same order as the connection object list.
+
+    _entries maps connkey to (dev, capability_type, table keys)
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._by_type = {}
+        self._by_cap = {}
+        self._by_ids = {}
+
+        # Devices whose XML fetch failed, retried on the next query
+        self._unindexed = {}
+
+    def _get_keys(self, xmlobj):
+        devtype = xmlobj.device_type
+        return ((self._by_type, devtype),
+                (self._by_cap,
+                 (devtype, getattr(xmlobj, "capability_type", None))),
+                (self._by_ids,
+                 (devtype, getattr(xmlobj, "vendor_id", None),
+                  getattr(xmlobj, "product_id", None))))
+
+    def _remove_locked(self, connkey):
+        self._unindexed.pop(connkey, None)
+        entry = self._entries.pop(connkey, None)
+        for table, key in entry and entry[2] or []:
+            devs = table.get(key)
+            if devs is None:
+                continue
+            devs.pop(connkey, None)
+            if not devs:
+                table.pop(key)
+
+    def add(self, dev):
+        """
+        Index @dev from its cached XML, replacing any previous entry
+        """
+        connkey = dev.get_connkey()
+        try:
+            xmlobj = dev.get_xmlobj()
+        except libvirt.libvirtError as e:
+            # Libvirt nodedev XML fetching can be busted
+            # https://bugzilla.redhat.com/show_bug.cgi?id=1225771
+            if e.get_error_code() != libvirt.VIR_ERR_NO_NODE_DEVICE:
+                logging.debug("Error fetching nodedev XML", exc_info=True)
+            with self._lock:
+                self._remove_locked(connkey)
+                self._unindexed[connkey] = dev
+            return
+
+        keys = self._get_keys(xmlobj)
+        with self._lock:
+            self._remove_locked(connkey)
+            self._entries[connkey] = (dev, keys[1][1][1], keys)
+            for table, key in keys:
+                table.setdefault(key, {})[connkey] = dev
+
+    def remove(self, dev):
+        with self._lock:
+            self._remove_locked(dev.get_connkey())
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._by_type = {}
+            self._by_cap = {}
+            self._by_ids = {}
+            self._unindexed = {}
+
+    def _retry_unindexed(self):
+        with self._lock:
+            if not self._unindexed:
+                return
+            devs = list(self._unindexed.values())
+        for dev in devs:
+            self.add(dev)
+
+    def lookup(self, devtype=None, devcap=None):
+        self._retry_unindexed()
+        with self._lock:
+            if devtype and devcap:
+                devs = self._by_cap.get((devtype, devcap), {})
+            elif devtype:
+                devs = self._by_type.get(devtype, {})
+            else:
+                return [dev for dev, cap, ignore in self._entries.values()
+                        if not devcap or cap == devcap]
+            return list(devs.values())
+
+    def count(self, devtype, vendor, product):
+        self._retry_unindexed()
+        with self._lock:
+            return len(self._by_ids.get((devtype, vendor, product), {}))
+
+
 class vmmConnection(vmmGObject):
     __gsignals__ = {
         "vm-added": (vmmGObject.RUN_FIRST, None, [str]),
@@ -161,12 +270,22 @@ class vmmConnection(vmmGObject):
         "resources-sampled": (vmmGObject.RUN_FIRST, None, []),
         "state-changed": (vmmGObject.RUN_FIRST, None, []),
         "open-completed": (vmmGObject.RUN_FIRST, None, [object]),
+        # List of objects refreshed from one batch of events. Each
+        # object also signals its own state-changed, but UI that tracks
+        # every object, like the manager, should skip those while
+        # in_state_batch() and update once from this signal.
+        "batch-state-changed": (vmmGObject.RUN_FIRST, None, [object]),
     }
 
     (_STATE_DISCONNECTED,
      _STATE_CONNECTING,
      _STATE_ACTIVE) = range(1, 4)
 
+    # Without domain events, VMs whose state changed between ticks have
+    # their XML refetched using up to this many threads. 1 disables it,
+    # and the refetch then happens sequentially in each VM's tick()
+    _BULK_REFRESH_THREADS = 4
+
     def __init__(self, uri):
         self._uri = uri
         if self._uri is None or self._uri.lower() == "xen":
@@ -199,9 +318,17 @@ class vmmConnection(vmmGObject):
         self._node_device_cb_ids = []
 
         self._xml_flags = {}
+        self._bulk_state_supported = True
 
         self._objects = _ObjectList()
+        self._nodedev_index = _NodeDevIndex()
+        self._event_batcher = vmmEventBatcher(self)
+        self._event_batcher.connect("batch-processed",
+                                    self._event_batch_processed_cb)
+        self._in_state_batch = False
         self.statsmanager = vmmStatsManager()
+        self.ipdiscovery = vmmIPDiscovery()
+        self.job_pool = vmmConnectionPool(self)
 
         self._stats = []
         self._hostinfo = None
@@ -618,37 +745,15 @@ class vmmConnection(vmmGObject):
     ############################
 
     def filter_nodedevs(self, devtype=None, devcap=None):
-        retdevs = []
-        for dev in self.list_nodedevs():
-            try:
-                xmlobj = dev.get_xmlobj()
-            except libvirt.libvirtError as e:
-                # Libvirt nodedev XML fetching can be busted
-                # https://bugzilla.redhat.com/show_bug.cgi?id=1225771
-                if e.get_error_code() != libvirt.VIR_ERR_NO_NODE_DEVICE:
-                    logging.debug("Error fetching nodedev XML", exc_info=True)
-                continue
-
-            if devtype and xmlobj.device_type != devtype:
-                continue
-
-            if devcap:
-                if (not hasattr(xmlobj, "capability_type") or
-                    xmlobj.capability_type != devcap):
-                    continue
-
-            retdevs.append(dev)
-
-        return retdevs
+        """
+        Return all nodedevs matching @devtype and @devcap. Answered from
+        the nodedev index, which is kept up to date by polling and
+        nodedev events, so this doesn't touch any XML.
+        """
+        return self._nodedev_index.lookup(devtype, devcap)
 
     def get_nodedev_count(self, devtype, vendor, product):
-        count = 0
-        devs = self.filter_nodedevs(devtype)
-
-        for dev in devs:
-            if (vendor == dev.xmlobj.vendor_id and
-                product == dev.xmlobj.product_id):
-                count += 1
+        count = self._nodedev_index.count(devtype, vendor, product)
 
         logging.debug("There are %d node devices with "
                       "vendorId: %s, productId: %s",
@@ -656,6 +761,12 @@ class vmmConnection(vmmGObject):
 
         return count
 
+    def _nodedev_changed(self, dev):
+        # XML may have been updated by a nodedev update event
+        if self._objects.lookup_object(vmmNodeDevice,
+                                       dev.get_connkey()) is dev:
+            self._nodedev_index.add(dev)
+
 
     ###################################
     # Libvirt object creation methods #
@@ -734,7 +845,7 @@ class vmmConnection(vmmGObject):
         if not obj:
             return
 
-        self.idle_add(obj.recache_from_event_loop)
+        self._event_batcher.queue_refresh(obj)
 
     def _domain_lifecycle_event(self, conn, domain, state, reason, userdata):
         ignore = conn
@@ -747,9 +858,9 @@ class vmmConnection(vmmGObject):
         obj = self.get_vm(name)
 
         if obj:
-            self.idle_add(obj.recache_from_event_loop)
+            self._event_batcher.queue_refresh(obj)
         else:
-            self.schedule_priority_tick(pollvm=True, force=True)
+            self._event_batcher.queue_poll(pollvm=True)
 
     def _domain_agent_lifecycle_event(self, conn, domain, state, reason, userdata):
         ignore = conn
@@ -762,9 +873,51 @@ class vmmConnection(vmmGObject):
         obj = self.get_vm(name)
 
         if obj:
-            self.idle_add(obj.recache_from_event_loop)
+            self._event_batcher.queue_refresh(obj)
         else:
-            self.schedule_priority_tick(pollvm=True, force=True)
+            self._event_batcher.queue_poll(pollvm=True)
+
+    def _event_batch_processed_cb(self, src, objs):
+        ignore = src
+        # We are in a single main loop callback already, so signal
+        # directly instead of queueing an idle callback per object
+        self._in_state_batch = True
+        try:
+            for obj in objs:
+                obj.emit("state-changed")
+        finally:
+            self._in_state_batch = False
+        self.emit("batch-state-changed", objs)
+
+    def in_state_batch(self):
+        """
+        True while objects signal state-changed on behalf of
+        a batch-state-changed emission
+        """
+        return self._in_state_batch
+
+    def _domain_job_completed_event(self, conn, domain, params, userdata):
+        ignore = conn
+        ignore = userdata
+
+        name = domain.name()
+        logging.debug("domain job completed event: domain=%s", name)
+        obj = self.get_vm(name)
+        if not obj:
+            return
+
+        vmmJobMonitor.get_instance().job_completed_event(obj, params)
+
+    def _domain_migration_iteration_event(self, conn, domain,
+                                          iteration, userdata):
+        ignore = conn
+        ignore = userdata
+
+        obj = self.get_vm(domain.name())
+        if not obj:
+            return
+
+        vmmJobMonitor.get_instance().migration_iteration_event(obj, iteration)
 
     def _network_lifecycle_event(self, conn, network, state, reason, userdata):
         ignore = conn
@@ -776,9 +929,9 @@ class vmmConnection(vmmGObject):
         obj = self.get_net(name)
 
         if obj:
-            self.idle_add(obj.recache_from_event_loop)
+            self._event_batcher.queue_refresh(obj)
         else:
-            self.schedule_priority_tick(pollnet=True, force=True)
+            self._event_batcher.queue_poll(pollnet=True)
 
     def _storage_pool_lifecycle_event(self, conn, pool,
                                       state, reason, userdata):
@@ -792,9 +945,9 @@ class vmmConnection(vmmGObject):
         obj = self.get_pool(name)
 
         if obj:
-            self.idle_add(obj.recache_from_event_loop)
+            self._event_batcher.queue_refresh(obj)
         else:
-            self.schedule_priority_tick(pollpool=True, force=True)
+            self._event_batcher.queue_poll(pollpool=True)
 
     def _storage_pool_refresh_event(self, conn, pool, userdata):
         ignore = conn
@@ -808,7 +961,8 @@ class vmmConnection(vmmGObject):
         if not obj:
             return
 
-        self.idle_add(obj.refresh_pool_cache_from_event_loop)
+        self._event_batcher.queue_refresh(obj,
+                "refresh_pool_cache_from_event_loop")
 
     def _node_device_lifecycle_event(self, conn, dev,
                                      state, reason, userdata):
@@ -819,7 +973,7 @@ class vmmConnection(vmmGObject):
         logging.debug("node device lifecycle event: nodedev=%s %s",
             name, LibvirtEnumMap.nodedev_lifecycle_str(state, reason))
 
-        self.schedule_priority_tick(pollnodedev=True, force=True)
+        self._event_batcher.queue_poll(pollnodedev=True)
 
     def _node_device_update_event(self, conn, dev, userdata):
         ignore = conn
@@ -831,7 +985,7 @@ class vmmConnection(vmmGObject):
         obj = self.get_nodedev(name)
 
         if obj:
-            self.idle_add(obj.recache_from_event_loop)
+            self._event_batcher.queue_refresh(obj)
 
     def _add_conn_events(self):
         if not self.check_support(
@@ -872,6 +1026,10 @@ class vmmConnection(vmmGObject):
         _add_domain_xml_event("VIR_DOMAIN_EVENT_ID_DEVICE_ADDED", 19)
         _add_domain_xml_event("VIR_DOMAIN_EVENT_ID_AGENT_LIFECYCLE", 18,
                               self._domain_agent_lifecycle_event)
+        _add_domain_xml_event("VIR_DOMAIN_EVENT_ID_MIGRATION_ITERATION", 20,
+                              self._domain_migration_iteration_event)
+        _add_domain_xml_event("VIR_DOMAIN_EVENT_ID_JOB_COMPLETED", 21,
+                              self._domain_job_completed_event)
 
         try:
             if FORCE_DISABLE_EVENTS:
@@ -964,6 +1122,9 @@ class vmmConnection(vmmGObject):
         if self._init_object_event:
             self._init_object_event.clear()
 
+        self._nodedev_index.clear()
+        self._event_batcher.clear()
+        self.job_pool.close()
         for obj in self._objects.all_objects():
             self._objects.remove(obj)
             try:
@@ -985,6 +1146,10 @@ class vmmConnection(vmmGObject):
     def _cleanup(self):
         self.close()
 
+        self._event_batcher.cleanup()
+        self._event_batcher = None
+        self.job_pool.cleanup()
+        self.job_pool = None
         self._objects = None
         self._backend.cb_fetch_all_domains = None
         self._backend.cb_fetch_all_pools = None
@@ -1140,6 +1305,8 @@ class vmmConnection(vmmGObject):
                 continue
 
             logging.debug("%s=%s removed", class_name, name)
+            if obj.is_nodedev():
+                self._nodedev_index.remove(obj)
             self._remove_object_signal(obj)
             obj.cleanup()
 
@@ -1179,6 +1346,8 @@ class vmmConnection(vmmGObject):
             elif obj.is_interface():
                 self.emit("interface-added", obj.get_connkey())
             elif obj.is_nodedev():
+                self._nodedev_index.add(obj)
+                obj.connect("state-changed", self._nodedev_changed)
                 self.emit("nodedev-added", obj.get_connkey())
         finally:
             if self._init_object_event:
@@ -1316,6 +1485,16 @@ class vmmConnection(vmmGObject):
             initial_poll, pollvm, pollnet, pollpool, polliface, pollnodedev)
         self.idle_add(self._gone_object_signals, gone_objects)
 
+        # Without domain events, fetch state for all VMs in one call and
+        # only refresh XML for the ones that changed
+        bulkstate = {}
+        if not self.using_domain_events and (pollvm or stats_update):
+            bulkstate = self._fetch_bulk_domain_state() or {}
+            self._refresh_bulk_changed_vms(
+                [o for o in preexisting_objects if
+                 o.is_domain() and o.get_connkey() in bulkstate],
+                bulkstate)
+
         # Only tick() pre-existing objects, since new objects will be
         # initialized asynchronously and tick() would be redundant
         for obj in preexisting_objects:
@@ -1333,7 +1512,11 @@ class vmmConnection(vmmGObject):
                 elif obj.is_nodedev() and not pollnodedev:
                     continue
 
-                obj.tick(stats_update=stats_update)
+                if obj.is_domain() and obj.get_connkey() in bulkstate:
+                    obj.tick(stats_update=stats_update,
+                             bulkstate=bulkstate[obj.get_connkey()])
+                else:
+                    obj.tick(stats_update=stats_update)
             except Exception as e:
                 logging.exception("Tick for %s failed", obj)
                 if (isinstance(e, libvirt.libvirtError) and
@@ -1350,6 +1533,61 @@ class vmmConnection(vmmGObject):
                 [o for o in preexisting_objects if o.reports_stats()])
             self.idle_emit("resources-sampled")
 
+            # Keep guest IP addresses fresh in the background, so the UI
+            # can read them from the cache
+            if any(vm.is_active() for vm in self.list_vms()):
+                self.ipdiscovery.refresh_async(self)
+
+    def _fetch_bulk_domain_state(self):
+        """
+        Return {connkey: (state, id)} for every VM using a single
+        getAllDomainStats call, or None if the connection doesn't
+        support it and we need to fall back to per VM info() calls
+        """
+        if not self._bulk_state_supported:
+            return None
+
+        ret = {}
+        try:
+            rawstats = self._backend.getAllDomainStats(
+                libvirt.VIR_DOMAIN_STATS_STATE, 0)
+        except libvirt.libvirtError as err:
+            if util.is_error_nosupport(err):
+                logging.debug("conn does not support getAllDomainStats(), "
+                              "using per VM state polling")
+                self._bulk_state_supported = False
+            else:
+                logging.debug("Error calling getAllDomainStats(): %s", err)
+            return None
+
+        for dom, stats in rawstats:
+            if "state.state" not in stats:
+                continue
+            ret[dom.name()] = (stats["state.state"], dom.ID())
+        return ret
+
+    def _refresh_bulk_changed_vms(self, vms, bulkstate):
+        """
+        Refetch XML for all VMs whose state or ID changed, in parallel.
+        Their tick() call will then find nothing left to refresh.
+        """
+        def _refresh(vm):
+            try:
+                if vm.refresh_bulk_state(*bulkstate[vm.get_connkey()]):
+                    vm.idle_emit("state-changed")
+            except Exception:
+                logging.debug("Error refreshing %s bulk state", vm,
+                              exc_info=True)
+
+        changed = [vm for vm in vms if
+                   vm.bulk_state_changed(*bulkstate[vm.get_connkey()])]
+        nthreads = min(len(changed), self._BULK_REFRESH_THREADS)
+        if nthreads <= 1:
+            return
+
+        with concurrent.futures.ThreadPoolExecutor(nthreads) as executor:
+            list(executor.map(_refresh, changed))
+
     def _recalculate_stats(self, vms):
         if not self._backend.is_open():
             return
@@ -1412,6 +1650,7 @@ class vmmConnection(vmmGObject):
         }
 
         self._stats.insert(0, newStats)
+        vmmStatsExporter.get_instance().add_host_sample(self, newStats)
 
 
     def schedule_priority_tick(self, **kwargs):
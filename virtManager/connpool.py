@@ -0,0 +1,162 @@
+# Copyright (C) 2018 Red Hat, Inc.
+#
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import contextlib
+import logging
+import threading
+
+import virtinst
+
+from . import connectauth
+from .baseclass import vmmGObject
+
+
+class vmmConnectionPool(vmmGObject):
+    """
+    Extra libvirt connections to the URI of a vmmConnection, for long
+    running jobs like migrate, volume creation and VM deletion. A slow
+    API call on a pooled connection doesn't hold up tick polling and
+    event handling, which stay on the vmmConnection's own backend.
+
+    Connections are opened on demand, up to the configured pool size,
+    and kept open for reuse until the vmmConnection is closed. If the
+    pool is disabled, exhausted, or opening a connection fails, jobs
+    fall back to the main backend.
+    """
+    def __init__(self, conn):
+        vmmGObject.__init__(self)
+
+        self._conn = conn
+        self._lock = threading.Lock()
+        self._idle = []
+        self._busy = 0
+
+        # Number of jobs that had to use the main backend
+        self.fallbacks = 0
+
+    def _cleanup(self):
+        self.close()
+        self._conn = None
+
+
+    ###################
+    # Private helpers #
+    ###################
+
+    def _open_backend(self):
+        backend = virtinst.VirtinstConnection(self._conn.get_uri())
+        backend.open(connectauth.creds_dialog, self._conn)
+        return backend
+
+    def _close_backend(self, backend):
+        try:
+            backend.close()
+        except Exception:
+            logging.debug("Error closing pooled connection", exc_info=True)
+
+    def _pop_idle(self):
+        """
+        Return an idle connection that's still alive, or None
+        """
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                backend = self._idle.pop(0)
+                self._busy += 1
+
+            try:
+                if backend.isAlive():
+                    return backend
+            except Exception:
+                pass
+            logging.debug("Dropping dead pooled connection to %s",
+                          self._conn.get_uri())
+            with self._lock:
+                self._busy -= 1
+            self._close_backend(backend)
+
+    def _acquire(self):
+        backend = self._pop_idle()
+        if backend:
+            return backend
+
+        size = self.get_size()
+        with self._lock:
+            if self._busy + len(self._idle) >= size:
+                self.fallbacks += 1
+                return None
+            # Reserve the slot before dropping the lock
+            self._busy += 1
+
+        try:
+            backend = self._open_backend()
+            logging.debug("Opened pooled connection to %s, busy=%d",
+                          self._conn.get_uri(), self._busy)
+            return backend
+        except Exception:
+            logging.debug("Error opening pooled connection to %s, "
+                          "using the main connection",
+                          self._conn.get_uri(), exc_info=True)
+            with self._lock:
+                self._busy -= 1
+                self.fallbacks += 1
+            return None
+
+    def _release(self, backend):
+        keep = self._conn and self._conn.is_active()
+        with self._lock:
+            self._busy -= 1
+            if keep:
+                self._idle.append(backend)
+        if not keep:
+            self._close_backend(backend)
+
+
+    ###############
+    # Public APIs #
+    ###############
+
+    def get_size(self):
+        """
+        Maximum number of pooled connections. The test driver keeps
+        state per connection, so pooling is disabled there.
+        """
+        if self._conn.get_backend().is_really_test():
+            return 0
+        return self.config.get_conn_job_pool_size()
+
+    def get_stats(self):
+        """
+        Return (open connections, connections in use, pool size)
+        """
+        with self._lock:
+            busy = self._busy
+            idle = len(self._idle)
+        return busy + idle, busy, self.get_size()
+
+    @contextlib.contextmanager
+    def job_backend(self):
+        """
+        Context manager yielding a VirtinstConnection for a long running
+        job. The connection is returned to the pool afterwards.
+        """
+        backend = self._acquire()
+        try:
+            yield backend or self._conn.get_backend()
+        finally:
+            if backend:
+                self._release(backend)
+
+    def close(self):
+        """
+        Close all idle connections. Connections in use by a job are
+        closed when the job releases them.
+        """
+        with self._lock:
+            idle = self._idle
+            self._idle = []
+        for backend in idle:
+            self._close_backend(backend)
@@ -264,16 +264,18 @@ class vmmCreateVolume(vmmGObjectUI):
         progWin.run()
 
     def _async_vol_create(self, asyncjob):
-        conn = self.conn.get_backend()
-
-        # Lookup different pool obj
-        newpool = conn.storagePoolLookupByName(self.parent_pool.get_name())
-        self.vol.pool = newpool
-
-        meter = asyncjob.get_meter()
-        logging.debug("Starting backround vol creation.")
-        self.vol.install(meter=meter)
-        logging.debug("vol creation complete.")
+        # Use a pooled connection, so a slow volume build doesn't
+        # block polling on the main connection
+        with self.conn.job_pool.job_backend() as conn:
+            # Lookup different pool obj
+            newpool = conn.storagePoolLookupByName(
+                self.parent_pool.get_name())
+            self.vol.pool = newpool
+
+            meter = asyncjob.get_meter()
+            logging.debug("Starting backround vol creation.")
+            self.vol.install(meter=meter)
+            logging.debug("vol creation complete.")
 
     def validate(self):
         name = self.widget("vol-name").get_text()
@@ -173,18 +173,18 @@ class vmmDeleteDialog(vmmGObjectUI):
                 logging.debug("Forcing VM '%s' power off.", vm.get_name())
                 vm.destroy()
 
-            conn = vm.conn.get_backend()
             meter = asyncjob.get_meter()
 
-            for path in paths:
-                try:
-                    logging.debug("Deleting path: %s", path)
-                    meter.start(text=_("Deleting path '%s'") % path)
-                    self._async_delete_path(conn, path, meter)
-                except Exception as e:
-                    storage_errors.append((str(e),
-                                          "".join(traceback.format_exc())))
-                meter.end(0)
+            with vm.conn.job_pool.job_backend() as conn:
+                for path in paths:
+                    try:
+                        logging.debug("Deleting path: %s", path)
+                        meter.start(text=_("Deleting path '%s'") % path)
+                        self._async_delete_path(conn, path, meter)
+                    except Exception as e:
+                        storage_errors.append((str(e),
+                            "".join(traceback.format_exc())))
+                    meter.end(0)
 
             if undefine:
                 logging.debug("Removing VM '%s'", vm.get_name())
@@ -626,6 +626,8 @@ class vmmDetails(vmmGObjectUI):
         self.vm.connect("resources-sampled", self.refresh_resources)
         self.vm.connect("inspection-changed",
                 lambda *x: self.refresh_os_page())
+        self.conn.ipdiscovery.connect("refreshed",
+                                      self._ip_discovery_refreshed_cb)
 
         self.populate_hw_list()
 
@@ -663,6 +665,7 @@ class vmmDetails(vmmGObjectUI):
             self.vm.set_details_window_size(*self._window_size)
 
         self.conn.disconnect_by_obj(self)
+        self.conn.ipdiscovery.disconnect_by_obj(self)
         self.vm = None
         self.addhwmenu = None
         self._addhwmenuitems = None
@@ -684,6 +687,11 @@ class vmmDetails(vmmGObjectUI):
         vmmEngine.get_instance().increment_window_counter()
         self.refresh_vm_state()
 
+        from .inspection import vmmInspection
+        inspection = vmmInspection.get_instance()
+        if inspection:
+            inspection.vm_prioritize(self.vm)
+
     def customize_finish(self, src):
         ignore = src
         if self.has_unapplied_changes(self.get_hw_row()):
@@ -1859,7 +1867,12 @@ class vmmDetails(vmmGObjectUI):
     def refresh_ip(self, src_ignore):
         net = self.get_hw_row()[HW_LIST_COL_DEVICE]
         self.vm.refresh_interface_addresses(net)
-        self._set_network_ip_details(net)
+
+    def _ip_discovery_refreshed_cb(self, src_ignore):
+        row = self.get_hw_row()
+        if not row or row[HW_LIST_COL_TYPE] != HW_LIST_TYPE_NIC:
+            return
+        self._set_network_ip_details(row[HW_LIST_COL_DEVICE])
 
 
     ##################################################
@@ -3149,7 +3162,7 @@ class vmmDetails(vmmGObjectUI):
         consoles = self.vm.xmlobj.devices.console
         serials = self.vm.xmlobj.devices.serial
         if serials and consoles and self.vm.serial_is_console_dup(serials[0]):
-            consoles.pop(0)
+            consoles = consoles[1:]
 
         for dev in _calculate_disk_bus_index(self.vm.xmlobj.devices.disk):
             update_hwlist(HW_LIST_TYPE_DISK, dev)
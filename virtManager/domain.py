@@ -6,8 +6,6 @@
 
 import logging
 import os
-import time
-import threading
 
 import libvirt
 
@@ -17,7 +15,9 @@ from virtinst import Guest
 from virtinst import util
 from virtinst import DeviceController
 from virtinst import DeviceDisk
+from virtinst import XMLDiff
 
+from .jobmonitor import vmmJobMonitor
 from .libvirtobject import vmmLibvirtObject
 from .libvirtenummap import LibvirtEnumMap
 
@@ -26,98 +26,25 @@ class _SENTINEL(object):
     pass
 
 
-def compare_device(origdev, newdev, idx):
-    devprops = {
-        "disk":          ["target", "bus"],
-        "interface":     ["macaddr", "xmlindex"],
-        "input":         ["bus", "type", "xmlindex"],
-        "sound":         ["model", "xmlindex"],
-        "video":         ["model", "xmlindex"],
-        "watchdog":      ["xmlindex"],
-        "hostdev":       ["type", "managed", "xmlindex",
-                            "product", "vendor",
-                            "function", "domain", "slot"],
-        "serial":        ["type", "target_port"],
-        "parallel":      ["type", "target_port"],
-        "console":       ["type", "target_type", "target_port"],
-        "graphics":      ["type", "xmlindex"],
-        "controller":    ["type", "index"],
-        "channel":       ["type", "target_name"],
-        "filesystem":    ["target", "xmlindex"],
-        "smartcard":     ["mode", "xmlindex"],
-        "redirdev":      ["bus", "type", "xmlindex"],
-        "tpm":           ["type", "xmlindex"],
-        "rng":           ["type", "xmlindex"],
-        "panic":         ["type", "xmlindex"],
-    }
-
-    if id(origdev) == id(newdev):
-        return True
-
-    if not isinstance(origdev, type(newdev)):
-        return False
-
-    for devprop in devprops[origdev.DEVICE_TYPE]:
-        if devprop == "xmlindex":
-            origval = origdev.get_xml_idx()
-            newval = idx
+def _find_device(guest, origdev, origguest):
+    """
+    Return the device in @guest that matches @origdev, a device of
+    @origguest, which is another version of the same VM XML. Devices
+    are matched the same way XMLDiff does.
+    """
+    devtype = origdev.DEVICE_TYPE
+    origlist = list(getattr(origguest.devices, devtype))
+    if not any(dev is origdev for dev in origlist):
+        # origdev is from an older copy of the XML, so it stands in
+        # for whatever is in its position now
+        idx = origdev.get_xml_idx()
+        if idx < len(origlist):
+            origlist[idx] = origdev
         else:
-            origval = getattr(origdev, devprop)
-            newval = getattr(newdev, devprop)
-
-        if origval != newval:
-            return False
-
-    return True
-
-
-def _find_device(guest, origdev):
-    devlist = getattr(guest.devices, origdev.DEVICE_TYPE)
-    for idx, dev in enumerate(devlist):
-        if compare_device(origdev, dev, idx):
-            return dev
-
-    return None
-
-
-def start_job_progress_thread(vm, meter, progtext):
-    current_thread = threading.currentThread()
-
-    def jobinfo_cb():
-        while True:
-            time.sleep(.5)
-
-            if not current_thread.isAlive():
-                return False
-
-            try:
-                jobinfo = vm.job_info()
-                data_total      = float(jobinfo[3])
-                # data_processed  = float(jobinfo[4])
-                data_remaining  = float(jobinfo[5])
-
-                # data_total is 0 if the job hasn't started yet
-                if not data_total:
-                    continue
-
-                if not meter.started:
-                    meter.start(size=data_total,
-                                text=progtext)
-
-                progress = data_total - data_remaining
-                meter.update(progress)
-            except Exception:
-                logging.exception("Error calling jobinfo")
-                return False
-
-        return True
+            origlist.append(origdev)
 
-    if vm.getjobinfo_supported:
-        t = threading.Thread(target=jobinfo_cb,
-                             name="job progress reporting",
-                             args=())
-        t.daemon = True
-        t.start()
+    return XMLDiff.find_match(origdev, origlist,
+                              getattr(guest.devices, devtype))
 
 
 class vmmInspectionData(object):
@@ -219,7 +146,9 @@ class vmmDomain(vmmLibvirtObject):
         self._autostart = None
         self._domain_caps = None
         self._status_reason = None
-        self._ip_cache = None
+
+        # Domain ID seen by the last refresh_bulk_state call
+        self._bulk_id = None
 
         self.managedsave_supported = False
         self._domain_state_supported = False
@@ -349,6 +278,11 @@ class vmmDomain(vmmLibvirtObject):
             self.conn.SUPPORT_DOMAIN_JOB_INFO, self._backend)
     getjobinfo_supported = property(_get_getjobinfo_supported)
 
+    def _get_getjobstats_supported(self):
+        return self.conn.check_support(
+            self.conn.SUPPORT_DOMAIN_JOB_STATS, self._backend)
+    getjobstats_supported = property(_get_getjobstats_supported)
+
     def snapshots_supported(self):
         if not self.conn.check_support(
                 self.conn.SUPPORT_DOMAIN_LIST_SNAPSHOTS, self._backend):
@@ -394,16 +328,20 @@ class vmmDomain(vmmLibvirtObject):
         if for_hotplug:
             return origdev
 
-        dev = _find_device(xmlobj, origdev)
+        dev = _find_device(xmlobj, origdev, self.get_xmlobj())
         if dev:
             return dev
 
         # If we are removing multiple dev from an active VM, a double
         # attempt may result in a lookup failure. If device is present
         # in the active XML, assume all is good.
-        if _find_device(self.get_xmlobj(), origdev):
-            logging.debug("Device in active config but not inactive config.")
-            return
+        origxml = origdev.get_xml()
+        for livedev in getattr(self.get_xmlobj().devices,
+                               origdev.DEVICE_TYPE):
+            if livedev is origdev or livedev.get_xml() == origxml:
+                logging.debug("Device in active config but not "
+                              "inactive config.")
+                return
 
         raise RuntimeError(_("Could not find specified device in the "
                              "inactive VM configuration: %s") % repr(origdev))
@@ -487,7 +425,7 @@ class vmmDomain(vmmLibvirtObject):
             return
 
         if con:
-            rmcon = _find_device(xmlobj, con)
+            rmcon = _find_device(xmlobj, con, self.xmlobj)
             if rmcon:
                 xmlobj.remove_device(rmcon)
         xmlobj.remove_device(editdev)
@@ -1071,6 +1009,8 @@ class vmmDomain(vmmLibvirtObject):
 
     def job_info(self):
         return self._backend.jobInfo()
+    def job_stats(self):
+        return self._backend.jobStats(0)
     def abort_job(self):
         self._backend.abortJob()
 
@@ -1113,32 +1053,15 @@ class vmmDomain(vmmLibvirtObject):
             logging.debug("Creating snapshot flags=%s xml=\n%s", flags, xml)
         self._backend.snapshotCreateXML(xml, flags)
 
-    def refresh_interface_addresses(self, iface):
-        def agent_ready():
-            for dev in self.xmlobj.devices.channel:
-                if (dev.type == "unix" and
-                    dev.target_name == dev.CHANNEL_NAME_QEMUGA and
-                    dev.target_state == "connected"):
-                    return True
-            return False
-
-        self._ip_cache = {"qemuga": {}, "arp": {}}
-        if iface.type == "network":
-            net = self.conn.get_net(iface.source)
-            if net:
-                net.refresh_dhcp_leases()
-        if not self.is_active():
-            return
-
-        if agent_ready():
-            self._ip_cache["qemuga"] = self._get_interface_addresses(
-                libvirt.VIR_DOMAIN_INTERFACE_ADDRESSES_SRC_AGENT)
-
-        arp_flag = getattr(libvirt,
-            "VIR_DOMAIN_INTERFACE_ADDRESSES_SRC_ARP", 3)
-        self._ip_cache["arp"] = self._get_interface_addresses(arp_flag)
+    def agent_ready(self):
+        for dev in self.xmlobj.devices.channel:
+            if (dev.type == "unix" and
+                dev.target_name == dev.CHANNEL_NAME_QEMUGA and
+                dev.target_state == "connected"):
+                return True
+        return False
 
-    def _get_interface_addresses(self, source):
+    def query_interface_addresses(self, source):
         logging.debug("Calling interfaceAddresses source=%s", source)
         try:
             return self._backend.interfaceAddresses(source)
@@ -1146,50 +1069,21 @@ class vmmDomain(vmmLibvirtObject):
             logging.debug("interfaceAddresses failed: %s", str(e))
         return {}
 
+    def refresh_interface_addresses(self, iface):
+        """
+        Start a background refresh of guest addresses. The conn's
+        ipdiscovery object emits 'refreshed' when it's done
+        """
+        ignore = iface
+        self.conn.ipdiscovery.refresh_async(self.conn, force=True)
+
     def get_interface_addresses(self, iface):
-        if self._ip_cache is None:
-            self.refresh_interface_addresses(iface)
-
-        qemuga = self._ip_cache["qemuga"]
-        arp = self._ip_cache["arp"]
-        leases = []
-        if iface.type == "network":
-            net = self.conn.get_net(iface.source)
-            if net:
-                leases = net.get_dhcp_leases()
-
-        def extract_dom(info):
-            ipv4 = None
-            ipv6 = None
-            for addrs in info.values():
-                if addrs["hwaddr"] != iface.macaddr:
-                    continue
-                if not addrs["addrs"]:
-                    continue
-                for addr in addrs["addrs"]:
-                    if addr["type"] == 0:
-                        ipv4 = addr["addr"]
-                    elif (addr["type"] == 1 and
-                          not str(addr["addr"]).startswith("fe80")):
-                        ipv6 = addr["addr"] + "/" + str(addr["prefix"])
-            return ipv4, ipv6
-
-        def extract_lease(info):
-            ipv4 = None
-            ipv6 = None
-            if info["mac"] == iface.macaddr:
-                if info["type"] == 0:
-                    ipv4 = info["ipaddr"]
-                if info["type"] == 1:
-                    ipv6 = info["ipaddr"]
-            return ipv4, ipv6
-
-        for ips in ([qemuga] + leases + [arp]):
-            if "expirytime" in ips:
-                ipv4, ipv6 = extract_lease(ips)
-            else:
-                ipv4, ipv6 = extract_dom(ips)
-            if ipv4 or ipv6:
+        if not iface.macaddr:
+            return None, None
+        mac = iface.macaddr.lower()
+        for entrymac, ipv4, ipv6 in self.conn.ipdiscovery.lookup_cached(
+                self.conn, self):
+            if entrymac == mac:
                 return ipv4, ipv6
         return None, None
 
@@ -1434,14 +1328,24 @@ class vmmDomain(vmmLibvirtObject):
                                  "operation in progress"))
         self._backend.resume()
 
+    def _start_job_progress(self, meter, progtext):
+        if not meter or not self.getjobinfo_supported:
+            return None
+        return vmmJobMonitor.get_instance().add_job(self, meter, progtext)
+
+    def _stop_job_progress(self, job):
+        if job:
+            vmmJobMonitor.get_instance().remove_job(job)
+
     @vmmLibvirtObject.lifecycle_action
     def save(self, meter=None):
         self._install_abort = True
 
-        if meter:
-            start_job_progress_thread(self, meter, _("Saving domain to disk"))
-
-        self._backend.managedSave(0)
+        job = self._start_job_progress(meter, _("Saving domain to disk"))
+        try:
+            self._backend.managedSave(0)
+        finally:
+            self._stop_job_progress(job)
 
     def has_managed_save(self):
         if not self.managedsave_supported:
@@ -1487,17 +1391,18 @@ class vmmDomain(vmmLibvirtObject):
             "unsafe=%s temporary=%s",
             destconn, flags, dest_uri, tunnel, unsafe, temporary)
 
-        if meter:
-            start_job_progress_thread(self, meter, _("Migrating domain"))
-
         params = {}
         if dest_uri and not tunnel:
             params[libvirt.VIR_MIGRATE_PARAM_URI] = dest_uri
 
-        if tunnel:
-            self._backend.migrateToURI3(dest_uri, params, flags)
-        else:
-            self._backend.migrate3(libvirt_destconn, params, flags)
+        job = self._start_job_progress(meter, _("Migrating domain"))
+        try:
+            if tunnel:
+                self._backend.migrateToURI3(dest_uri, params, flags)
+            else:
+                self._backend.migrate3(libvirt_destconn, params, flags)
+        finally:
+            self._stop_job_progress(job)
 
         # Don't schedule any conn update, migrate dialog handles it for us
 
@@ -1548,6 +1453,12 @@ class vmmDomain(vmmLibvirtObject):
     def disk_io_vectors(self, limit=None, ceil=None):
         return self._get_stats().get_in_out_vector(
                 "diskRdRate", "diskWrRate", limit, ceil)
+    def network_traffic_avg_vector(self, limit=None, ceil=None):
+        return self._get_stats().get_in_out_avg_vector(
+                "netRxRate", "netTxRate", limit, ceil)
+    def disk_io_avg_vector(self, limit=None, ceil=None):
+        return self._get_stats().get_in_out_avg_vector(
+                "diskRdRate", "diskWrRate", limit, ceil)
 
 
     ###################
@@ -1659,13 +1570,43 @@ class vmmDomain(vmmLibvirtObject):
     # Polling helpers #
     ###################
 
-    def tick(self, stats_update=True):
+    def bulk_state_changed(self, state, domid):
+        """
+        Return True if @state and @domid, fetched by vmmConnection for
+        all VMs in one call, differ from what we last saw
+        """
+        return state != self._get_status() or domid != self._bulk_id
+
+    def refresh_bulk_state(self, state, domid):
+        """
+        Update status from vmmConnection's bulk state fetch. XML is only
+        refetched if the state or domain ID changed since the last call.
+
+        :returns: True if anything changed
+        """
+        if not self.bulk_state_changed(state, domid):
+            return False
+
+        self._bulk_id = domid
+        self._invalidate_xml()
+        self._refresh_status(newstatus=state, cansignal=False)
+        self.ensure_latest_xml(nosignal=True)
+        return True
+
+    def tick(self, stats_update=True, bulkstate=None):
+        """
+        :param bulkstate: (state, id) tuple if vmmConnection already
+            fetched it for all VMs in a single call. Saves the info()
+            round trip and XML refetch if nothing changed.
+        """
         if (not self._using_events() and
             not stats_update):
             return
 
         dosignal = False
-        if not self._using_events():
+        if not self._using_events() and bulkstate:
+            dosignal = self.refresh_bulk_state(*bulkstate)
+        elif not self._using_events():
             # For domains it's pretty important that we are always using
             # the latest XML, but other objects probably don't want to do
             # this since it could be a performance hit.
@@ -1723,8 +1664,9 @@ class vmmDomainVirtinst(vmmDomain):
     def _init_libvirt_state(self):
         pass
 
-    def tick(self, stats_update=True):
+    def tick(self, stats_update=True, bulkstate=None):
         ignore = stats_update
+        ignore = bulkstate
 
 
     ################
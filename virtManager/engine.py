@@ -18,6 +18,7 @@ from .baseclass import vmmGObject
 from .connect import vmmConnect
 from .connmanager import vmmConnectionManager
 from .inspection import vmmInspection
+from .statsexport import vmmStatsExporter
 from .systray import vmmSystray
 
 (PRIO_HIGH,
@@ -97,6 +98,7 @@ class vmmEngine(vmmGObject):
         """
         vmmSystray.get_instance()
         vmmInspection.get_instance()
+        vmmStatsExporter.get_instance()
 
         self.add_gsettings_handle(
             self.config.on_stats_update_interval_changed(
@@ -0,0 +1,135 @@
+# Copyright (C) 2018 Red Hat, Inc.
+#
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import collections
+import logging
+import threading
+
+from .baseclass import vmmGObject
+
+
+class vmmEventBatcher(vmmGObject):
+    """
+    Collect libvirt object events that arrive within _WINDOW milliseconds
+    and process them in a single main loop callback. Multiple events for
+    the same object only trigger one XML refresh, and events for objects
+    we don't know about yet are folded into one priority tick. A mass
+    start or shutdown of hundreds of VMs then costs one refresh per VM,
+    not one per event.
+
+    Objects refreshed with recache_from_event_loop don't each queue a
+    state-changed emission. Instead 'batch-processed' is emitted once
+    with the list of refreshed objects, see vmmConnection.
+    """
+    __gsignals__ = {
+        "batch-processed": (vmmGObject.RUN_FIRST, None, [object]),
+    }
+
+    # Refresh methods that take batched=True, and leave signalling the
+    # change to us
+    _BATCHABLE = ["recache_from_event_loop"]
+
+    _WINDOW = 100
+
+    def __init__(self, conn):
+        vmmGObject.__init__(self)
+
+        self._conn = conn
+        self._lock = threading.Lock()
+        self._timer = None
+
+        # (obj, method name) keys, in arrival order
+        self._pending = collections.OrderedDict()
+        self._pending_poll = {}
+
+        self.events_received = 0
+        self.actions_processed = 0
+
+    def _cleanup(self):
+        self.clear()
+        self._conn = None
+
+    def _schedule_flush(self):
+        if self._timer:
+            return
+        self._timer = self.timeout_add(self._WINDOW, self._flush)
+
+    def _flush(self):
+        with self._lock:
+            if self._timer:
+                self.remove_gobject_timeout(self._timer)
+                self._timer = None
+            pending = list(self._pending.keys())
+            pollkwargs = self._pending_poll
+            self._pending = collections.OrderedDict()
+            self._pending_poll = {}
+
+        changed = []
+        for obj, methodname in pending:
+            try:
+                if methodname not in self._BATCHABLE:
+                    getattr(obj, methodname)()
+                elif getattr(obj, methodname)(batched=True):
+                    changed.append(obj)
+            except Exception:
+                logging.debug("Error processing %s event for %s",
+                              methodname, obj, exc_info=True)
+        if pollkwargs and self._conn:
+            self._conn.schedule_priority_tick(force=True, **pollkwargs)
+
+        self.actions_processed += len(pending) + bool(pollkwargs)
+        logging.debug("Event batch: refreshed=%d poll=%s "
+                      "coalescing ratio=%.2f",
+                      len(pending), list(pollkwargs.keys()),
+                      self.get_coalescing_ratio())
+        if changed:
+            self.emit("batch-processed", changed)
+        return False
+
+
+    ###############
+    # Public APIs #
+    ###############
+
+    def queue_refresh(self, obj, methodname="recache_from_event_loop"):
+        """
+        Call obj.<methodname>() at the end of the current batch window.
+        Duplicate requests within the window are dropped.
+        """
+        with self._lock:
+            self.events_received += 1
+            self._pending[(obj, methodname)] = True
+            self._schedule_flush()
+
+    def queue_poll(self, **kwargs):
+        """
+        Request a forced conn.schedule_priority_tick(**kwargs) at the end
+        of the current batch window, for events on objects we aren't
+        tracking yet. Requests within the window are merged.
+        """
+        with self._lock:
+            self.events_received += 1
+            self._pending_poll.update(kwargs)
+            self._schedule_flush()
+
+    def clear(self):
+        """
+        Drop all pending events, for example on connection close
+        """
+        with self._lock:
+            if self._timer:
+                self.remove_gobject_timeout(self._timer)
+                self._timer = None
+            self._pending = collections.OrderedDict()
+            self._pending_poll = {}
+
+    def get_coalescing_ratio(self):
+        """
+        Return the number of events received per refresh/poll action
+        actually performed
+        """
+        if not self.actions_processed:
+            return 0.0
+        return float(self.events_received) / self.actions_processed
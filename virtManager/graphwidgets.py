@@ -49,22 +49,21 @@ def _line_helper(cairo_ct, bottom_baseline, points, for_fill=False):
     return last_point
 
 
-def draw_line(cairo_ct, y, h, points):
+def _line_path(cairo_ct, y, h, points):
+    """
+    Build the sparkline path. Returns False if there's nothing to stroke
+    """
     if not len(points):
-        return
-
-    last_point = _line_helper(cairo_ct, y + h, points)
-    if not last_point:
-        # Nothing to draw
-        return
-
-    # Paint the line
-    cairo_ct.stroke()
+        return False
+    return bool(_line_helper(cairo_ct, y + h, points))
 
 
-def draw_fill(cairo_ct, x, y, w, h, points, taper=False):
+def _fill_path(cairo_ct, x, y, w, h, points, taper=False):
+    """
+    Build the path of the area under the sparkline
+    """
     if not len(points):
-        return
+        return False
 
     _line_helper(cairo_ct, y + h, points, for_fill=True)
 
@@ -77,9 +76,106 @@ def draw_fill(cairo_ct, x, y, w, h, points, taper=False):
     # Box out the area to fill
     cairo_ct.line_to(start_x + 1, baseline_y)
     cairo_ct.line_to(x - 1, baseline_y)
+    return True
 
-    # Paint the fill
-    cairo_ct.fill()
+
+def draw_line(cairo_ct, y, h, points):
+    if _line_path(cairo_ct, y, h, points):
+        # Paint the line
+        cairo_ct.stroke()
+
+
+def draw_fill(cairo_ct, x, y, w, h, points, taper=False):
+    if _fill_path(cairo_ct, x, y, w, h, points, taper=taper):
+        # Paint the fill
+        cairo_ct.fill()
+
+
+def scale_points(data, x_step, height, reverse=False,
+                 start=0, count=None):
+    """
+    Convert data values in the range 0..1 to integer graph coordinates,
+    with the graph origin at 0,0 and the baseline at @height. @start and
+    @count select a slice of @data, for multi set data arrays.
+    """
+    if count is None:
+        count = len(data) - start
+    values = data[start:start + count]
+    if reverse:
+        values = values[::-1]
+    return [(int(index * x_step),
+             int(min(height, max(0, height - (height * val)))))
+            for index, val in enumerate(values)]
+
+
+def _build_paths(cairo_ct, build_cb):
+    """
+    Build the sparkline line and fill paths with @build_cb, and return
+    copies of them as (linepath, fillpath). Either can be None if
+    there's nothing to draw.
+    """
+    linepath = None
+    fillpath = None
+    cairo_ct.new_path()
+    if build_cb(cairo_ct, True):
+        linepath = cairo_ct.copy_path()
+    cairo_ct.new_path()
+    if build_cb(cairo_ct, False):
+        fillpath = cairo_ct.copy_path()
+    cairo_ct.new_path()
+    return linepath, fillpath
+
+
+class _SparklinePathCache(object):
+    """
+    Cache of the cairo line and fill paths of rendered sparklines, keyed
+    by (object key, width, height, sample count). Paths are built
+    relative to the graph origin, so they can be replayed at any cell
+    position. Entries are rebuilt only when the data changes.
+    """
+    # Drop everything if we grow past this, rather than tracking
+    # object lifetimes
+    _MAX_ENTRIES = 4096
+
+    def __init__(self):
+        self._cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_paths(self, cairo_ct, key, data, build_cb):
+        """
+        Return (linepath, fillpath) for @key. If the cached entry is
+        missing or was built from different data, @build_cb is called
+        to build the paths in @cairo_ct and the result is cached.
+        Either path can be None if there's nothing to draw.
+        """
+        data = tuple(data)
+        entry = self._cache.get(key)
+        if entry and entry[0] == data:
+            self.hits += 1
+            return entry[1], entry[2]
+
+        self.misses += 1
+        if len(self._cache) >= self._MAX_ENTRIES:
+            self._cache = {}
+
+        linepath, fillpath = _build_paths(cairo_ct, build_cb)
+        self._cache[key] = (data, linepath, fillpath)
+        return linepath, fillpath
+
+    def clear(self):
+        self._cache = {}
+
+
+def _paint_path(cairo_ct, path, stroke):
+    if path is None:
+        return
+    cairo_ct.new_path()
+    cairo_ct.append_path(path)
+    if stroke:
+        cairo_ct.stroke()
+    else:
+        cairo_ct.fill()
 
 
 class CellRendererSparkline(Gtk.CellRenderer):
@@ -94,6 +190,10 @@ class CellRendererSparkline(Gtk.CellRenderer):
         'reversed': (GObject.TYPE_BOOLEAN, "Reverse data",
                      "Process data from back to front.",
                      0, GObject.PARAM_READWRITE),
+        'cache_key': (GObject.TYPE_PYOBJECT, "Cache key",
+                      "Key identifying the rendered object. If set, "
+                      "the graph path is cached until the data changes",
+                      GObject.PARAM_READWRITE),
     }
 
     def __init__(self):
@@ -104,6 +204,8 @@ class CellRendererSparkline(Gtk.CellRenderer):
         self.filled = True
         self.reversed = False
         self.rgb = None
+        self.cache_key = None
+        self.path_cache = _SparklinePathCache()
 
     def do_render(self, cr, widget, background_area, cell_area,
                   flags):
@@ -170,45 +272,37 @@ class CellRendererSparkline(Gtk.CellRenderer):
                      cell_area.height - (BORDER_PADDING * 2))
         cr.fill()
 
-        def get_y(index):
-            baseline_y = graph_y + graph_height
-
-            if self.reversed:
-                n = (len(self.data_array) - index - 1)
-            else:
-                n = index
-
-            val = self.data_array[n]
-            y = baseline_y - (graph_height * val)
-
-            y = max(graph_y, y)
-            y = min(graph_y + graph_height, y)
-            return y
-
-        points = []
-        for index in range(0, len(self.data_array)):
-            x = int(((index * pixels_per_point) + graph_x))
-            y = int(get_y(index))
-
-            points.append((x, y))
-
-
-        cell_area.x = graph_x
-        cell_area.y = graph_y
-        cell_area.width = graph_width
-        cell_area.height = graph_height
+        # Paths are built relative to the graph origin, so cached paths
+        # can be reused wherever the cell is drawn
+        cr.save()
+        cr.translate(graph_x, graph_y)
+
+        def build_paths(cairo_ct, is_line):
+            points = scale_points(self.data_array, pixels_per_point,
+                                  graph_height, reverse=self.reversed)
+            if is_line:
+                return _line_path(cairo_ct, 0, graph_height, points)
+            return _fill_path(cairo_ct, 0, 0, graph_width, graph_height,
+                              points)
+
+        if self.cache_key is None:
+            linepath, fillpath = _build_paths(cr, build_paths)
+        else:
+            key = (self.cache_key, cell_area.width, cell_area.height,
+                   len(self.data_array))
+            linepath, fillpath = self.path_cache.get_paths(
+                    cr, key, self.data_array, build_paths)
 
         # Set color to dark blue for the actual sparkline
         cr.set_line_width(2)
         cr.set_source_rgb(0.421875, 0.640625, 0.73046875)
-        draw_line(cr, cell_area.y, cell_area.height, points)
+        _paint_path(cr, linepath, True)
 
         # Set color to light blue for the fill
         cr.set_source_rgba(0.71484375, 0.84765625, 0.89453125, .5)
-        draw_fill(cr,
-                  cell_area.x, cell_area.y,
-                  cell_area.width, cell_area.height,
-                  points)
+        _paint_path(cr, fillpath, False)
+
+        cr.restore()
         return
 
     def do_get_size(self, widget, cell_area=None):
@@ -283,6 +377,9 @@ class Sparkline(Gtk.DrawingArea):
         ctxt.add_class(Gtk.STYLE_CLASS_ENTRY)
 
     def set_data_array(self, val):
+        # Only redraw when new samples have arrived
+        if val == self._data_array:
+            return
         self._data_array = val
         self.queue_draw()
     def get_data_array(self):
@@ -320,18 +417,6 @@ class Sparkline(Gtk.DrawingArea):
         Gtk.render_frame(ctx, cr, 0, 0, w - 1, h - 1)
 
         # Draw the actual sparkline
-        def get_y(dataset, index):
-            baseline_y = h
-
-            n = dataset * points_per_set
-            if self.reversed:
-                n += (points_per_set - index - 1)
-            else:
-                n += index
-
-            val = self.data_array[n]
-            return baseline_y - ((h - 1) * val)
-
         cr.set_line_width(2)
 
         for dataset in range(0, self.num_sets):
@@ -339,16 +424,12 @@ class Sparkline(Gtk.DrawingArea):
                 cr.set_source_rgb(self.rgb[(dataset * 3)],
                                         self.rgb[(dataset * 3) + 1],
                                         self.rgb[(dataset * 1) + 2])
-            points = []
-            for index in range(0, points_per_set):
-                x = index * pixels_per_point
-                y = get_y(dataset, index)
-
-                points.append((int(x), int(y)))
-
-
-            if self.num_sets == 1:
-                pass
+            # Offset the baseline by one, the graph spans h - 1 pixels
+            points = [(x, y + 1) for x, y in
+                      scale_points(self.data_array, pixels_per_point, h - 1,
+                                   reverse=self.reversed,
+                                   start=dataset * points_per_set,
+                                   count=points_per_set)]
 
             draw_line(cr, 0, h, points)
             if self.filled:
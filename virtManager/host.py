@@ -248,6 +248,16 @@ class vmmHost(vmmGObjectUI):
 
         self.cpu_usage_graph.set_property("data_array", cpu_vector)
         self.memory_usage_graph.set_property("data_array", memory_vector)
+        self._refresh_job_pool()
+
+    def _refresh_job_pool(self):
+        opened, busy, size = self.conn.job_pool.get_stats()
+        if not size:
+            text = _("Disabled")
+        else:
+            text = (_("%(open)d of %(size)d open, %(busy)d in use") %
+                    {"open": opened, "size": size, "busy": busy})
+        self.widget("overview-job-connections").set_text(text)
 
     def conn_state_changed(self, ignore1=None):
         conn_active = self.conn.is_active()
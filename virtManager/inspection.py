@@ -3,8 +3,12 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import base64
 import functools
+import itertools
+import json
 import logging
+import os
 import queue
 import threading
 
@@ -13,12 +17,124 @@ from .connmanager import vmmConnectionManager
 from .domain import vmmInspectionData
 
 
+# Queue priorities, lower values are processed first
+_PRIO_CONN = 0
+_PRIO_USER = 1
+_PRIO_LOOKUP = 2
+_PRIO_INSPECT = 3
+
+_CACHE_VERSION = 1
+_CACHE_FILENAME = "inspection.json"
+
+
 def _inspection_error(_errstr):
     data = vmmInspectionData()
     data.errorstr = _errstr
     return data
 
 
+def _get_disk_signature(vm):
+    """
+    Return a list of [path, mtime, size] for every disk of the VM. If any
+    of these change, the inspection data we saved for the VM is stale.
+    See _InspectionDiskCache for how running VMs are handled.
+    """
+    ret = []
+    for disk in vm.get_disk_devices_norefresh():
+        path = disk.path
+        if not path:
+            continue
+        try:
+            st = os.stat(path)
+            ret.append([path, st.st_mtime, st.st_size])
+        except OSError:
+            ret.append([path, None, None])
+    return ret
+
+
+class _InspectionDiskCache(object):
+    """
+    Persistent inspection results, stored as JSON in the VM's cache dir
+    and keyed by the VM UUID plus its disk signature.
+
+    A running VM writes to its disks all the time, so for those only
+    the disk paths have to match. Stale data for a running VM is
+    replaced by the user triggered vmmInspection.vm_refresh.
+    """
+    _FIELDS = ["os_type", "distro", "major_version", "minor_version",
+               "hostname", "product_name", "product_variant",
+               "applications"]
+
+    def _get_path(self, vm):
+        return os.path.join(vm.get_cache_dir(), _CACHE_FILENAME)
+
+    def _signature_matches(self, vm, saved, signature):
+        if len(saved) != len(signature):
+            return False
+        if vm.is_active():
+            return ([ent[0] for ent in saved] ==
+                    [ent[0] for ent in signature])
+        return saved == signature
+
+    def load(self, vm, signature):
+        path = self._get_path(vm)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path) as f:
+                content = json.load(f)
+            if (content.get("version") != _CACHE_VERSION or
+                content.get("uuid") != vm.get_uuid() or
+                not self._signature_matches(
+                    vm, content.get("disks") or [], signature)):
+                return None
+
+            cached = content["data"]
+            data = vmmInspectionData()
+            for field in self._FIELDS:
+                setattr(data, field, cached.get(field))
+            if cached.get("icon"):
+                data.icon = base64.b64decode(cached["icon"])
+            return data
+        except Exception:
+            logging.debug("Error reading inspection cache %s",
+                    path, exc_info=True)
+            return None
+
+    def save(self, vm, signature, data):
+        content = {
+            "version": _CACHE_VERSION,
+            "uuid": vm.get_uuid(),
+            "disks": signature,
+            "data": dict((f, getattr(data, f)) for f in self._FIELDS),
+        }
+        icon = data.icon
+        if icon:
+            if not isinstance(icon, bytes):
+                icon = icon.encode("latin-1")
+            content["data"]["icon"] = base64.b64encode(icon).decode("ascii")
+
+        path = self._get_path(vm)
+        try:
+            tmppath = path + ".tmp"
+            with open(tmppath, "w") as f:
+                json.dump(content, f)
+            os.rename(tmppath, path)
+        except Exception:
+            logging.debug("Error writing inspection cache %s",
+                    path, exc_info=True)
+
+    def remove(self, vm):
+        path = self._get_path(vm)
+        try:
+            if os.path.exists(path):
+                os.unlink(path)
+        except Exception:
+            logging.debug("Error removing inspection cache %s",
+                    path, exc_info=True)
+
+
 class vmmInspection(vmmGObject):
     _libguestfs_installed = None
 
@@ -50,11 +166,15 @@ class vmmInspection(vmmGObject):
         vmmGObject.__init__(self)
         self._cleanup_on_app_close()
 
-        self._thread = None
+        self._threads = []
 
-        self._q = queue.Queue()
+        self._q = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
         self._conns = {}
         self._cached_data = {}
+        self._inflight = set()
+        self._diskcache = _InspectionDiskCache()
 
         val = self.config.get_libguestfs_inspect_vms()
         logging.debug("libguestfs gsetting enabled=%s", str(val))
@@ -71,17 +191,23 @@ class vmmInspection(vmmGObject):
 
     def _cleanup(self):
         self._stop()
-        self._q = queue.Queue()
+        self._q = queue.PriorityQueue()
         self._conns = {}
         self._cached_data = {}
+        self._inflight = set()
+
+    def _queue_put(self, priority, obj):
+        # The counter keeps items of the same priority in FIFO order,
+        # and ensures we never end up comparing the obj tuples
+        self._q.put((priority, next(self._counter), obj))
 
     def _conn_added(self, _src, conn):
         obj = ("conn_added", conn)
-        self._q.put(obj)
+        self._queue_put(_PRIO_CONN, obj)
 
     def _conn_removed(self, _src, uri):
         obj = ("conn_removed", uri)
-        self._q.put(obj)
+        self._queue_put(_PRIO_CONN, obj)
 
     # Called by the main thread whenever a VM is added to vmlist.
     def _vm_added(self, conn, connkey):
@@ -91,61 +217,81 @@ class vmmInspection(vmmGObject):
             return
 
         obj = ("vm_added", conn.get_uri(), connkey)
-        self._q.put(obj)
+        self._queue_put(_PRIO_LOOKUP, obj)
 
     def vm_refresh(self, vm):
         logging.debug("Refresh requested for vm=%s", vm.get_name())
         obj = ("vm_refresh", vm.conn.get_uri(), vm.get_name(), vm.get_uuid())
-        self._q.put(obj)
+        self._queue_put(_PRIO_USER, obj)
+
+    def vm_prioritize(self, vm):
+        """
+        Move the VM to the front of the inspection queue, for example
+        because the user is looking at it
+        """
+        with self._lock:
+            if vm.get_uuid() in self._cached_data:
+                return
+        obj = ("vm_prioritize", vm.conn.get_uri(), vm.get_name())
+        self._queue_put(_PRIO_USER, obj)
 
     def _start(self):
-        self._thread = threading.Thread(
-                name="inspection thread", target=self._run)
-        self._thread.daemon = True
-        self._thread.start()
+        workers = self.config.get_libguestfs_inspect_workers()
+        logging.debug("Starting %d inspection workers", workers)
+        for idx in range(workers):
+            thread = threading.Thread(
+                    name="inspection thread %d" % idx, target=self._run)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
 
     def _stop(self):
-        if self._thread is None:
+        if not self._threads:
             return
 
-        self._q.put(None)
-        self._thread = None
+        for ignore in self._threads:
+            self._queue_put(-1, None)
+        self._threads = []
 
     def _run(self):
         # Process everything on the queue.  If the queue is empty when
         # called, block.
+        q = self._q
         while True:
-            obj = self._q.get()
+            obj = q.get()[2]
             if obj is None:
                 logging.debug("libguestfs queue obj=None, exiting thread")
                 return
             self._process_queue_item(obj)
-            self._q.task_done()
+            q.task_done()
 
     def _process_queue_item(self, obj):
         cmd = obj[0]
         if cmd == "conn_added":
             conn = obj[1]
             uri = conn.get_uri()
-            if uri in self._conns:
-                return
+            with self._lock:
+                if uri in self._conns:
+                    return
+                self._conns[uri] = conn
 
-            self._conns[uri] = conn
             conn.connect("vm-added", self._vm_added)
             for vm in conn.list_vms():
                 self._vm_added(conn, vm.get_connkey())
 
         elif cmd == "conn_removed":
             uri = obj[1]
-            self._conns.pop(uri)
+            with self._lock:
+                self._conns.pop(uri, None)
 
-        elif cmd == "vm_added" or cmd == "vm_refresh":
+        elif cmd in ["vm_added", "vm_refresh", "vm_prioritize", "vm_inspect"]:
             uri = obj[1]
-            if uri not in self._conns:
+            with self._lock:
+                conn = self._conns.get(uri)
+            if not conn:
                 # This connection disappeared in the meanwhile.
                 return
 
-            conn = self._conns[uri]
             vm = conn.get_vm(obj[2])
             if not vm:
                 # The VM was removed in the meanwhile.
@@ -154,40 +300,95 @@ class vmmInspection(vmmGObject):
             if cmd == "vm_refresh":
                 vmuuid = obj[3]
                 # When refreshing the inspection data of a VM,
-                # all we need is to remove it from the "seen" cache,
+                # all we need is to remove it from the "seen" caches,
                 # as the data itself will be replaced once the new
                 # results are available.
-                self._cached_data.pop(vmuuid, None)
+                with self._lock:
+                    self._cached_data.pop(vmuuid, None)
+                self._diskcache.remove(vm)
+
+            if cmd == "vm_added":
+                # Only check the caches here. Actual inspection is queued
+                # with a lower priority, so all cache hits are reported
+                # before we start launching appliances.
+                if not self._process_vm_cached(conn, vm):
+                    self._queue_put(_PRIO_INSPECT,
+                            ("vm_inspect", uri, obj[2]))
+                return
 
             self._process_vm(conn, vm)
 
-    def _process_vm(self, conn, vm):
-        # Try processing a single VM, keeping into account whether it was
-        # visited already, and whether there are cached data for it.
-        def _set_vm_inspection_data(_data):
-            vm.inspection = _data
-            vm.inspection_data_updated()
-            self._cached_data[vm.get_uuid()] = _data
+    def _set_vm_inspection_data(self, vm, data):
+        vm.inspection = data
+        vm.inspection_data_updated()
+        with self._lock:
+            self._cached_data[vm.get_uuid()] = data
 
+    def _process_vm_cached(self, conn, vm):
+        # Look up the VM in the in memory and on disk caches, and
+        # report the result. Return False if we need to inspect the VM.
         prettyvm = conn.get_uri() + ":" + vm.get_name()
         vmuuid = vm.get_uuid()
-        if vmuuid in self._cached_data:
+        with self._lock:
             data = self._cached_data.get(vmuuid)
+        if data is not None:
             if vm.inspection != data:
                 logging.debug("Found cached data for %s", prettyvm)
-                _set_vm_inspection_data(data)
-            return
+                self._set_vm_inspection_data(vm, data)
+            return True
+
+        if conn.is_remote() or conn.is_test():
+            return False
 
         try:
-            data = self._inspect_vm(conn, vm)
-        except Exception as e:
-            data = _inspection_error(_("Error inspection VM: %s") % str(e))
-            logging.exception("%s: exception while processing", prettyvm)
+            data = self._diskcache.load(vm, _get_disk_signature(vm))
+        except Exception:
+            logging.debug("%s: error checking inspection cache",
+                    prettyvm, exc_info=True)
+            data = None
+        if data is None:
+            return False
+
+        logging.debug("Found on disk cached data for %s", prettyvm)
+        self._set_vm_inspection_data(vm, data)
+        return True
 
-        _set_vm_inspection_data(data)
+    def _process_vm(self, conn, vm):
+        # Try processing a single VM, keeping into account whether it was
+        # visited already, and whether there are cached data for it.
+        if self._process_vm_cached(conn, vm):
+            return
+
+        prettyvm = conn.get_uri() + ":" + vm.get_name()
+        vmuuid = vm.get_uuid()
+        with self._lock:
+            if vmuuid in self._inflight:
+                # Another worker is already inspecting this VM
+                return
+            self._inflight.add(vmuuid)
+
+        try:
+            signature = None
+            try:
+                if not conn.is_remote() and not conn.is_test():
+                    signature = _get_disk_signature(vm)
+                data = self._inspect_vm(conn, vm)
+            except Exception as e:
+                data = _inspection_error(
+                        _("Error inspection VM: %s") % str(e))
+                logging.exception("%s: exception while processing", prettyvm)
+
+            if data is None:
+                return
+            if signature is not None and not data.errorstr:
+                self._diskcache.save(vm, signature, data)
+            self._set_vm_inspection_data(vm, data)
+        finally:
+            with self._lock:
+                self._inflight.discard(vmuuid)
 
     def _inspect_vm(self, conn, vm):
-        if self._thread is None:
+        if not self._threads:
             return
 
         if conn.is_remote():
@@ -0,0 +1,223 @@
+# Copyright (C) 2018 Red Hat, Inc.
+#
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import logging
+import threading
+import time
+
+import libvirt
+
+from .baseclass import vmmGObject
+
+
+def _addrs_from_lease(lease):
+    ipv4 = None
+    ipv6 = None
+    if lease["type"] == libvirt.VIR_IP_ADDR_TYPE_IPV4:
+        ipv4 = lease["ipaddr"]
+    elif lease["type"] == libvirt.VIR_IP_ADDR_TYPE_IPV6:
+        ipv6 = lease["ipaddr"]
+    return ipv4, ipv6
+
+
+def _addrs_from_domain(info):
+    """
+    Convert virDomainInterfaceAddresses output to a {mac: (ipv4, ipv6)}
+    dict
+    """
+    ret = {}
+    for addrs in info.values():
+        if not addrs["hwaddr"] or not addrs["addrs"]:
+            continue
+
+        ipv4 = None
+        ipv6 = None
+        for addr in addrs["addrs"]:
+            if addr["type"] == libvirt.VIR_IP_ADDR_TYPE_IPV4:
+                ipv4 = addr["addr"]
+            elif (addr["type"] == libvirt.VIR_IP_ADDR_TYPE_IPV6 and
+                  not str(addr["addr"]).startswith("fe80")):
+                ipv6 = addr["addr"] + "/" + str(addr["prefix"])
+        if ipv4 or ipv6:
+            ret[addrs["hwaddr"].lower()] = (ipv4, ipv6)
+    return ret
+
+
+class _IPEntry(object):
+    """
+    Cached address info for a single MAC address
+    """
+    def __init__(self, ipv4, ipv6, source, timestamp):
+        self.ipv4 = ipv4
+        self.ipv6 = ipv6
+        self.source = source
+        self.timestamp = timestamp
+
+
+class vmmIPDiscovery(vmmGObject):
+    """
+    Connection wide guest IP address lookup. DHCP leases for every
+    network are fetched once per refresh and indexed by MAC address.
+    Guest agent and ARP queries are only made for VMs whose MACs
+    don't appear in any lease. Results are cached for _TTL seconds.
+
+    The connection tick keeps the cache fresh with refresh_async, so
+    UI lookups with lookup_cached never wait on libvirt. 'refreshed' is
+    emitted when a refresh completes, so the UI can show new results.
+    """
+    __gsignals__ = {
+        "refreshed": (vmmGObject.RUN_FIRST, None, []),
+    }
+
+    _TTL = 30
+
+    SOURCE_LEASE = "lease"
+    SOURCE_AGENT = "qemuga"
+    SOURCE_ARP = "arp"
+
+    def __init__(self):
+        vmmGObject.__init__(self)
+
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._last_refresh = None
+        self._refresh_running = False
+
+    def _cleanup(self):
+        self._entries = {}
+
+
+    ###################
+    # Private helpers #
+    ###################
+
+    def _is_stale(self, timestamp):
+        return timestamp is None or (time.time() - timestamp) > self._TTL
+
+    def _set_entries(self, addrmap, source, timestamp):
+        with self._lock:
+            for mac, (ipv4, ipv6) in addrmap.items():
+                self._entries[mac] = _IPEntry(ipv4, ipv6, source, timestamp)
+
+    def _fetch_leases(self, nets, timestamp):
+        addrmap = {}
+        for net in nets:
+            if not net.is_active():
+                continue
+            net.refresh_dhcp_leases()
+            for lease in net.get_dhcp_leases():
+                if not lease.get("mac"):
+                    continue
+                ipv4, ipv6 = _addrs_from_lease(lease)
+                mac = lease["mac"].lower()
+                oldv4, oldv6 = addrmap.get(mac, (None, None))
+                addrmap[mac] = (oldv4 or ipv4, oldv6 or ipv6)
+        self._set_entries(addrmap, self.SOURCE_LEASE, timestamp)
+        return addrmap
+
+    def _query_vm(self, vm, timestamp):
+        """
+        Ask the guest agent, falling back to the host ARP table, for
+        addresses of all the VM NICs
+        """
+        if not vm.is_active():
+            return
+
+        addrmap = {}
+        if vm.agent_ready():
+            addrmap = _addrs_from_domain(vm.query_interface_addresses(
+                libvirt.VIR_DOMAIN_INTERFACE_ADDRESSES_SRC_AGENT))
+            self._set_entries(addrmap, self.SOURCE_AGENT, timestamp)
+
+        arp_flag = getattr(libvirt,
+            "VIR_DOMAIN_INTERFACE_ADDRESSES_SRC_ARP", 3)
+        arpmap = _addrs_from_domain(vm.query_interface_addresses(arp_flag))
+        for mac in list(arpmap.keys()):
+            if mac in addrmap:
+                arpmap.pop(mac)
+        self._set_entries(arpmap, self.SOURCE_ARP, timestamp)
+
+    def _vm_macs(self, vm):
+        return [iface.macaddr.lower() for iface in
+                vm.get_interface_devices_norefresh() if iface.macaddr]
+
+
+    ###############
+    # Public APIs #
+    ###############
+
+    def refresh(self, conn):
+        """
+        Refresh addresses for every VM on the connection. DHCP leases are
+        fetched for all networks in one pass, then only VMs with NICs
+        that aren't found in the leases are queried individually.
+        """
+        timestamp = time.time()
+        leasemap = self._fetch_leases(conn.list_nets(), timestamp)
+
+        queried = 0
+        for vm in conn.list_vms():
+            if not vm.is_active():
+                continue
+            macs = self._vm_macs(vm)
+            if all(mac in leasemap for mac in macs):
+                continue
+            self._query_vm(vm, timestamp)
+            queried += 1
+
+        with self._lock:
+            self._last_refresh = timestamp
+            for mac, entry in list(self._entries.items()):
+                if entry.timestamp != timestamp and self._is_stale(
+                        entry.timestamp):
+                    self._entries.pop(mac)
+        logging.debug("IP discovery refresh for %s: leases=%d "
+                      "queried vms=%d", conn.get_uri(), len(leasemap), queried)
+
+    def refresh_async(self, conn, force=False):
+        """
+        Start a background refresh, unless one is already running or
+        the cached data is still fresh
+
+        :param force: Refresh even if the cached data is fresh
+        """
+        with self._lock:
+            if self._refresh_running:
+                return
+            if not force and not self._is_stale(self._last_refresh):
+                return
+            self._refresh_running = True
+
+        def _refresh_thread():
+            try:
+                self.refresh(conn)
+            except Exception:
+                logging.debug("Error refreshing IP addresses", exc_info=True)
+            finally:
+                with self._lock:
+                    self._refresh_running = False
+            self.idle_emit("refreshed")
+
+        self._start_thread(_refresh_thread,
+                           "IP discovery %s" % conn.get_uri())
+
+    def lookup_cached(self, conn, vm):
+        """
+        Return a list of (mac, ipv4, ipv6) for all NICs of the VM, without
+        doing any libvirt calls. If the connection wide data is stale, a
+        background refresh is kicked off. Suitable for calling on every
+        row of a VM list.
+        """
+        self.refresh_async(conn)
+
+        ret = []
+        with self._lock:
+            for mac in self._vm_macs(vm):
+                entry = self._entries.get(mac)
+                if entry:
+                    ret.append((mac, entry.ipv4, entry.ipv6))
+                else:
+                    ret.append((mac, None, None))
+        return ret
@@ -0,0 +1,244 @@
+# Copyright (C) 2018 Red Hat, Inc.
+#
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import logging
+import threading
+import time
+
+from virtinst import progress
+
+
+def _get_vm_key(vm):
+    # Job APIs are often run on a separate vmmDomain instance for the
+    # same VM, like migrate does on a pooled connection, so events
+    # can't be matched to jobs by object identity
+    return (vm.conn.get_uri(), vm.get_uuid())
+
+
+class _MonitoredJob(object):
+    """
+    A single long running domain job (save, migrate, ...) and the
+    progress reporting bookkeeping we do for it
+    """
+    # Weight of the newest sample in the smoothed transfer rate
+    _RATE_SMOOTHING = 0.3
+
+    def __init__(self, vm, meter, progtext):
+        self.vm = vm
+        self.vmkey = _get_vm_key(vm)
+        self.meter = meter
+        self.progtext = progtext
+
+        self.completed = False
+        self.poll_now = False
+        self.use_jobstats = vm.getjobstats_supported
+
+        # Transfer rate in bytes per second, and estimated seconds left
+        self.rate = None
+        self.remaining_time = None
+
+        self._last_processed = None
+        self._last_time = None
+
+    def __repr__(self):
+        return "<_MonitoredJob vm=%s text=%s>" % (
+                self.vm.get_name(), self.progtext)
+
+    def _fetch_progress(self):
+        """
+        Return (total, processed, remaining, bps) for the job. bps is
+        the transfer rate reported by libvirt, if it reports one
+        """
+        if self.use_jobstats:
+            stats = self.vm.job_stats()
+            return (float(stats.get("data_total", 0)),
+                    float(stats.get("data_processed", 0)),
+                    float(stats.get("data_remaining", 0)),
+                    stats.get("memory_bps"))
+
+        jobinfo = self.vm.job_info()
+        return (float(jobinfo[3]), float(jobinfo[4]),
+                float(jobinfo[5]), None)
+
+    def _update_rate(self, processed, remaining, bps, now):
+        if bps:
+            rate = float(bps)
+        elif self._last_time is not None and now > self._last_time:
+            rate = ((processed - self._last_processed) /
+                    (now - self._last_time))
+        else:
+            rate = None
+        self._last_processed = processed
+        self._last_time = now
+
+        if rate is not None and rate >= 0:
+            if self.rate is None:
+                self.rate = rate
+            else:
+                self.rate = (self._RATE_SMOOTHING * rate +
+                             (1 - self._RATE_SMOOTHING) * self.rate)
+        if self.rate:
+            self.remaining_time = remaining / self.rate
+
+    def _get_meter_text(self):
+        if not self.rate:
+            return self.progtext
+        ratestr = progress.format_number(self.rate) + "B/s"
+        if self.remaining_time is None:
+            return "%s (%s)" % (self.progtext, ratestr)
+        return (_("%(text)s (%(rate)s, %(time)s remaining)") %
+                {"text": self.progtext, "rate": ratestr,
+                 "time": progress.format_time(self.remaining_time)})
+
+    def report(self, total, processed, remaining, bps=None, now=None):
+        # data_total is 0 if the job hasn't started yet
+        if not total:
+            return
+
+        if now is None:
+            now = time.time()
+        if not self.completed:
+            self._update_rate(processed, remaining, bps, now)
+
+        if not self.meter.started:
+            self.meter.start(size=total, text=self.progtext)
+        self.meter.text = self._get_meter_text()
+        self.meter.update(total - remaining, now)
+
+    def poll(self):
+        self.poll_now = False
+        self.report(*self._fetch_progress())
+
+
+class vmmJobMonitor(object):
+    """
+    Single scheduler thread that reports progress for all active domain
+    jobs across all connections. Jobs are polled in one pass per
+    interval, and libvirt job events are used to catch completion and
+    migration iterations without waiting for the next poll.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    # Base poll interval. With many concurrent jobs we back off so the
+    # total RPC rate stays bounded
+    _POLL_INTERVAL = .5
+    _POLL_INTERVAL_PER_JOB = .1
+
+    @classmethod
+    def get_instance(cls):
+        with cls._instance_lock:
+            if not cls._instance:
+                cls._instance = vmmJobMonitor()
+            return cls._instance
+
+    def __init__(self):
+        self._jobs = []
+        self._cond = threading.Condition()
+        self._thread = None
+
+
+    ###############
+    # Public APIs #
+    ###############
+
+    def add_job(self, vm, meter, progtext):
+        """
+        Start reporting progress for a job on @vm to @meter. Caller
+        must call remove_job when the blocking job API returns.
+        """
+        job = _MonitoredJob(vm, meter, progtext)
+        with self._cond:
+            self._jobs.append(job)
+            self._start_thread()
+            self._cond.notify()
+        logging.debug("Job monitor: added %s, active jobs=%d",
+                      job, len(self._jobs))
+        return job
+
+    def remove_job(self, job):
+        with self._cond:
+            if job in self._jobs:
+                self._jobs.remove(job)
+        logging.debug("Job monitor: removed %s", job)
+
+    def get_jobs(self):
+        with self._cond:
+            return self._jobs[:]
+
+    def job_completed_event(self, vm, params):
+        """
+        Called from the libvirt event loop for JOB_COMPLETED events.
+        The event carries the final job stats, so there is nothing
+        left to poll for.
+        """
+        for job in self._find_jobs(vm):
+            with self._cond:
+                job.completed = True
+                job.poll_now = False
+            try:
+                job.report(float(params.get("data_total", 0)),
+                           float(params.get("data_processed", 0)),
+                           float(params.get("data_remaining", 0)),
+                           params.get("memory_bps"))
+            except Exception:
+                logging.debug("Error reporting job completion for %s",
+                              job, exc_info=True)
+
+    def migration_iteration_event(self, vm, iteration):
+        """
+        Called from the libvirt event loop for MIGRATION_ITERATION events.
+        A new memory pass started, so refresh progress straight away.
+        """
+        logging.debug("Job monitor: vm=%s migration iteration=%s",
+                      vm.get_name(), iteration)
+        jobs = self._find_jobs(vm)
+        if not jobs:
+            return
+        with self._cond:
+            for job in jobs:
+                if not job.completed:
+                    job.poll_now = True
+            self._cond.notify()
+
+
+    ###################
+    # Private helpers #
+    ###################
+
+    def _find_jobs(self, vm):
+        vmkey = _get_vm_key(vm)
+        with self._cond:
+            return [j for j in self._jobs if j.vmkey == vmkey]
+
+    def _start_thread(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run,
+                                        name="job progress reporting")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _get_poll_interval(self):
+        return max(self._POLL_INTERVAL,
+                   len(self._jobs) * self._POLL_INTERVAL_PER_JOB)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._jobs:
+                    self._cond.wait()
+                jobs = [j for j in self._jobs if not j.completed]
+                if not any(j.poll_now for j in jobs):
+                    self._cond.wait(self._get_poll_interval())
+                    jobs = [j for j in self._jobs if not j.completed]
+
+            for job in jobs:
+                try:
+                    job.poll()
+                except Exception:
+                    logging.exception("Error polling job progress for %s",
+                                      job)
+                    self.remove_job(job)
@@ -6,6 +6,8 @@
 
 import logging
 
+import virtinst
+
 from .baseclass import vmmGObject
 
 
@@ -259,7 +261,7 @@ class vmmLibvirtObject(vmmGObject):
     # Public XML API #
     ##################
 
-    def recache_from_event_loop(self):
+    def recache_from_event_loop(self, batched=False):
         """
         Updates the VM status and XML, because we received an event from
         libvirt's event implementations. That's the only time this should
@@ -267,12 +269,17 @@ class vmmLibvirtObject(vmmGObject):
 
         We refresh status and XML because they are tied together in subtle
         ways, like runtime XML changing when a VM is started.
+
+        :param batched: If True, don't signal state-changed. The caller
+            signals it for a batch of objects at once.
+        :returns: True if the object was refreshed
         """
         try:
             self.__force_refresh_xml(nosignal=True)
             # status = None forces a signal to be emitted
             self.__status = None
-            self._refresh_status()
+            self._refresh_status(cansignal=not batched)
+            return True
         except Exception as e:
             # If we hit an exception here, it's often that the object
             # disappeared, so request the poll loop to be updated
@@ -282,6 +289,7 @@ class vmmLibvirtObject(vmmGObject):
                 kwargs = {"force": True, poll_param: True}
                 logging.debug("Scheduling priority tick with: %s", kwargs)
                 self.conn.schedule_priority_tick(**kwargs)
+            return False
 
     def ensure_latest_xml(self, nosignal=False):
         """
@@ -385,10 +393,18 @@ class vmmLibvirtObject(vmmGObject):
             origxml = self._make_xmlobj_to_define().get_xml()
 
         newxml = xmlobj.get_xml()
-        self.log_redefine_xml_diff(self, origxml, newxml)
-
-        if origxml != newxml:
-            self._define(newxml)
+        if origxml == newxml:
+            self.log_redefine_xml_diff(self, origxml, newxml)
+        else:
+            # Structured diff only logs the changed parts, which keeps
+            # the output compact for guests with lots of devices
+            xmldiff = virtinst.XMLDiff(
+                self._parseclass(self.conn.get_backend(), parsexml=origxml),
+                xmlobj)
+            logging.debug("Redefining %s with XML diff:\n%s",
+                          self, xmldiff.format())
+            if not xmldiff.is_noop():
+                self._define(newxml)
 
         if self._using_events():
             return
@@ -103,6 +103,14 @@ class vmmManager(vmmGObjectUI):
         self.connmenu = Gtk.Menu()
         self.connmenu_items = {}
 
+        # Map of conn/vm -> Gtk.TreeRowReference, so row lookups don't
+        # need to walk the whole model
+        self._row_refs = {}
+        # conn/vm objects whose rows need a row_changed emission. These
+        # are flushed in a single idle callback per tick
+        self._pending_row_changes = set()
+        self._row_changes_queued = False
+
         self.builder.connect_signals({
             "on_menu_view_guest_cpu_usage_activate":
             self.toggle_stats_visible_guest_cpu,
@@ -217,6 +225,8 @@ class vmmManager(vmmGObjectUI):
         self.connmenu.destroy()
         self.connmenu = None
         self.connmenu_items = None
+        self._row_refs = {}
+        self._pending_row_changes = set()
 
         if self._window_size:
             self.config.set_manager_window_size(*self._window_size)
@@ -425,20 +435,52 @@ class vmmManager(vmmGObjectUI):
         return handle.conn
 
     def get_row(self, conn_or_vm):
-        def _walk(model, rowiter, obj):
-            while rowiter:
-                row = model[rowiter]
-                if row[ROW_HANDLE] == obj:
-                    return row
-                if model.iter_has_child(rowiter):
-                    ret = _walk(model, model.iter_nth_child(rowiter, 0), obj)
-                    if ret:
-                        return ret
-                rowiter = model.iter_next(rowiter)
-
-        if not len(self.model):
+        rowref = self._row_refs.get(conn_or_vm)
+        if not rowref or not rowref.valid():
             return None
-        return _walk(self.model, self.model.get_iter_first(), conn_or_vm)
+        return self.model[rowref.get_path()]
+
+    def _append_row(self, parent_iter, row):
+        rowiter = self.model.append(parent_iter, row)
+        self._row_refs[row[ROW_HANDLE]] = Gtk.TreeRowReference.new(
+                self.model, self.model.get_path(rowiter))
+        return rowiter
+
+    def _remove_row(self, rowiter):
+        child = self.model.iter_children(rowiter)
+        while child is not None:
+            self._remove_row(child)
+            child = self.model.iter_children(rowiter)
+
+        handle = self.model[rowiter][ROW_HANDLE]
+        self._row_refs.pop(handle, None)
+        self._pending_row_changes.discard(handle)
+        self.model.remove(rowiter)
+
+    def _queue_row_changed(self, conn_or_vm):
+        """
+        Schedule a row_changed emission for the object's row. Many stats
+        updates arrive in a burst each tick, so they are coalesced and
+        emitted from one idle callback.
+        """
+        self._pending_row_changes.add(conn_or_vm)
+        if self._row_changes_queued:
+            return
+        self._row_changes_queued = True
+        self.idle_add(self._flush_row_changes)
+
+    def _flush_row_changes(self):
+        self._row_changes_queued = False
+        pending = self._pending_row_changes
+        self._pending_row_changes = set()
+        if not self.builder:
+            return False
+
+        for obj in pending:
+            row = self.get_row(obj)
+            if row is not None:
+                self.model.row_changed(row.path, row.iter)
+        return False
 
 
     ####################
@@ -562,7 +604,7 @@ class vmmManager(vmmGObjectUI):
 
         vm_row = self._build_row(None, vm)
         conn_row = self.get_row(conn)
-        self.model.append(conn_row.iter, vm_row)
+        self._append_row(conn_row.iter, vm_row)
 
         vm.connect("state-changed", self.vm_changed)
         vm.connect("resources-sampled", self.vm_row_updated)
@@ -577,7 +619,7 @@ class vmmManager(vmmGObjectUI):
             rowiter = self.model.iter_nth_child(parent, rowidx)
             vm = self.model[rowiter][ROW_HANDLE]
             if vm.get_connkey() == connkey:
-                self.model.remove(rowiter)
+                self._remove_row(rowiter)
                 break
 
     def _build_conn_hint(self, conn):
@@ -651,12 +693,13 @@ class vmmManager(vmmGObjectUI):
             return
 
         conn_row = self._build_row(conn, None)
-        self.model.append(None, conn_row)
+        self._append_row(None, conn_row)
 
         conn.connect("vm-added", self.vm_added)
         conn.connect("vm-removed", self.vm_removed)
         conn.connect("resources-sampled", self.conn_row_updated)
         conn.connect("state-changed", self.conn_state_changed)
+        conn.connect("batch-state-changed", self.vm_batch_changed)
 
         for vm in conn.list_vms():
             self.vm_added(conn, vm.get_connkey())
@@ -670,11 +713,7 @@ class vmmManager(vmmGObjectUI):
         if conn_row is None:
             return
 
-        child = self.model.iter_children(conn_row.iter)
-        while child is not None:
-            self.model.remove(child)
-            child = self.model.iter_children(conn_row.iter)
-        self.model.remove(conn_row.iter)
+        self._remove_row(conn_row.iter)
 
 
     #############################
@@ -682,18 +721,30 @@ class vmmManager(vmmGObjectUI):
     #############################
 
     def vm_row_updated(self, vm):
-        row = self.get_row(vm)
-        if row is None:
-            return
-        self.model.row_changed(row.path, row.iter)
+        self._queue_row_changed(vm)
 
     def vm_changed(self, vm):
+        if vm.conn.in_state_batch():
+            # Handled by vm_batch_changed
+            return
+        self._update_vm_row(vm)
+
+    def vm_batch_changed(self, conn, objs):
+        ignore = conn
+        current_vm = self.current_vm()
+        for obj in objs:
+            if obj.is_domain():
+                self._update_vm_row(obj, update_selection=False)
+        if current_vm in objs:
+            self.update_current_selection()
+
+    def _update_vm_row(self, vm, update_selection=True):
         row = self.get_row(vm)
         if row is None:
             return
 
         try:
-            if vm == self.current_vm():
+            if update_selection and vm == self.current_vm():
                 self.update_current_selection()
 
             name = vm.get_name_or_title()
@@ -749,20 +800,18 @@ class vmmManager(vmmGObjectUI):
         if not conn.is_active():
             child = self.model.iter_children(row.iter)
             while child is not None:
-                self.model.remove(child)
+                self._remove_row(child)
                 child = self.model.iter_children(row.iter)
 
         self.conn_row_updated(conn)
         self.update_current_selection()
 
     def conn_row_updated(self, conn):
-        row = self.get_row(conn)
-
         self.max_disk_rate = max(self.max_disk_rate, conn.disk_io_max_rate())
         self.max_net_rate = max(self.max_net_rate,
                                 conn.network_traffic_max_rate())
 
-        self.model.row_changed(row.path, row.iter)
+        self._queue_row_changed(conn)
 
     def change_run_text(self, can_restore):
         if can_restore:
@@ -988,6 +1037,7 @@ class vmmManager(vmmGObjectUI):
             return
 
         data = obj.guest_cpu_time_vector(GRAPH_LEN)
+        cell.set_property('cache_key', obj.object_key)
         cell.set_property('data_array', data)
 
     def host_cpu_usage_img(self, column_ignore, cell, model, _iter, data):
@@ -996,6 +1046,7 @@ class vmmManager(vmmGObjectUI):
             return
 
         data = obj.host_cpu_time_vector(GRAPH_LEN)
+        cell.set_property('cache_key', obj.object_key)
         cell.set_property('data_array', data)
 
     def memory_usage_img(self, column_ignore, cell, model, _iter, data):
@@ -1004,6 +1055,7 @@ class vmmManager(vmmGObjectUI):
             return
 
         data = obj.stats_memory_vector(GRAPH_LEN)
+        cell.set_property('cache_key', obj.object_key)
         cell.set_property('data_array', data)
 
     def disk_io_img(self, column_ignore, cell, model, _iter, data):
@@ -1011,8 +1063,8 @@ class vmmManager(vmmGObjectUI):
         if obj is None or not hasattr(obj, "conn"):
             return
 
-        d1, d2 = obj.disk_io_vectors(GRAPH_LEN, self.max_disk_rate)
-        data = [(x + y) / 2 for x, y in zip(d1, d2)]
+        data = obj.disk_io_avg_vector(GRAPH_LEN, self.max_disk_rate)
+        cell.set_property('cache_key', obj.object_key)
         cell.set_property('data_array', data)
 
     def network_traffic_img(self, column_ignore, cell, model, _iter, data):
@@ -1020,6 +1072,6 @@ class vmmManager(vmmGObjectUI):
         if obj is None or not hasattr(obj, "conn"):
             return
 
-        d1, d2 = obj.network_traffic_vectors(GRAPH_LEN, self.max_net_rate)
-        data = [(x + y) / 2 for x, y in zip(d1, d2)]
+        data = obj.network_traffic_avg_vector(GRAPH_LEN, self.max_net_rate)
+        cell.set_property('cache_key', obj.object_key)
         cell.set_property('data_array', data)
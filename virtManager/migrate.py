@@ -430,11 +430,14 @@ class vmmMigrateDialog(vmmGObjectUI):
         srcconn = origvm.conn
         dstconn = origdconn
 
-        vminst = srcconn.get_backend().lookupByName(origvm.get_name())
-        vm = vmmDomain(srcconn, vminst, vminst.UUID())
+        # Run the migration on a pooled source connection, so it doesn't
+        # block polling on the main connection
+        with srcconn.job_pool.job_backend() as srcbackend:
+            vminst = srcbackend.lookupByName(origvm.get_name())
+            vm = vmmDomain(srcconn, vminst, vminst.UUID())
 
-        logging.debug("Migrating vm=%s from %s to %s", vm.get_name(),
-                      srcconn.get_uri(), dstconn.get_uri())
+            logging.debug("Migrating vm=%s from %s to %s", vm.get_name(),
+                          srcconn.get_uri(), dstconn.get_uri())
 
-        vm.migrate(dstconn, migrate_uri, tunnel, unsafe, temporary,
-            meter=meter)
+            vm.migrate(dstconn, migrate_uri, tunnel, unsafe, temporary,
+                meter=meter)
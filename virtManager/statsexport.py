@@ -0,0 +1,453 @@
+# Copyright (C) 2018 Red Hat, Inc.
+#
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import collections
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+
+from .baseclass import vmmGObject
+
+
+###########
+# Formats #
+###########
+
+# _VMStatsRecord attributes that are exported, mapped to metric names
+# and OpenMetrics help text
+_VM_FIELDS = [
+    ("cpuTime", "vm_cpu_time_ns", "VM CPU time in nanoseconds"),
+    ("cpuHostPercent", "vm_cpu_host_percent",
+     "VM CPU usage as a percentage of host CPU"),
+    ("cpuGuestPercent", "vm_cpu_guest_percent",
+     "VM CPU usage as a percentage of its vCPUs"),
+    ("curmem", "vm_memory_kib", "VM current memory in KiB"),
+    ("currMemPercent", "vm_memory_percent",
+     "VM current memory as a percentage of host memory"),
+    ("diskRdRate", "vm_disk_read_kib_per_second", "VM disk read rate"),
+    ("diskWrRate", "vm_disk_write_kib_per_second", "VM disk write rate"),
+    ("netRxRate", "vm_net_rx_kib_per_second", "VM network receive rate"),
+    ("netTxRate", "vm_net_tx_kib_per_second", "VM network transmit rate"),
+]
+
+# vmmConnection._recalculate_stats keys that are exported
+_HOST_FIELDS = [
+    ("cpuTime", "host_vm_cpu_time_ns",
+     "CPU time of all VMs in nanoseconds"),
+    ("cpuHostPercent", "host_cpu_percent",
+     "CPU usage of all VMs as a percentage of host CPU"),
+    ("memory", "host_vm_memory_kib", "Memory of all running VMs in KiB"),
+    ("memoryPercent", "host_memory_percent",
+     "Memory of all running VMs as a percentage of host memory"),
+    ("diskRdRate", "host_disk_read_kib_per_second",
+     "Disk read rate of all VMs"),
+    ("diskWrRate", "host_disk_write_kib_per_second",
+     "Disk write rate of all VMs"),
+    ("netRxRate", "host_net_rx_kib_per_second",
+     "Network receive rate of all VMs"),
+    ("netTxRate", "host_net_tx_kib_per_second",
+     "Network transmit rate of all VMs"),
+]
+
+# Metrics that only ever increase. Everything else is a gauge
+_COUNTER_METRICS = ["vm_cpu_time_ns", "host_vm_cpu_time_ns"]
+
+
+def _format_json(samples):
+    """
+    One JSON object per sample per line
+    """
+    ret = ""
+    for kind, labels, timestamp, values in samples:
+        data = {"type": kind, "timestamp": timestamp}
+        data.update(labels)
+        data.update(values)
+        ret += json.dumps(data, sort_keys=True) + "\n"
+    return ret
+
+
+def _openmetrics_label(value):
+    return str(value).replace("\\", "\\\\").replace(
+        "\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_openmetrics(samples):
+    """
+    A complete OpenMetrics exposition of the passed samples, grouped
+    by metric family and terminated with '# EOF'
+    """
+    families = collections.OrderedDict()
+    for fields in [_VM_FIELDS, _HOST_FIELDS]:
+        for dummy, metric, helptext in fields:
+            families[metric] = (helptext, [])
+
+    for kind, labels, timestamp, values in samples:
+        fields = kind == "vm" and _VM_FIELDS or _HOST_FIELDS
+        labelstr = ",".join('%s="%s"' % (key, _openmetrics_label(labels[key]))
+                            for key in sorted(labels))
+        for field, metric, dummy in fields:
+            if values.get(field) is None:
+                continue
+            families[metric][1].append(
+                "{%s} %s %.3f" % (labelstr, values[field], timestamp))
+
+    ret = ""
+    for metric, (helptext, lines) in families.items():
+        if not lines:
+            continue
+        name = "virt_manager_" + metric
+        samplename = name
+        mtype = "gauge"
+        if metric in _COUNTER_METRICS:
+            samplename += "_total"
+            mtype = "counter"
+        ret += "# TYPE %s %s\n" % (name, mtype)
+        ret += "# HELP %s %s.\n" % (name, helptext)
+        for line in lines:
+            ret += samplename + line + "\n"
+    return ret + "# EOF\n"
+
+
+# format name -> (formatter, whether the output is a snapshot). Snapshot
+# formats describe the latest samples of every connection in one
+# document, which replaces the previous one instead of being appended
+_FORMATS = {
+    "json": (_format_json, False),
+    "openmetrics": (_format_openmetrics, True),
+}
+
+
+###########
+# Targets #
+###########
+
+class _FileTarget(object):
+    """
+    Append samples to a local file, or for snapshot formats replace
+    its contents with each new snapshot
+    """
+    def __init__(self, path, snapshot):
+        self._path = path
+        self._snapshot = snapshot
+        self._fobj = None
+        if not snapshot:
+            self._fobj = open(path, "a")
+
+    def __repr__(self):
+        return "<_FileTarget %s>" % self._path
+
+    def write(self, data):
+        if self._snapshot:
+            # Rename over the old file, so readers never see a partial
+            # snapshot
+            tmppath = self._path + ".tmp"
+            with open(tmppath, "w") as f:
+                f.write(data)
+            os.rename(tmppath, self._path)
+            return
+
+        self._fobj.write(data)
+        self._fobj.flush()
+
+    def has_pending(self):
+        return False
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self._fobj:
+            self._fobj.close()
+
+
+class _UnixSocketTarget(object):
+    """
+    Listen on a UNIX socket. For streaming formats samples are sent to
+    every connected client as they come in. For snapshot formats every
+    client that connects gets the latest snapshot, and is then
+    disconnected, like a scrape.
+
+    Each client has its own output buffer, so a slow reader gets whole
+    records late rather than a record cut off in the middle. Clients
+    that can't keep up are disconnected, rather than letting their
+    backlog grow without bound.
+    """
+    # Max bytes of unsent output per client
+    _MAX_BACKLOG = 1024 * 1024
+
+    def __init__(self, path, snapshot):
+        self._path = path
+        self._snapshot = snapshot
+        if os.path.exists(path):
+            os.unlink(path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(path)
+        self._sock.listen(5)
+        self._sock.setblocking(False)
+        # client socket -> bytearray of unsent output
+        self._clients = {}
+        # Latest snapshot, for snapshot formats
+        self._lastdata = None
+
+    def __repr__(self):
+        return "<_UnixSocketTarget %s>" % self._path
+
+    def _accept_clients(self):
+        if self._snapshot and self._lastdata is None:
+            # Leave scrapes waiting until there's something to send
+            return
+
+        while True:
+            try:
+                client, dummy = self._sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            client.setblocking(False)
+            self._clients[client] = bytearray(self._lastdata or b"")
+            logging.debug("Stats export client connected to %s",
+                          self._path)
+
+    def _drop_client(self, client, reason):
+        logging.debug("Dropping stats export client: %s", reason)
+        self._clients.pop(client)
+        client.close()
+
+    def write(self, data):
+        data = data.encode("utf-8")
+        if self._snapshot:
+            self._lastdata = data
+            self.flush()
+            return
+
+        self._accept_clients()
+        for client, backlog in list(self._clients.items()):
+            if len(backlog) + len(data) > self._MAX_BACKLOG:
+                self._drop_client(client, "output backlog full")
+                continue
+            backlog += data
+        self.flush()
+
+    def has_pending(self):
+        # Snapshot clients connect at any time, so keep accepting
+        return self._snapshot or any(self._clients.values())
+
+    def flush(self):
+        """
+        Accept snapshot clients, and send as much buffered output as
+        each client will take without blocking
+        """
+        if self._snapshot:
+            self._accept_clients()
+
+        for client, backlog in list(self._clients.items()):
+            try:
+                while backlog:
+                    sent = client.send(backlog)
+                    del backlog[:sent]
+            except (BlockingIOError, InterruptedError):
+                continue
+            except (OSError, socket.error) as e:
+                self._drop_client(client, e)
+                continue
+
+            if self._snapshot:
+                self._clients.pop(client)
+                client.close()
+
+    def close(self):
+        for client in self._clients:
+            client.close()
+        self._clients = {}
+        self._sock.close()
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+
+
+def _make_target(target, snapshot):
+    if target.startswith("unix:"):
+        return _UnixSocketTarget(target[len("unix:"):], snapshot)
+    return _FileTarget(target, snapshot)
+
+
+###################
+# Exporter object #
+###################
+
+class vmmStatsExporter(vmmGObject):
+    """
+    Stream the VM stats sampled by vmmStatsManager, and the per
+    connection aggregates from vmmConnection, to a file or UNIX socket
+    so external monitoring can reuse our polling instead of doing its own.
+
+    The tick threads only put samples on a bounded queue. A writer
+    thread formats and writes them. If the target can't keep up, new
+    samples are dropped and counted in 'dropped'.
+
+    Configured with the stats/export-target and stats/export-format
+    gsettings keys. A target of unix:/some/path listens on a UNIX socket,
+    anything else is a file path. The json format is a stream of one
+    object per sample, appended to the file or sent to every socket
+    client. The openmetrics format is a complete exposition of the
+    latest samples of every connection, which replaces the file
+    contents or is sent to each socket client that connects.
+    """
+    _instance = None
+
+    # Max number of queued batches (one batch per connection tick)
+    _BUFFER_SIZE = 64
+    # Seconds between retries sending output a target couldn't take
+    _FLUSH_INTERVAL = .5
+
+    @classmethod
+    def get_instance(cls):
+        if not cls._instance:
+            cls._instance = vmmStatsExporter()
+        return cls._instance
+
+    def __init__(self):
+        vmmGObject.__init__(self)
+
+        self._queue = queue.Queue(self._BUFFER_SIZE)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._thread = None
+        self._target = None
+        self._formatter = None
+        self._snapshot = False
+        # uri -> latest batch, for snapshot formats. Only used by the
+        # writer thread
+        self._latest = collections.OrderedDict()
+
+        self.dropped = 0
+        self.exported = 0
+
+        targetstr = self.config.get_stats_export_target()
+        fmt = self.config.get_stats_export_format()
+        if targetstr:
+            self._setup(targetstr, fmt)
+
+        self._cleanup_on_app_close()
+
+    def _cleanup(self):
+        if self._thread:
+            # The writer may be stuck on a slow target, so never block
+            # here. Pending samples are dropped to make room for the
+            # sentinel, and the writer closes the target itself.
+            while True:
+                try:
+                    self._queue.put_nowait(None)
+                    break
+                except queue.Full:
+                    try:
+                        self._queue.get_nowait()
+                    except queue.Empty:
+                        pass
+            self._thread.join(1)
+            self._thread = None
+        elif self._target:
+            self._target.close()
+        self._target = None
+
+    def _setup(self, targetstr, fmt):
+        if fmt not in _FORMATS:
+            logging.debug("Unknown stats export format '%s', using json",
+                          fmt)
+            fmt = "json"
+        self._formatter, self._snapshot = _FORMATS[fmt]
+
+        try:
+            self._target = _make_target(targetstr, self._snapshot)
+        except Exception:
+            logging.exception("Error setting up stats export to %s",
+                              targetstr)
+            return
+
+        logging.debug("Exporting stats to %s format=%s",
+                      self._target, fmt)
+        self._thread = threading.Thread(target=self._write_thread,
+                                         name="stats exporter")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _format_batch(self, batch):
+        if not self._snapshot:
+            return self._formatter(batch)
+
+        # Every batch is from a single connection
+        self._latest[batch[-1][1]["uri"]] = batch
+        samples = []
+        for connbatch in self._latest.values():
+            samples.extend(connbatch)
+        return self._formatter(samples)
+
+    def _write_thread(self):
+        target = self._target
+        while True:
+            timeout = None
+            if target.has_pending():
+                timeout = self._FLUSH_INTERVAL
+            try:
+                batch = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                try:
+                    target.flush()
+                except Exception:
+                    logging.debug("Error flushing stats export",
+                                  exc_info=True)
+                continue
+            if batch is None:
+                target.close()
+                return
+
+            try:
+                target.write(self._format_batch(batch))
+                self.exported += len(batch)
+            except Exception:
+                logging.debug("Error exporting stats", exc_info=True)
+
+
+    ###############
+    # Public APIs #
+    ###############
+
+    def is_enabled(self):
+        return bool(self._thread)
+
+    def add_vm_sample(self, vm, record):
+        """
+        Called by vmmStatsManager for each new _VMStatsRecord. Samples
+        are held until the connection tick calls add_host_sample.
+        """
+        if not self.is_enabled():
+            return
+        uri = vm.conn.get_uri()
+        labels = {"uri": uri, "vm": vm.get_name(), "uuid": vm.get_uuid()}
+        values = dict((field, getattr(record, field))
+                      for field, dummy, dummy in _VM_FIELDS)
+        with self._lock:
+            self._pending.setdefault(uri, []).append(
+                ("vm", labels, record.timestamp, values))
+
+    def add_host_sample(self, conn, stats):
+        """
+        Called by vmmConnection with the aggregated stats dict for
+        the tick. Queues it with all the VM samples from the same tick.
+        """
+        if not self.is_enabled():
+            return
+        uri = conn.get_uri()
+        with self._lock:
+            batch = self._pending.pop(uri, [])
+        batch.append(("host", {"uri": uri}, stats["timestamp"], stats))
+
+        try:
+            self._queue.put_nowait(batch)
+        except queue.Full:
+            self.dropped += len(batch)
+            logging.debug("Stats export buffer full, dropped=%d",
+                          self.dropped)
@@ -12,6 +12,7 @@ import libvirt
 from virtinst import util
 
 from .baseclass import vmmGObject
+from .statsexport import vmmStatsExporter
 
 
 class _VMStatsRecord(object):
@@ -96,18 +97,17 @@ class _VMStatsList(vmmGObject):
             return 0
         return getattr(self._stats[0], record_name)
 
-    def get_vector(self, record_name, limit, ceil=100.0):
-        vector = []
+    def _get_vector_len(self, limit):
         statslen = self.config.get_stats_history_length() + 1
         if limit is not None:
             statslen = min(statslen, limit)
+        return statslen
 
-        for i in range(statslen):
-            if i < len(self._stats):
-                vector.append(getattr(self._stats[i], record_name) / ceil)
-            else:
-                vector.append(0)
-        return vector
+    def get_vector(self, record_name, limit, ceil=100.0):
+        statslen = self._get_vector_len(limit)
+        vector = [getattr(stats, record_name) / ceil
+                  for stats in self._stats[:statslen]]
+        return vector + [0] * (statslen - len(vector))
 
     def get_in_out_vector(self, name1, name2, limit, ceil):
         if ceil is None:
@@ -115,6 +115,18 @@ class _VMStatsList(vmmGObject):
         return (self.get_vector(name1, limit, ceil=ceil),
                 self.get_vector(name2, limit, ceil=ceil))
 
+    def get_in_out_avg_vector(self, name1, name2, limit, ceil):
+        """
+        Average of the two get_in_out_vector vectors, built in one pass
+        """
+        if ceil is None:
+            ceil = max(self.get_record(name1), self.get_record(name2), 10.0)
+        statslen = self._get_vector_len(limit)
+        ceil = ceil * 2
+        vector = [(getattr(stats, name1) + getattr(stats, name2)) / ceil
+                  for stats in self._stats[:statslen]]
+        return vector + [0] * (statslen - len(vector))
+
 
 class vmmStatsManager(vmmGObject):
     """
@@ -447,6 +459,7 @@ class vmmStatsManager(vmmGObject):
                 diskRdBytes, diskWrBytes,
                 netRxBytes, netTxBytes)
         self.get_vm_statslist(vm).append_stats(newstats)
+        vmmStatsExporter.get_instance().add_vm_sample(vm, newstats)
 
     def cache_all_stats(self, conn):
         self._latest_all_stats = self._get_all_stats(conn)
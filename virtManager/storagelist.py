@@ -41,6 +41,10 @@ POOL_NUM_COLUMNS = 4
 ICON_RUNNING = "state_running"
 ICON_SHUTOFF = "state_shutoff"
 
+# Volumes are listed this many at a time. Building a row needs the
+# volume XML and an in use check, which adds up for big pools
+VOL_PAGE_SIZE = 500
+
 
 def _get_pool_size_percent(pool):
     cap = pool.get_capacity()
@@ -71,6 +75,10 @@ class vmmStorageList(vmmGObjectUI):
         # Name hint passed to addvol. Set by storagebrowser
         self._name_hint = None
 
+        # Number of volumes listed for the selected pool
+        self._vol_page_limit = VOL_PAGE_SIZE
+        self._vol_page_pool = None
+
         self._active_edits = []
         self._addpool = None
         self._addvol = None
@@ -89,6 +97,7 @@ class vmmStorageList(vmmGObjectUI):
             "on_vol_list_button_press_event": self._vol_popup_menu,
             "on_vol_list_changed": self._vol_selected,
             "on_vol_add_clicked": self._vol_add,
+            "on_vol_more_clicked": self._vol_more_clicked,
 
             "on_browse_cancel_clicked": self._cancel_clicked,
             "on_browse_local_clicked": self._browse_local_clicked,
@@ -300,6 +309,7 @@ class vmmStorageList(vmmGObjectUI):
             ICON_SHUTOFF, Gtk.IconSize.BUTTON)
         self.widget("pool-state").set_text(_("Inactive"))
         self.widget("vol-list").get_model().clear()
+        self.widget("vol-page-box").set_visible(False)
         self.widget("pool-autostart").set_label(_("On Boot"))
         self.widget("pool-autostart").set_active(False)
 
@@ -388,56 +398,86 @@ class vmmStorageList(vmmGObjectUI):
         uiutil.set_list_selection(pool_list,
             curpool and curpool.get_connkey() or None)
 
+    def _build_vol_row(self, pool, vol):
+        key = vol.get_connkey()
+
+        try:
+            path = vol.get_target_path()
+            name = vol.get_pretty_name(pool.get_type())
+            cap = str(vol.get_capacity())
+            sizestr = vol.get_pretty_capacity()
+            fmt = vol.get_format() or ""
+        except Exception:
+            logging.debug("Error getting volume info for '%s', "
+                          "hiding it", key, exc_info=True)
+            return None
+
+        namestr = None
+        try:
+            if path:
+                names = DeviceDisk.path_in_use_by(vol.conn.get_backend(),
+                                                   path)
+                namestr = ", ".join(names)
+                if not namestr:
+                    namestr = None
+        except Exception:
+            logging.exception("Failed to determine if storage volume in "
+                              "use.")
+
+        sensitive = True
+        if self._vol_sensitive_cb:
+            sensitive = self._vol_sensitive_cb(fmt)
+
+        row = [None] * VOL_NUM_COLUMNS
+        row[VOL_COLUMN_KEY] = key
+        row[VOL_COLUMN_NAME] = name
+        row[VOL_COLUMN_SIZESTR] = sizestr
+        row[VOL_COLUMN_CAPACITY] = cap
+        row[VOL_COLUMN_FORMAT] = fmt
+        row[VOL_COLUMN_INUSEBY] = namestr
+        row[VOL_COLUMN_SENSITIVE] = sensitive
+        return row
+
+    def _get_sorted_vols(self, pool):
+        vols = pool and pool.get_volumes() or []
+        return sorted(vols, key=lambda v: v.get_connkey())
+
+    def _append_vol_rows(self, pool, vols):
+        model = self.widget("vol-list").get_model()
+        listed = set(row[VOL_COLUMN_KEY] for row in model)
+        for vol in vols:
+            if vol.get_connkey() in listed:
+                continue
+            row = self._build_vol_row(pool, vol)
+            if row:
+                model.append(row)
+
+    def _update_vol_page_label(self, total):
+        shown = min(total, self._vol_page_limit)
+        self.widget("vol-page-box").set_visible(shown < total)
+        self.widget("vol-page-label").set_text(
+            _("Showing %(shown)d of %(total)d volumes") %
+            {"shown": shown, "total": total})
+
     def _populate_vols(self):
         list_widget = self.widget("vol-list")
         pool = self._current_pool()
-        vols = pool and pool.get_volumes() or []
+        vols = self._get_sorted_vols(pool)
         model = list_widget.get_model()
         list_widget.get_selection().unselect_all()
         model.clear()
 
+        # Start from the first page when a different pool is selected
+        poolkey = pool and pool.get_connkey() or None
+        if poolkey != self._vol_page_pool:
+            self._vol_page_pool = poolkey
+            self._vol_page_limit = VOL_PAGE_SIZE
+
         vadj = self.widget("vol-scroll").get_vadjustment()
         vscroll_percent = vadj.get_value() // max(vadj.get_upper(), 1)
 
-        for vol in vols:
-            key = vol.get_connkey()
-
-            try:
-                path = vol.get_target_path()
-                name = vol.get_pretty_name(pool.get_type())
-                cap = str(vol.get_capacity())
-                sizestr = vol.get_pretty_capacity()
-                fmt = vol.get_format() or ""
-            except Exception:
-                logging.debug("Error getting volume info for '%s', "
-                              "hiding it", key, exc_info=True)
-                continue
-
-            namestr = None
-            try:
-                if path:
-                    names = DeviceDisk.path_in_use_by(vol.conn.get_backend(),
-                                                       path)
-                    namestr = ", ".join(names)
-                    if not namestr:
-                        namestr = None
-            except Exception:
-                logging.exception("Failed to determine if storage volume in "
-                                  "use.")
-
-            sensitive = True
-            if self._vol_sensitive_cb:
-                sensitive = self._vol_sensitive_cb(fmt)
-
-            row = [None] * VOL_NUM_COLUMNS
-            row[VOL_COLUMN_KEY] = key
-            row[VOL_COLUMN_NAME] = name
-            row[VOL_COLUMN_SIZESTR] = sizestr
-            row[VOL_COLUMN_CAPACITY] = cap
-            row[VOL_COLUMN_FORMAT] = fmt
-            row[VOL_COLUMN_INUSEBY] = namestr
-            row[VOL_COLUMN_SENSITIVE] = sensitive
-            model.append(row)
+        self._append_vol_rows(pool, vols[:self._vol_page_limit])
+        self._update_vol_page_label(len(vols))
 
         def _reset_vscroll_position():
             vadj.set_value(vadj.get_upper() * vscroll_percent)
@@ -512,6 +552,11 @@ class vmmStorageList(vmmGObjectUI):
         if not pool or pool.get_connkey() != pool_connkey:
             return
 
+        # The new volume may be past the listed pages, so add it
+        vol = pool.get_volume(volname)
+        if vol:
+            self._append_vol_rows(pool, [vol])
+
         # Select the new volume
         uiutil.set_list_selection(self.widget("vol-list"), volname)
 
@@ -519,6 +564,15 @@ class vmmStorageList(vmmGObjectUI):
         ignore = src
         self._enable_pool_apply(EDIT_POOL_AUTOSTART)
 
+    def _vol_more_clicked(self, src):
+        ignore = src
+        pool = self._current_pool()
+        vols = self._get_sorted_vols(pool)
+        start = self._vol_page_limit
+        self._vol_page_limit += VOL_PAGE_SIZE
+        self._append_vol_rows(pool, vols[start:self._vol_page_limit])
+        self._update_vol_page_label(len(vols))
+
     def _vol_selected(self, src):
         model, treeiter = src.get_selected()
         self.widget("vol-delete").set_sensitive(bool(treeiter))
@@ -4,7 +4,9 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import collections
 import logging
+import threading
 import time
 
 from virtinst import pollhelpers
@@ -61,17 +63,27 @@ class vmmStorageVolume(vmmLibvirtObject):
         self._backend.delete(0)
         self._backend = None
 
+    def mark_stale(self):
+        """
+        Called when the parent pool is refreshed. The volume size may
+        have changed, so the XML is refetched the next time it's needed
+        """
+        self._invalidate_xml()
+
 
     #################
     # XML accessors #
     #################
 
+    # Key, path and format don't change for the life of a volume, so
+    # they don't need a refetch of stale XML. That keeps path lookups
+    # across all volumes cheap after a pool refresh.
     def get_key(self):
-        return self.get_xmlobj().key or ""
+        return self.get_xmlobj(refresh_if_nec=False).key or ""
     def get_target_path(self):
-        return self.get_xmlobj().target_path or ""
+        return self.get_xmlobj(refresh_if_nec=False).target_path or ""
     def get_format(self):
-        return self.get_xmlobj().format
+        return self.get_xmlobj(refresh_if_nec=False).format
     def get_capacity(self):
         return self.get_xmlobj().capacity
     def get_allocation(self):
@@ -94,15 +106,42 @@ class vmmStorageVolume(vmmLibvirtObject):
 
 
 class vmmStoragePool(vmmLibvirtObject):
+    """
+    Volumes are cached per pool. A refresh only lists volume names and
+    diffs them against the cache: known volumes are kept and their XML
+    is refetched lazily, XML for new volumes is fetched in the
+    background. Pools with tens of thousands of volumes then don't
+    cost an XMLDesc call per volume on every refresh.
+    """
     __gsignals__ = {
         "refreshed": (vmmLibvirtObject.RUN_FIRST, None, [])
     }
 
+    # Minimum seconds between background volume list refreshes. Refresh
+    # requests that arrive in between are merged into one.
+    _VOLUME_REFRESH_INTERVAL = 2
+    # New volume XML is fetched in batches of this size, with a short
+    # pause in between, so it doesn't hog the connection
+    _VOLUME_LOAD_BATCH = 100
+    _VOLUME_LOAD_PAUSE = .1
+
     def __init__(self, conn, backend, key):
         vmmLibvirtObject.__init__(self, conn, backend, key, StoragePool)
 
         self._last_refresh_time = 0
-        self._volumes = None
+
+        # volume name -> vmmStorageVolume, None if not listed yet
+        self._volume_map = None
+        self._volumes_stale = False
+        self._volumes_closed = False
+        # Protects the pending flag and swapping in a new _volume_map
+        self._volume_lock = threading.Lock()
+        # Held across a whole volume list/diff/swap, so only one thread
+        # lists the pool at a time
+        self._volume_update_lock = threading.Lock()
+        self._volume_refresh_pending = False
+        # Set if a refresh is requested while one is already running
+        self._volume_refresh_again = False
 
 
     ##########################
@@ -138,16 +177,17 @@ class vmmStoragePool(vmmLibvirtObject):
             # shows up while the conn is connected, this means it was
             # just 'defined' recently and doesn't need to be refreshed.
             self.refresh(_from_object_init=True)
-        for vol in self.get_volumes():
-            vol.init_libvirt_state()
+        self._start_volume_load(self.get_volumes())
 
     def _invalidate_xml(self):
         vmmLibvirtObject._invalidate_xml(self)
-        self._volumes = None
+        self._volumes_stale = True
 
     def _cleanup(self):
         vmmLibvirtObject._cleanup(self)
-        self._volumes = None
+        with self._volume_lock:
+            self._volumes_closed = True
+            self._volume_map = None
 
 
     ###########
@@ -188,11 +228,15 @@ class vmmStoragePool(vmmLibvirtObject):
             _from_object_init=_from_object_init)
 
     def refresh_pool_cache_from_event_loop(self, _from_object_init=False):
-        if not _from_object_init:
-            self.ensure_latest_xml()
-        self._update_volumes(force=True)
-        self.idle_emit("refreshed")
-        self._last_refresh_time = time.time()
+        if _from_object_init:
+            # We are in the tick thread, so update the volumes right away
+            self._update_volumes(force=True)
+            self.idle_emit("refreshed")
+            self._last_refresh_time = time.time()
+            return
+
+        self.ensure_latest_xml()
+        self._schedule_volume_refresh()
 
     def secs_since_last_refresh(self):
         return time.time() - self._last_refresh_time
@@ -204,26 +248,124 @@ class vmmStoragePool(vmmLibvirtObject):
 
     def get_volumes(self):
         self._update_volumes(force=False)
-        return self._volumes[:]
+        return list((self._volume_map or {}).values())
 
     def get_volume(self, key):
-        for vol in self.get_volumes():
-            if vol.get_connkey() == key:
-                return vol
-        return None
+        self._update_volumes(force=False)
+        return (self._volume_map or {}).get(key)
 
     def _update_volumes(self, force):
-        if not self.is_active():
-            self._volumes = []
+        """
+        Sync the cached volumes with the pool's volume name listing.
+        Volumes we already know are kept, but marked stale. New volumes
+        are returned so the caller can fetch their XML.
+        """
+        def _cached_is_current():
+            # A queued background refresh will take care of staleness
+            return (not force and self._volume_map is not None and
+                    (not self._volumes_stale or
+                     self._volume_refresh_pending))
+
+        if _cached_is_current():
+            # Don't wait on the lock, a background listing may hold it
+            return []
+
+        with self._volume_update_lock:
+            if not self.is_active():
+                # Make sure we relist if the pool is started again
+                with self._volume_lock:
+                    if not self._volumes_closed:
+                        self._volume_map = None
+                return []
+            if _cached_is_current():
+                return []
+
+            keymap = dict(self._volume_map or {})
+            (ignore, newvols, allvols) = pollhelpers.fetch_volumes(
+                self.conn.get_backend(), self.get_backend(), keymap,
+                lambda obj, key: vmmStorageVolume(self.conn, obj, key))
+            newkeys = set(vol.get_connkey() for vol in newvols)
+            for vol in allvols:
+                if vol.get_connkey() not in newkeys:
+                    vol.mark_stale()
+
+            with self._volume_lock:
+                if self._volumes_closed:
+                    return []
+                self._volume_map = collections.OrderedDict(
+                    (vol.get_connkey(), vol) for vol in allvols)
+                self._volumes_stale = False
+
+        logging.debug("pool=%s volumes=%d new=%d",
+                      self.get_name(), len(allvols), len(newvols))
+        return newvols
+
+    def _schedule_volume_refresh(self):
+        """
+        Refresh the volume list in a background thread, rate limited
+        to one refresh per _VOLUME_REFRESH_INTERVAL
+        """
+        with self._volume_lock:
+            if self._volumes_closed:
+                return
+            if self._volume_refresh_pending:
+                self._volume_refresh_again = True
+                return
+            self._volume_refresh_pending = True
+
+        delay = max(0, self._VOLUME_REFRESH_INTERVAL -
+                    self.secs_since_last_refresh())
+        self._start_thread(target=self._volume_refresh_thread,
+                           name="pool %s volume refresh" % self.get_name(),
+                           args=[delay])
+
+    def _volume_refresh_thread(self, delay):
+        time.sleep(delay)
+        with self._volume_lock:
+            # Requests from here on may miss this listing
+            self._volume_refresh_again = False
+
+        # The pending flag is only cleared once the listing is done.
+        # Until then get_volumes() returns the cached list instead of
+        # listing the pool itself.
+        newvols = []
+        try:
+            newvols = self._update_volumes(force=True)
+        except Exception:
+            logging.debug("Error refreshing volumes for pool=%s",
+                          self.get_name(), exc_info=True)
+        finally:
+            self._last_refresh_time = time.time()
+            with self._volume_lock:
+                self._volume_refresh_pending = False
+                again = self._volume_refresh_again
+
+        if self._volumes_closed:
             return
-        if not force and self._volumes is not None:
+        if again:
+            self._schedule_volume_refresh()
+        self.idle_emit("refreshed")
+        self._load_volumes(newvols)
+
+    def _load_volumes(self, vols):
+        for idx, vol in enumerate(vols):
+            if idx and not idx % self._VOLUME_LOAD_BATCH:
+                time.sleep(self._VOLUME_LOAD_PAUSE)
+            try:
+                vol.get_xmlobj(refresh_if_nec=False)
+            except Exception as e:
+                logging.debug("Fetching XML for volume=%s failed: %s",
+                              vol.get_connkey(), e)
+
+    def _start_volume_load(self, vols):
+        """
+        Prefetch XML for the passed volumes in a background thread
+        """
+        if not vols:
             return
-
-        keymap = dict((o.get_connkey(), o) for o in self._volumes or [])
-        (ignore, ignore, allvols) = pollhelpers.fetch_volumes(
-            self.conn.get_backend(), self.get_backend(), keymap,
-            lambda obj, key: vmmStorageVolume(self.conn, obj, key))
-        self._volumes = allvols
+        self._start_thread(target=self._load_volumes,
+                           name="pool %s volume load" % self.get_name(),
+                           args=[vols])
 
 
     #########################
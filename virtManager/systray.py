@@ -297,11 +297,18 @@ class vmmSystray(vmmGObject):
         conn.connect("vm-added", self._vm_added_cb)
         conn.connect("vm-removed", self._rebuild_menu)
         conn.connect("state-changed", self._rebuild_menu)
+        conn.connect("batch-state-changed", self._rebuild_menu)
         self._rebuild_menu()
 
     def _vm_added_cb(self, conn, connkey):
         vm = conn.get_vm(connkey)
-        vm.connect("state-changed", self._rebuild_menu)
+        vm.connect("state-changed", self._vm_state_changed_cb)
+        self._rebuild_menu()
+
+    def _vm_state_changed_cb(self, vm):
+        if vm.conn.in_state_batch():
+            # The menu is rebuilt once from batch-state-changed
+            return
         self._rebuild_menu()
 
     def _exit_app_cb(self, src):
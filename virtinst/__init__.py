@@ -3,10 +3,12 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
-from virtcli import CLIConfig as _CLIConfig
+import importlib
+import importlib.util
+import sys
 
+from virtcli import CLIConfig as _CLIConfig
 
-# pylint: disable=wrong-import-position
 
 def _setup_i18n():
     import gettext
@@ -23,25 +25,67 @@ def _setup_i18n():
 
 _setup_i18n()
 
-from virtinst import util
-from virtinst.uri import URI
-from virtinst.osdict import OSDB
+# Public names, mapped to the module that defines them. Modules are only
+# imported when one of their names is first accessed, so command line
+# tools only pay for the parts of virtinst they actually use.
+_LAZY_ATTRS = {
+    "URI": "virtinst.uri",
+    "OSDB": "virtinst.osdict",
+
+    "Capabilities": "virtinst.capabilities",
+    "DomainCapabilities": "virtinst.domcapabilities",
+    "Interface": "virtinst.interface",
+    "InterfaceProtocol": "virtinst.interface",
+    "Network": "virtinst.network",
+    "NodeDevice": "virtinst.nodedev",
+    "StoragePool": "virtinst.storage",
+    "StorageVolume": "virtinst.storage",
+
+    "Installer": "virtinst.installer",
+
+    "Guest": "virtinst.guest",
+    "Cloner": "virtinst.cloner",
+    "DomainSnapshot": "virtinst.snapshot",
+
+    "VirtinstConnection": "virtinst.connection",
+    "XMLDiff": "virtinst.xmldiff",
+    "XMLValidator": "virtinst.xmlvalidate",
+}
+
+for _name in ["DomainBlkiotune", "DomainClock", "DomainCpu",
+        "DomainCputune", "DomainFeatures", "DomainIdmap", "DomainMetadata",
+        "DomainMemoryBacking", "DomainMemtune", "DomainNumatune",
+        "DomainOs", "DomainPm", "DomainResource", "DomainSeclabel",
+        "DomainSysinfo", "DomainXMLNSQemu"]:
+    _LAZY_ATTRS[_name] = "virtinst.domain"
+
+for _name in ["DeviceChannel", "DeviceConsole", "DeviceParallel",
+        "DeviceSerial", "DeviceController", "Device", "DeviceDisk",
+        "DeviceFilesystem", "DeviceGraphics", "DeviceHostdev", "DeviceInput",
+        "DeviceInterface", "DeviceMemballoon", "DeviceMemory", "DevicePanic",
+        "DeviceSmartcard", "DeviceSound", "DeviceRedirdev", "DeviceRng",
+        "DeviceTpm", "DeviceVideo", "DeviceWatchdog"]:
+    _LAZY_ATTRS[_name] = "virtinst.devices"
+
 
-from virtinst.domain import *  # pylint: disable=wildcard-import
+def __getattr__(name):
+    if name in _LAZY_ATTRS:
+        ret = getattr(importlib.import_module(_LAZY_ATTRS[name]), name)
+        globals()[name] = ret
+        return ret
 
-from virtinst.capabilities import Capabilities
-from virtinst.domcapabilities import DomainCapabilities
-from virtinst.interface import Interface, InterfaceProtocol
-from virtinst.network import Network
-from virtinst.nodedev import NodeDevice
-from virtinst.storage import StoragePool, StorageVolume
+    # Submodules, like virtinst.util, which used to always be imported
+    if (not name.startswith("_") and
+        importlib.util.find_spec("virtinst." + name)):
+        return importlib.import_module("virtinst." + name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
-from virtinst.devices import *  # pylint: disable=wildcard-import
 
-from virtinst.installer import Installer
+def __dir__():
+    return sorted(list(globals().keys()) + list(_LAZY_ATTRS.keys()))
 
-from virtinst.guest import Guest
-from virtinst.cloner import Cloner
-from virtinst.snapshot import DomainSnapshot
 
-from virtinst.connection import VirtinstConnection
+# Module __getattr__ is only supported since python 3.7
+if sys.version_info < (3, 7):
+    for _name in _LAZY_ATTRS:
+        __getattr__(_name)
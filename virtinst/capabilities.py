@@ -214,8 +214,11 @@ class Capabilities(XMLBuilder):
     def __init__(self, *args, **kwargs):
         XMLBuilder.__init__(self, *args, **kwargs)
         self._cpu_models_cache = {}
+        self._lookup_cache = {}
+        self._lookup_generation = None
 
     XML_NAME = "capabilities"
+    _XML_INTERN = True
 
     host = XMLChildProperty(_CapsHost, is_single=True)
     guests = XMLChildProperty(_CapsGuest)
@@ -236,6 +239,52 @@ class Capabilities(XMLBuilder):
 
         return False
 
+    def _get_lookup_cache(self):
+        """
+        Return the dict holding guest_lookup indexes and results. It's
+        thrown away if the capabilities XML is changed.
+        """
+        # pylint: disable=protected-access
+        generation = self._xmlstate.render.generation
+        if generation != self._lookup_generation:
+            self._lookup_cache = {}
+            self._lookup_generation = generation
+        return self._lookup_cache
+
+    def _get_guest_index(self):
+        """
+        Map (os_type, arch) to the first matching guest, with None
+        meaning any value
+        """
+        cache = self._get_lookup_cache()
+        if "guests" not in cache:
+            index = {}
+            for g in self.guests:
+                for key in [(g.os_type, g.arch), (g.os_type, None),
+                            (None, g.arch), (None, None)]:
+                    index.setdefault(key, g)
+            cache["guests"] = index
+        return cache["guests"]
+
+    def _get_domains_by_type(self, guest):
+        """
+        Map hypervisor type to the list of the guest's domains
+        """
+        index = self._get_lookup_cache().setdefault("domtypes", {})
+        if guest not in index:
+            ret = {}
+            for d in guest.domains:
+                ret.setdefault(d.hypervisor_type, []).append(d)
+            index[guest] = ret
+        return index[guest]
+
+    def _get_machine_names(self, guest, domain):
+        index = self._get_lookup_cache().setdefault("machines", {})
+        key = (guest, domain)
+        if key not in index:
+            index[key] = set(guest.all_machine_names(domain))
+        return index[key]
+
 
     ##############
     # Public API #
@@ -274,25 +323,23 @@ class Capabilities(XMLBuilder):
         if arch is None:
             archs = [self.host.cpu.arch, None]
 
+        index = self._get_guest_index()
         for a in archs:
-            for g in self.guests:
-                if ((os_type is None or g.os_type == os_type) and
-                    (a is None or g.arch == a)):
-                    return g
+            g = index.get((os_type, a))
+            if g:
+                return g
 
     def _bestDomainType(self, guest, dtype, machine):
         """
         Return the recommended domain for use if the user does not explicitly
         request one.
         """
-        domains = []
-        for d in guest.domains:
-            if dtype and d.hypervisor_type != dtype.lower():
-                continue
-            if machine and machine not in guest.all_machine_names(d):
-                continue
-
-            domains.append(d)
+        domains = guest.domains
+        if dtype:
+            domains = self._get_domains_by_type(guest).get(dtype.lower(), [])
+        if machine:
+            domains = [d for d in domains if
+                       machine in self._get_machine_names(guest, d)]
 
         if not domains:
             return None
@@ -336,6 +383,12 @@ class Capabilities(XMLBuilder):
         if os_type == "linux":
             os_type = "xen"
 
+        # Guest.lookup_capsinfo and the UI repeat the same lookups a lot
+        cachekey = (os_type, arch, typ, machine)
+        memo = self._get_lookup_cache().setdefault("capsinfo", {})
+        if cachekey in memo:
+            return memo[cachekey]
+
         guest = self._guestForOSType(os_type, arch)
         if not guest:
             archstr = _("for arch '%s'") % arch
@@ -361,4 +414,5 @@ class Capabilities(XMLBuilder):
                                 'arch': guest.arch, 'machine': machinestr})
 
         capsinfo = _CapsInfo(self.conn, guest, domain)
+        memo[cachekey] = capsinfo
         return capsinfo
@@ -9,13 +9,16 @@
 
 import argparse
 import collections
+import json
 import logging
 import logging.handlers
+import operator
 import os
 import re
 import shlex
 import subprocess
 import sys
+import threading
 import traceback
 
 import libvirt
@@ -34,6 +37,10 @@ from .storage import StoragePool, StorageVolume
 # Global option handling #
 ##########################
 
+# --check options that are off unless explicitly enabled
+_OPTIN_CHECKS = ["schema"]
+
+
 class _GlobalState(object):
     def __init__(self):
         self.quiet = False
@@ -48,8 +55,9 @@ class _GlobalState(object):
         if self.all_checks is not None:
             return self.all_checks
 
-        # Default to True for all checks
-        return self._validation_checks.get(checkname, True)
+        # Default to True for all checks, except the opt-in ones
+        return self._validation_checks.get(checkname,
+                                           checkname not in _OPTIN_CHECKS)
 
 
 _globalstate = None
@@ -258,9 +266,37 @@ def fail(msg, do_exit=True):
         _fail_exit()
 
 
+# Per thread list of captured print_stdout messages, see
+# start_stdout_capture
+_stdout_capture = threading.local()
+
+
 def print_stdout(msg, do_force=False):
     if do_force or not get_global_state().quiet:
-        print(msg)
+        captured = getattr(_stdout_capture, "lines", None)
+        if captured is not None:
+            captured.append(msg)
+        else:
+            print(msg)
+
+
+def start_stdout_capture():
+    """
+    Collect print_stdout output of the calling thread instead of printing
+    it, so batch operations running in parallel can print each entry's
+    output in one piece
+    """
+    _stdout_capture.lines = []
+
+
+def stop_stdout_capture():
+    """
+    Stop capturing for the calling thread, and return the list of
+    captured messages. They already passed the quiet check.
+    """
+    lines = getattr(_stdout_capture, "lines", None) or []
+    _stdout_capture.lines = None
+    return lines
 
 
 def print_stderr(msg):
@@ -292,6 +328,49 @@ def install_fail(guest):
     sys.exit(1)
 
 
+class BatchErrorCollector(logging.Handler):
+    """
+    Remember the last error logged by each thread, so fail() messages
+    can be reported in the summary of batch operations
+    """
+    def __init__(self):
+        logging.Handler.__init__(self, logging.ERROR)
+        self.errors = {}
+
+    def emit(self, record):
+        self.errors[record.thread] = record.getMessage()
+
+    def pop(self, thread_id):
+        return self.errors.pop(thread_id, None)
+
+
+def read_batch_file(path):
+    """
+    Read the input file of a batch operation. It's parsed as YAML if
+    the filename ends with .yaml or .yml, JSON otherwise.
+    """
+    try:
+        with open(path) as f:
+            content = f.read()
+    except IOError as e:
+        fail(_("Error reading batch file '%s': %s") % (path, e))
+
+    if path.endswith(".yaml") or path.endswith(".yml"):
+        try:
+            import yaml  # pylint: disable=import-error
+        except ImportError:
+            fail(_("Reading YAML batch files requires python yaml bindings"))
+        try:
+            return yaml.safe_load(content)
+        except yaml.YAMLError as e:
+            fail(_("Error parsing batch file '%s': %s") % (path, e))
+
+    try:
+        return json.loads(content)
+    except ValueError as e:
+        fail(_("Error parsing batch file '%s': %s") % (path, e))
+
+
 def set_prompt(prompt):
     # Set whether we allow prompts, or fail if a prompt pops up
     if prompt:
@@ -742,8 +821,31 @@ def _on_off_convert(key, val):
     raise fail(_("%(key)s must be 'yes' or 'no'") % {"key": key})
 
 
-def _set_attribute(obj, attr, val):  # pylint: disable=unused-argument
-    exec("obj." + attr + " = val ")  # pylint: disable=exec-used
+# Map of dotted virtinst attribute path, like 'source.path', to
+# (getter, parent getter, leaf name)
+_ATTRIBUTE_ACCESSORS = {}
+
+
+def _get_attribute_accessors(attr):
+    ret = _ATTRIBUTE_ACCESSORS.get(attr)
+    if ret is None:
+        parent, dummy, name = attr.rpartition(".")
+        ret = (operator.attrgetter(attr),
+               parent and operator.attrgetter(parent) or None,
+               name)
+        _ATTRIBUTE_ACCESSORS[attr] = ret
+    return ret
+
+
+def _get_attribute(obj, attr):
+    return _get_attribute_accessors(attr)[0](obj)
+
+
+def _set_attribute(obj, attr, val):
+    dummy, parentgetter, name = _get_attribute_accessors(attr)
+    if parentgetter:
+        obj = parentgetter(obj)
+    setattr(obj, name, val)
 
 
 class _VirtCLIArgumentStatic(object):
@@ -797,16 +899,75 @@ class _VirtCLIArgumentStatic(object):
         self.is_novalue = is_novalue
         self.find_inst_cb = find_inst_cb
 
-    def match_name(self, cliname):
+    def get_names(self):
         """
-        Return True if the passed argument name matches this
-        VirtCLIArgument. So for an option like --foo bar=X, this
-        checks if we are the parser for 'bar'
+        Return the cliname and all aliases. These may be regexes,
+        like seclabel[0-9]*.model
         """
-        for argname in [self.cliname] + util.listify(self.aliases):
-            if re.match("^%s$" % argname, cliname):
-                return True
-        return False
+        return [self.cliname] + util.listify(self.aliases)
+
+
+# Characters that mark a cliname as a regex rather than a plain name.
+# '.' is deliberately not included, it's used as a literal separator
+# in names like source.path
+_WILDCARD_CHARS = set("[]*+?()|{}^$\\")
+
+
+class _VirtCLIArgumentLookup(object):
+    """
+    Precompiled cliname -> _VirtCLIArgumentStatic dispatch for a
+    VirtCLIParser. Plain names are found with a dict lookup, all the
+    wildcard names like seclabel[0-9]*.model are combined into a
+    single compiled regex. If multiple args match a name, the first
+    registered one wins.
+    """
+    def __init__(self, virtargs):
+        self.virtargs = virtargs[:]
+        self._literals = {}
+        self._groups = {}
+        self._cache = {}
+
+        patterns = []
+        for idx, virtarg in enumerate(self.virtargs):
+            for argname in virtarg.get_names():
+                if not (_WILDCARD_CHARS & set(argname)):
+                    self._literals.setdefault(argname, idx)
+                    continue
+                groupname = "g%d" % len(patterns)
+                self._groups[groupname] = idx
+                patterns.append("(?P<%s>%s)" % (groupname, argname))
+
+        self._regex = None
+        if patterns:
+            self._regex = re.compile("|".join(patterns))
+
+    def _lookup_index(self, cliname):
+        idx = self._literals.get(cliname)
+        if self._regex:
+            match = self._regex.fullmatch(cliname)
+            if match:
+                regexidx = self._groups[match.lastgroup]
+                if idx is None or regexidx < idx:
+                    idx = regexidx
+        return idx
+
+    def lookup_index(self, cliname):
+        """
+        Return the registration index of the virtarg that handles
+        @cliname, or None
+        """
+        if cliname not in self._cache:
+            self._cache[cliname] = self._lookup_index(cliname)
+        return self._cache[cliname]
+
+    def lookup(self, cliname):
+        """
+        Return the virtarg that handles @cliname, or None
+        """
+        idx = self.lookup_index(cliname)
+        if idx is None:
+            return None
+        return self.virtargs[idx]
 
 
 class _VirtCLIArgument(object):
@@ -857,7 +1018,7 @@ class _VirtCLIArgument(object):
 
         try:
             if self.attrname:
-                eval("inst." + self.attrname)  # pylint: disable=eval-used
+                _get_attribute(inst, self.attrname)
         except AttributeError:
             raise RuntimeError("programming error: obj=%s does not have "
                                "member=%s" % (inst, self.attrname))
@@ -893,8 +1054,7 @@ class _VirtCLIArgument(object):
             return self._virtarg.lookup_cb(parser,
                                            inst, self.val, self)
         else:
-            return eval(  # pylint: disable=eval-used
-                "inst." + self.attrname) == self.val
+            return _get_attribute(inst, self.attrname) == self.val
 
 
 def parse_optstr_tuples(optstr):
@@ -924,10 +1084,10 @@ def parse_optstr_tuples(optstr):
     return ret
 
 
-def _parse_optstr_to_dict(optstr, virtargs, remove_first):
+def _parse_optstr_to_dict(optstr, virtarglookup, remove_first):
     """
     Parse the passed argument string into an OrderedDict WRT
-    the passed list of VirtCLIArguments and their special handling.
+    the passed _VirtCLIArgumentLookup and their special handling.
 
     So for --disk path=foo,size=5, optstr is 'path=foo,size=5', and
     we return {"path": "foo", "size": "5"}
@@ -945,10 +1105,7 @@ def _parse_optstr_to_dict(optstr, virtargs, remove_first):
         else:
             optdict[cliname] = val
 
-    def _lookup_virtarg(cliname):
-        for virtarg in virtargs:
-            if virtarg.match_name(cliname):
-                return virtarg
+    _lookup_virtarg = virtarglookup.lookup
 
     def _consume_comma_arg(commaopt):
         while opttuples:
@@ -1021,6 +1178,7 @@ class VirtCLIParser(object):
     support_cb = None
     cli_arg_name = None
     _virtargs = []
+    _virtarglookup = None
 
     @classmethod
     def add_arg(cls, *args, **kwargs):
@@ -1031,6 +1189,28 @@ class VirtCLIParser(object):
             cls._virtargs = [_VirtCLIArgumentStatic(
                 None, "clearxml", cb=cls._clearxml_cb, is_onoff=True)]
         cls._virtargs.append(_VirtCLIArgumentStatic(*args, **kwargs))
+        cls._clear_virtarg_lookup()
+
+    @classmethod
+    def _clear_virtarg_lookup(cls):
+        """
+        Drop the compiled lookup after _virtargs changed. Subclasses
+        like ParserSerial share their parent's _virtargs list but compile
+        their own lookup, so clear theirs too
+        """
+        cls._virtarglookup = None
+        for subclass in cls.__subclasses__():
+            subclass._clear_virtarg_lookup()  # pylint: disable=protected-access
+
+    @classmethod
+    def _get_virtarg_lookup(cls):
+        """
+        Return the compiled _VirtCLIArgumentLookup for this class,
+        building it on first use
+        """
+        if cls._virtarglookup is None:
+            cls._virtarglookup = _VirtCLIArgumentLookup(cls._virtargs)
+        return cls._virtarglookup
 
     @classmethod
     def print_introspection(cls):
@@ -1067,7 +1247,8 @@ class VirtCLIParser(object):
         self.guest = guest
         self.optstr = optstr
         self.optdict = _parse_optstr_to_dict(self.optstr,
-                self._virtargs, util.listify(self.remove_first)[:])
+                self._get_virtarg_lookup(),
+                util.listify(self.remove_first)[:])
 
     def _clearxml_cb(self, inst, val, virtarg):
         """
@@ -1123,14 +1304,18 @@ class VirtCLIParser(object):
         Convert the passed optdict to a list of instantiated
         VirtCLIArguments to actually interact with
         """
-        ret = []
-        for virtargstatic in self._virtargs:
-            for key in list(optdict.keys()):
-                if virtargstatic.match_name(key):
-                    arginst = _VirtCLIArgument(virtargstatic,
-                                               key, optdict.pop(key))
-                    ret.append(arginst)
-        return ret
+        lookup = self._get_virtarg_lookup()
+        matches = []
+        for key in list(optdict.keys()):
+            idx = lookup.lookup_index(key)
+            if idx is not None:
+                matches.append((idx, key, optdict.pop(key)))
+
+        # Process params in virtarg registration order, the same
+        # key order is kept for params that map to the same virtarg
+        matches.sort(key=lambda m: m[0])
+        return [_VirtCLIArgument(lookup.virtargs[idx], key, val)
+                for idx, key, val in matches]
 
     def _check_leftover_opts(self, optdict):
         """
@@ -1263,6 +1448,8 @@ ParseCLICheck.add_arg(None, "disk_size", is_onoff=True,
                       cb=ParseCLICheck.set_cb)
 ParseCLICheck.add_arg(None, "path_exists", is_onoff=True,
                       cb=ParseCLICheck.set_cb)
+ParseCLICheck.add_arg(None, "schema", is_onoff=True,
+                      cb=ParseCLICheck.set_cb)
 ParseCLICheck.add_arg("all_checks", "all", is_onoff=True)
 
 
@@ -56,6 +56,7 @@ class VirtinstConnection(object):
         self._libvirtconn = None
         self._uriobj = URI(self._uri)
         self._caps = None
+        self._domcaps_cache = {}
 
         self._support_cache = {}
         self._fetch_cache = {}
@@ -92,6 +93,17 @@ class VirtinstConnection(object):
         return self._caps
     caps = property(_get_caps)
 
+    def get_domain_capabilities_xml(self, emulator, arch, machine, hvtype):
+        """
+        Cached getDomainCapabilities call. The XML only depends on the
+        passed params, so many guests built on one connection can share it
+        """
+        key = (emulator, arch, machine, hvtype)
+        if key not in self._domcaps_cache:
+            self._domcaps_cache[key] = (
+                self._libvirtconn.getDomainCapabilities(*key))
+        return self._domcaps_cache[key]
+
     def get_conn_for_api_arg(self):
         return self._libvirtconn
 
@@ -110,6 +122,7 @@ class VirtinstConnection(object):
         self._libvirtconn = None
         self._uri = None
         self._fetch_cache = {}
+        self._domcaps_cache = {}
         return ret
 
     def fake_conn_predictable(self):
@@ -117,6 +130,7 @@ class VirtinstConnection(object):
 
     def invalidate_caps(self):
         self._caps = None
+        self._domcaps_cache = {}
 
     def is_open(self):
         return bool(self._libvirtconn)
@@ -140,7 +140,7 @@ class DomainCapabilities(XMLBuilder):
         if conn.check_support(
                 conn.SUPPORT_CONN_DOMAIN_CAPABILITIES):
             try:
-                xml = conn.getDomainCapabilities(emulator, arch,
+                xml = conn.get_domain_capabilities_xml(emulator, arch,
                     machine, hvtype)
             except Exception:
                 logging.debug("Error fetching domcapabilities XML",
@@ -234,6 +234,7 @@ class DomainCapabilities(XMLBuilder):
 
 
     XML_NAME = "domainCapabilities"
+    _XML_INTERN = True
     os = XMLChildProperty(_OS, is_single=True)
     cpu = XMLChildProperty(_CPU, is_single=True)
     devices = XMLChildProperty(_Devices, is_single=True)
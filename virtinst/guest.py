@@ -54,13 +54,70 @@ class _DomainDevices(XMLBuilder):
     panic = XMLChildProperty(DevicePanic)
     memory = XMLChildProperty(DeviceMemory)
 
+    def __init__(self, *args, **kwargs):
+        # Combined list of all devices, and lookup tables built from it.
+        # Rebuilt lazily after any device is added or removed
+        self._all_devices = None
+        self._lookup_maps = {}
+        XMLBuilder.__init__(self, *args, **kwargs)
+
+    def _child_list_changed(self, propname):
+        XMLBuilder._child_list_changed(self, propname)
+        self._all_devices = None
+        self._lookup_maps = {}
+
+    def _get_all_devices(self):
+        if self._all_devices is None:
+            retlist = []
+            # pylint: disable=protected-access
+            devtypes = _DomainDevices._XML_PROP_ORDER
+            for devtype in devtypes:
+                retlist.extend(getattr(self, devtype))
+            self._all_devices = retlist
+        return self._all_devices
+
+    def _lookup(self, mapname, keycb, key):
+        """
+        Return the device where keycb(dev) == key, using a lazily built
+        lookup table. Device properties can change without us knowing,
+        so a stale hit or a miss rebuilds the table once before giving up.
+        """
+        if not key:
+            return None
+        for rebuild in [False, True]:
+            if rebuild or mapname not in self._lookup_maps:
+                lookupmap = {}
+                for dev in self._get_all_devices():
+                    devkey = keycb(dev)
+                    if devkey and devkey not in lookupmap:
+                        lookupmap[devkey] = dev
+                self._lookup_maps[mapname] = lookupmap
+
+            dev = self._lookup_maps[mapname].get(key)
+            if dev and keycb(dev) == key:
+                return dev
+        return None
+
     def get_all(self):
-        retlist = []
-        # pylint: disable=protected-access
-        devtypes = _DomainDevices._XML_PROP_ORDER
-        for devtype in devtypes:
-            retlist.extend(getattr(self, devtype))
-        return retlist
+        return self._get_all_devices()[:]
+
+    def find_by_alias(self, name):
+        """
+        Return the device with <alias name=@name>, or None
+        """
+        return self._lookup("alias", lambda d: d.alias.name, name)
+
+    def find_by_target(self, target):
+        """
+        Return the device with target @target, or None. That's the
+        target dev of disks and interfaces, and filesystem target dir.
+        """
+        def _get_target(dev):
+            if dev.DEVICE_TYPE in ["disk", "filesystem"]:
+                return dev.target
+            if dev.DEVICE_TYPE == "interface":
+                return dev.target_dev
+        return self._lookup("target", _get_target, target)
 
 
 class Guest(XMLBuilder):
@@ -373,7 +430,7 @@ class Guest(XMLBuilder):
             self.features.hyperv_spinlocks_retries = None
             for i in self.clock.timers:
                 if i.name == "hypervclock":
-                    self.clock.timers.remove(i)
+                    self.clock.remove_child(i)
 
     def has_spice(self):
         for gfx in self.devices.graphics:
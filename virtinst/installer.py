@@ -16,6 +16,7 @@ from .devices import DeviceDisk
 from .domain import DomainOs
 from .installertreemedia import InstallerTreeMedia
 from . import util
+from .xmlvalidate import XMLValidator
 
 
 class Installer(object):
@@ -52,6 +53,10 @@ class Installer(object):
         # Entry point for virt-manager 'Customize' wizard to change autostart
         self.autostart = False
 
+        # Validate the generated XML against libvirt's installed relaxng
+        # schemas before handing it to libvirt
+        self.validate_schema = False
+
         self._install_bootdev = install_bootdev
         self._install_kernel = None
         self._install_initrd = None
@@ -313,8 +318,24 @@ class Installer(object):
             (install_xml and ("\n" + install_xml) or "None required"))
         logging.debug("Generated boot XML: \n%s", final_xml)
 
+        if self.validate_schema:
+            self._validate_schema(install_xml, final_xml)
         return install_xml, final_xml
 
+    def _validate_schema(self, install_xml, final_xml):
+        validator = XMLValidator()
+        if not validator.is_supported():
+            logging.debug("libvirt relaxng schemas not found in %s, "
+                          "skipping schema validation", validator.schemadir)
+            return
+
+        xmls = [final_xml]
+        names = [_("Boot XML")]
+        if install_xml and install_xml != final_xml:
+            xmls.insert(0, install_xml)
+            names.insert(0, _("Install XML"))
+        validator.check(xmls, names=names)
+
     def _manual_transient_create(self, install_xml, final_xml, needs_boot):
         """
         For hypervisors (like vz) that don't implement createXML,
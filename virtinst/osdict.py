@@ -8,12 +8,24 @@
 # See the COPYING file in the top-level directory.
 
 import datetime
+import json
 import logging
+import os
 import re
+import tempfile
 
-import gi
-gi.require_version('Libosinfo', '1.0')
-from gi.repository import Libosinfo as libosinfo
+from . import util
+
+
+def _libosinfo():
+    """
+    Import Libosinfo on first use. With the OS index, most commands
+    never need it, and gobject introspection is expensive at startup
+    """
+    import gi
+    gi.require_version('Libosinfo', '1.0')
+    from gi.repository import Libosinfo
+    return Libosinfo
 
 
 ###################
@@ -88,13 +100,110 @@ def _sort(tosort):
     return retlist
 
 
+########################
+# Precompiled OS index #
+########################
+
+# Bump this when the index format changes
+_INDEX_VERSION = 1
+
+
+def _get_osinfo_db_dirs():
+    """
+    The directories libosinfo process_default_path() loads data from
+    """
+    confdir = (os.environ.get("XDG_CONFIG_HOME") or
+               os.path.expanduser("~/.config"))
+    return [
+        os.environ.get("OSINFO_SYSTEM_DIR", "/usr/share/osinfo"),
+        os.environ.get("OSINFO_DATA_DIR", "/usr/share/libosinfo/db"),
+        os.environ.get("OSINFO_LOCAL_DIR", "/etc/osinfo"),
+        os.environ.get("OSINFO_USER_DIR", os.path.join(confdir, "osinfo")),
+    ]
+
+
+def _get_osinfo_db_signature():
+    """
+    Return the newest mtime and the file count of every osinfo-db
+    directory. Any change to the database will change the signature.
+    """
+    ret = []
+    for dbdir in _get_osinfo_db_dirs():
+        newest = 0
+        count = 0
+        for dirpath, dummy, filenames in os.walk(dbdir):
+            for path in [dirpath] + [os.path.join(dirpath, f)
+                                     for f in filenames]:
+                try:
+                    newest = max(newest, os.stat(path).st_mtime)
+                except OSError:
+                    continue
+                count += 1
+        ret.append([dbdir, newest, count])
+    return ret
+
+
+def _glib_date_to_str(glibdate):
+    if glibdate is None:
+        return None
+    return "%s-%s" % (glibdate.get_year(), glibdate.get_day_of_year())
+
+
+def _make_index_entry(o, devices, devmap):
+    """
+    Convert the libosinfo Os object to an index entry. Device info is
+    stored in the shared @devices list, and referenced by position
+    """
+    def _resources(reslist):
+        ret = []
+        for i in range(reslist.get_length()):
+            r = reslist.get_nth(i)
+            ret.append([r.get_architecture(), r.get_ram(), r.get_cpu(),
+                        r.get_n_cpus(), r.get_storage()])
+        return ret
+
+    devidx = []
+    devlist = o.get_all_devices()
+    for i in range(devlist.get_length()):
+        dev = devlist.get_nth(i)
+        key = (dev.get_id(), dev.get_class(), dev.get_name())
+        if key not in devmap:
+            devmap[key] = len(devices)
+            devices.append(list(key))
+        devidx.append(devmap[key])
+
+    return {
+        "full_id": o.get_id(),
+        "name": o.get_short_id(),
+        "label": o.get_name(),
+        "codename": o.get_codename() or "",
+        "distro": o.get_distro() or "",
+        "version": o.get_version(),
+        "family": o.get_family(),
+        "eol_date": _glib_date_to_str(o.get_eol_date()),
+        "release_date": _glib_date_to_str(o.get_release_date()),
+        "devices": devidx,
+        "minimum_resources": _resources(o.get_minimum_resources()),
+        "recommended_resources": _resources(
+            o.get_recommended_resources()),
+    }
+
+
 class _OSDB(object):
     """
     Entry point for the public API
+
+    OS info is read from a compact index of the osinfo-db content, cached
+    on disk and rebuilt whenever the osinfo-db files change. The full
+    libosinfo database is only loaded when something needs the real
+    libosinfo objects, like media detection or OS relationships.
     """
-    def __init__(self):
+    def __init__(self, index_path=None):
+        self._index_path = index_path
         self.__os_loader = None
         self.__all_variants = None
+        self.__full_id_map = None
+        self.__sorted_list = None
 
     # This is only for back compatibility with pre-libosinfo support.
     # This should never change.
@@ -154,14 +263,75 @@ class _OSDB(object):
         ret = {}
 
         # Generic variant
-        v = _OsVariant(None)
+        v = _OsVariant(None, None, None)
         ret[v.name] = v
         return ret
 
+    def _get_index_path(self):
+        if self._index_path:
+            return self._index_path
+        if "VIRTINST_TEST_SUITE" in os.environ:
+            return None
+        return os.path.join(util.get_cache_dir(), "osinfo-index.json")
+
+    def _build_index(self):
+        devices = []
+        devmap = {}
+        oses = []
+        oslist = self._os_loader.get_db().get_os_list()
+        for idx in range(oslist.get_length()):
+            oses.append(_make_index_entry(oslist.get_nth(idx),
+                                          devices, devmap))
+        return {"version": _INDEX_VERSION, "oses": oses, "devices": devices}
+
+    def _read_index(self, path, signature):
+        try:
+            with open(path) as f:
+                index = json.load(f)
+        except (IOError, OSError, ValueError) as e:
+            logging.debug("Error reading OS index %s: %s", path, e)
+            return None
+
+        if (index.get("version") != _INDEX_VERSION or
+            index.get("signature") != signature):
+            logging.debug("OS index %s is out of date", path)
+            return None
+        return index
+
+    def _write_index(self, path, index):
+        try:
+            dirname = os.path.dirname(path)
+            if not os.path.exists(dirname):
+                os.makedirs(dirname, 0o751)
+            fd, tmppath = tempfile.mkstemp(dir=dirname,
+                                           prefix=".osinfo-index")
+            with os.fdopen(fd, "w") as f:
+                json.dump(index, f)
+            os.rename(tmppath, path)
+        except (IOError, OSError) as e:
+            logging.debug("Error writing OS index %s: %s", path, e)
+
+    def _load_index(self):
+        path = self._get_index_path()
+        if not path:
+            return self._build_index()
+
+        signature = _get_osinfo_db_signature()
+        index = self._read_index(path, signature)
+        if not index:
+            logging.debug("Building OS index %s", path)
+            index = self._build_index()
+            index["signature"] = signature
+            self._write_index(path, index)
+        return index
+
+    def _lookup_libosinfo_os(self, full_id):
+        return self._os_loader.get_db().get_os(full_id)
+
     @property
     def _os_loader(self):
         if not self.__os_loader:
-            loader = libosinfo.Loader()
+            loader = _libosinfo().Loader()
             loader.process_default_path()
 
             self.__os_loader = loader
@@ -170,26 +340,31 @@ class _OSDB(object):
     @property
     def _all_variants(self):
         if not self.__all_variants:
-            loader = self._os_loader
+            index = self._load_index()
             allvariants = self._make_default_variants()
-            db = loader.get_db()
-            oslist = db.get_os_list()
-            for os in range(oslist.get_length()):
-                osi = _OsVariant(oslist.get_nth(os))
+            for entry in index["oses"]:
+                osi = _OsVariant(entry, index["devices"],
+                                 self._lookup_libosinfo_os)
                 allvariants[osi.name] = osi
 
             self.__all_variants = allvariants
         return self.__all_variants
 
+    @property
+    def _full_id_map(self):
+        if not self.__full_id_map:
+            self.__full_id_map = dict(
+                (osobj.full_id, osobj) for osobj in
+                self._all_variants.values() if osobj.full_id)
+        return self.__full_id_map
+
 
     ###############
     # Public APIs #
     ###############
 
     def lookup_os_by_full_id(self, full_id):
-        for osobj in self._all_variants.values():
-            if osobj.full_id == full_id:
-                return osobj
+        return self._full_id_map.get(full_id)
 
     def lookup_os(self, key):
         if key in self._aliases:
@@ -202,7 +377,7 @@ class _OSDB(object):
         return self._all_variants.get(key)
 
     def lookup_os_by_media(self, location):
-        media = libosinfo.Media.create_from_location(location, None)
+        media = _libosinfo().Media.create_from_location(location, None)
         ret = self._os_loader.get_db().guess_os_from_media(media)
         if not (ret and len(ret) > 0 and ret[0]):
             return None
@@ -220,12 +395,9 @@ class _OSDB(object):
         """
         List all OSes in the DB
         """
-        sortmap = {}
-
-        for name, osobj in self._all_variants.items():
-            sortmap[name] = osobj
-
-        return _sort(sortmap)
+        if self.__sorted_list is None:
+            self.__sorted_list = _sort(dict(self._all_variants))
+        return self.__sorted_list[:]
 
     def latest_regex(self, regex):
         """
@@ -245,36 +417,58 @@ class _OSDB(object):
 #####################
 
 class _OsVariant(object):
-    def __init__(self, o):
-        self._os = o
-        self._family = self._os and self._os.get_family() or None
-
-        self.full_id = self._os and self._os.get_id() or None
-        self.name = self._os and self._os.get_short_id() or "generic"
-        self.label = self._os and self._os.get_name() or "Generic default"
-        self.codename = self._os and self._os.get_codename() or ""
-        self.distro = self._os and self._os.get_distro() or ""
-        self.version = self._os and self._os.get_version() or None
-
-        self.eol = self._get_eol()
+    """
+    OS info built from an index entry. @devices is the shared device
+    table of the index, and @lookup_cb looks up the libosinfo Os object
+    by full_id, for the few APIs that need it.
+    """
+    def __init__(self, entry, devices, lookup_cb):
+        entry = entry or {}
+        self.__os = None
+        self._lookup_cb = lookup_cb
+        self._family = entry.get("family")
+        self._devices = [devices[i] for i in entry.get("devices", [])]
+        self._minimum_resources = entry.get("minimum_resources", [])
+        self._recommended_resources = entry.get(
+            "recommended_resources", [])
+
+        self.full_id = entry.get("full_id")
+        self.name = entry.get("name") or "generic"
+        self.label = entry.get("label") or "Generic default"
+        self.codename = entry.get("codename", "")
+        self.distro = entry.get("distro", "")
+        self.version = entry.get("version")
+
+        self.eol = self._get_eol(entry.get("eol_date"),
+                                 entry.get("release_date"))
 
     def __repr__(self):
         return "<%s name=%s>" % (self.__class__.__name__, self.name)
 
+    @property
+    def _os(self):
+        """
+        The libosinfo Os object, only loaded when first needed
+        """
+        if self.__os is None and self.full_id:
+            self.__os = self._lookup_cb(self.full_id)
+        return self.__os
+
 
     ########################
     # Internal helper APIs #
     ########################
 
-    def _is_related_to(self, related_os_list, os=None,
+    def _is_related_to(self, related_os_list, osobj=None,
             check_derives=True, check_upgrades=True, check_clones=True):
-        os = os or self._os
-        if not os:
+        osobj = osobj or self._os
+        if not osobj:
             return False
 
-        if os.get_short_id() in related_os_list:
+        if osobj.get_short_id() in related_os_list:
             return True
 
+        relationship = _libosinfo().ProductRelationship
         check_list = []
         def _extend(newl):
             for obj in newl:
@@ -282,18 +476,18 @@ class _OsVariant(object):
                     check_list.append(obj)
 
         if check_derives:
-            _extend(os.get_related(
-                libosinfo.ProductRelationship.DERIVES_FROM).get_elements())
+            _extend(osobj.get_related(
+                relationship.DERIVES_FROM).get_elements())
         if check_clones:
-            _extend(os.get_related(
-                libosinfo.ProductRelationship.CLONES).get_elements())
+            _extend(osobj.get_related(
+                relationship.CLONES).get_elements())
         if check_upgrades:
-            _extend(os.get_related(
-                libosinfo.ProductRelationship.UPGRADES).get_elements())
+            _extend(osobj.get_related(
+                relationship.UPGRADES).get_elements())
 
         for checkobj in check_list:
             if (checkobj.get_short_id() in related_os_list or
-                self._is_related_to(related_os_list, os=checkobj,
+                self._is_related_to(related_os_list, osobj=checkobj,
                     check_upgrades=check_upgrades,
                     check_derives=check_derives,
                     check_clones=check_clones)):
@@ -301,21 +495,15 @@ class _OsVariant(object):
 
         return False
 
-    def _get_all_devices(self):
-        if not self._os:
-            return []
-        devlist = self._os.get_all_devices()
-        return [devlist.get_nth(i) for i in range(devlist.get_length())]
-
     def _device_filter(self, devids=None, cls=None):
         ret = []
         devids = devids or []
-        for dev in self._get_all_devices():
-            if devids and dev.get_id() not in devids:
+        for devid, devclass, devname in self._devices:
+            if devids and devid not in devids:
                 continue
-            if cls and not re.match(cls, dev.get_class()):
+            if cls and not re.match(cls, devclass):
                 continue
-            ret.append(dev.get_name())
+            ret.append(devname)
         return ret
 
 
@@ -323,12 +511,8 @@ class _OsVariant(object):
     # Cached APIs #
     ###############
 
-    def _get_eol(self):
-        eol = self._os and self._os.get_eol_date() or None
-        rel = self._os and self._os.get_release_date() or None
-
-        def _glib_to_datetime(glibdate):
-            date = "%s-%s" % (glibdate.get_year(), glibdate.get_day_of_year())
+    def _get_eol(self, eol, rel):
+        def _glib_to_datetime(date):
             return datetime.datetime.strptime(date, "%Y-%j")
 
         now = datetime.datetime.today()
@@ -347,7 +531,7 @@ class _OsVariant(object):
     ###############
 
     def is_generic(self):
-        return self._os is None
+        return self.full_id is None
 
     def is_windows(self):
         return self._family in ['win9x', 'winnt', 'win16']
@@ -373,7 +557,7 @@ class _OsVariant(object):
 
     def supports_usbtablet(self):
         # If no OS specified, still default to tablet
-        if not self._os:
+        if self.is_generic():
             return True
 
         devids = ["http://usb.org/usb/80ee/0021"]
@@ -425,7 +609,7 @@ class _OsVariant(object):
 
     def get_recommended_resources(self, guest):
         ret = {}
-        if not self._os:
+        if self.is_generic():
             return ret
 
         def read_resource(resources, minimum, arch):
@@ -434,23 +618,21 @@ class _OsVariant(object):
             ram_scale = minimum and 2 or 1
             n_cpus_scale = minimum and 2 or 1
             storage_scale = minimum and 2 or 1
-            for i in range(resources.get_length()):
-                r = resources.get_nth(i)
-                if r.get_architecture() == arch:
-                    ret["ram"] = r.get_ram() * ram_scale
-                    ret["cpu"] = r.get_cpu()
-                    ret["n-cpus"] = r.get_n_cpus() * n_cpus_scale
-                    ret["storage"] = r.get_storage() * storage_scale
+            for r_arch, ram, cpu, n_cpus, storage in resources:
+                if r_arch == arch:
+                    ret["ram"] = ram * ram_scale
+                    ret["cpu"] = cpu
+                    ret["n-cpus"] = n_cpus * n_cpus_scale
+                    ret["storage"] = storage * storage_scale
                     break
 
         # libosinfo may miss the recommended resources block for some OS,
         # in this case read first the minimum resources (if present)
         # and use them.
-        read_resource(self._os.get_minimum_resources(), True, "all")
-        read_resource(self._os.get_minimum_resources(), True, guest.os.arch)
-        read_resource(self._os.get_recommended_resources(), False, "all")
-        read_resource(self._os.get_recommended_resources(),
-            False, guest.os.arch)
+        read_resource(self._minimum_resources, True, "all")
+        read_resource(self._minimum_resources, True, guest.os.arch)
+        read_resource(self._recommended_resources, False, "all")
+        read_resource(self._recommended_resources, False, guest.os.arch)
 
         # QEMU TCG doesn't gain anything by having extra VCPUs
         if guest.type == "qemu":
@@ -43,6 +43,7 @@ class DomainSnapshot(XMLBuilder):
 
 
     XML_NAME = "domainsnapshot"
+    _XML_INTERN = True
     _XML_PROP_ORDER = ["name", "description", "creationTime"]
 
     name = XMLProperty("./name")
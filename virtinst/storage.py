@@ -624,6 +624,7 @@ class StorageVolume(_StorageObject):
     ##################
 
     XML_NAME = "volume"
+    _XML_INTERN = True
     _XML_PROP_ORDER = ["name", "key", "capacity", "allocation", "format",
                        "target_path", "permissions"]
 
@@ -293,6 +293,7 @@ SUPPORT_DOMAIN_MANAGED_SAVE = _make(
     function="virDomain.hasManagedSaveImage",
     run_args=(0,))
 SUPPORT_DOMAIN_JOB_INFO = _make(function="virDomain.jobInfo", run_args=())
+SUPPORT_DOMAIN_JOB_STATS = _make(function="virDomain.jobStats", run_args=(0,))
 SUPPORT_DOMAIN_LIST_SNAPSHOTS = _make(
     function="virDomain.listAllSnapshots", run_args=())
 SUPPORT_DOMAIN_MEMORY_STATS = _make(
@@ -4,10 +4,18 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
-import libxml2
+import copy
+import os
+import xml.etree.ElementTree as ET
+from xml.parsers import expat
 
 from . import util
 
+try:
+    import libxml2
+except ImportError:
+    libxml2 = None
+
 # pylint: disable=protected-access
 
 
@@ -371,4 +379,365 @@ class _Libxml2API(_XMLBase):
         parentnode.addChild(libxml2.newText(endtext))
 
 
-XMLAPI = _Libxml2API
+#######################
+# ElementTree backend #
+#######################
+
+# Cache of parsed xpath strings. The set of xpaths virtinst uses is
+# fixed by its XMLProperty definitions, so this stays small
+_XPATH_CACHE = {}
+
+
+def _parse_xpath(xpath):
+    ret = _XPATH_CACHE.get(xpath)
+    if ret is None:
+        ret = [_XPathSegment(s) for s in xpath.split("/")]
+        _XPATH_CACHE[xpath] = ret
+    return ret
+
+
+def _etree_parse(xml):
+    """
+    Parse XML with expat's namespace processing turned off, so prefixed
+    tag names and xmlns attributes are kept exactly as written. That's
+    what allows us to roundtrip XML the same way libxml2 does.
+    """
+    builder = ET.TreeBuilder(insert_comments=True)
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = builder.start
+    parser.EndElementHandler = builder.end
+    parser.CharacterDataHandler = builder.data
+    parser.CommentHandler = builder.comment
+    parser.Parse(xml, True)
+    return builder.close()
+
+
+def _escape_nonascii(text):
+    # Matches libxml2, which char escapes non-ascii content when
+    # serializing a node without an explicit encoding
+    if text.isascii():
+        return text
+    return "".join(c if ord(c) < 0x80 else "&#x%X;" % ord(c) for c in text)
+
+
+def _escape_text(text):
+    return _escape_nonascii(text.replace("&", "&amp;").replace(
+        "<", "&lt;").replace(">", "&gt;").replace("\r", "&#13;"))
+
+
+def _escape_attr(text):
+    return _escape_nonascii(text.replace("&", "&amp;").replace(
+        "<", "&lt;").replace(">", "&gt;").replace("\"", "&quot;").replace(
+        "\n", "&#10;").replace("\r", "&#13;").replace("\t", "&#9;"))
+
+
+def _is_nsdef(attrname):
+    return attrname == "xmlns" or attrname.startswith("xmlns:")
+
+
+def _etree_serialize(node, out):
+    if node.tag is ET.Comment:
+        out.append("<!--%s-->" % node.text)
+        return
+
+    out.append("<" + node.tag)
+    # Like libxml2, namespace definitions come before other attributes
+    items = node.attrib.items()
+    for key, val in items:
+        if _is_nsdef(key):
+            out.append(" %s=\"%s\"" % (key, _escape_attr(val)))
+    for key, val in items:
+        if not _is_nsdef(key):
+            out.append(" %s=\"%s\"" % (key, _escape_attr(val)))
+
+    if not len(node) and not node.text:
+        out.append("/>")
+        return
+
+    out.append(">")
+    if node.text:
+        out.append(_escape_text(node.text))
+    for child in node:
+        _etree_serialize(child, out)
+        if child.tail:
+            out.append(_escape_text(child.tail))
+    out.append("</%s>" % node.tag)
+
+
+class _ETreeAPI(_XMLBase):
+    """
+    XML backend on top of the stdlib ElementTree, with a small xpath
+    evaluator that handles exactly the xpath subset _XPathSegment
+    supports. Whitespace, comments, attribute order and namespace
+    prefixes are preserved, so output matches the libxml2 backend.
+    """
+    def __init__(self, xml=None, root=None):
+        _XMLBase.__init__(self)
+        if root is None:
+            root = _etree_parse(xml)
+        self._root = root
+
+    def _sanitize_xml(self, xml):
+        if not xml.endswith("\n") and "\n" in xml:
+            xml += "\n"
+        return xml
+
+    def copy_api(self):
+        # No need for the serialize + reparse libxml2 does
+        return _ETreeAPI(root=copy.deepcopy(self._root))
+
+
+    ###################
+    # xpath evaluator #
+    ###################
+
+    def _resolve_ns(self, node, nsmap):
+        """
+        Return the in scope prefix -> URI map for @node, given the
+        map for its parent
+        """
+        newmap = None
+        for key, val in node.attrib.items():
+            if key.startswith("xmlns:"):
+                if newmap is None:
+                    newmap = nsmap.copy()
+                newmap[key[6:]] = val
+        return newmap or nsmap
+
+    def _name_matches(self, seg, node, nsmap):
+        tag = node.tag
+        if not seg.nsname:
+            return tag == seg.nodename
+        prefix, dummy, name = tag.rpartition(":")
+        if name != seg.nodename or not prefix:
+            return False
+        uri = self.NAMESPACES.get(seg.nsname)
+        if uri is None:
+            return prefix == seg.nsname
+        return nsmap.get(prefix) == uri
+
+    def _eval(self, segments, first_only):
+        """
+        Return a list of (node, nsmap) matching the xpath segments.
+        Predicates like [2] and [@foo='bar'] are applied per parent, the
+        same as real xpath.
+        """
+        nodes = [(self._root, self._resolve_ns(self._root, {}))]
+        for seg in segments:
+            if seg.nodename == "." and not seg.nsname:
+                continue
+            if seg.is_prop:
+                nodes = [n for n in nodes if seg.nodename in n[0].attrib]
+                continue
+
+            newnodes = []
+            for node, nsmap in nodes:
+                pos = 0
+                for child in node:
+                    if not isinstance(child.tag, str):
+                        continue
+                    childns = self._resolve_ns(child, nsmap)
+                    if not self._name_matches(seg, child, childns):
+                        continue
+                    if (seg.condition_prop and
+                        child.get(seg.condition_prop) != seg.condition_val):
+                        continue
+                    pos += 1
+                    if seg.condition_num and pos != seg.condition_num:
+                        continue
+                    newnodes.append((child, childns))
+            nodes = newnodes
+            if not nodes:
+                break
+
+        if first_only:
+            return nodes[:1]
+        return nodes
+
+    def _find(self, fullxpath):
+        xpath = _XPath(fullxpath).xpath
+        if not xpath:
+            return None
+        ret = self._eval(_parse_xpath(xpath), True)
+        if not ret:
+            return None
+        return ret[0][0]
+
+    def count(self, xpath):
+        return len(self._eval(_parse_xpath(xpath), False))
+
+    def _get_parent(self, node):
+        for parent in self._root.iter():
+            for child in parent:
+                if child is node:
+                    return parent
+        return None
+
+
+    ##################
+    # Node accessors #
+    ##################
+
+    def _node_tostring(self, node):
+        out = []
+        _etree_serialize(node, out)
+        return "".join(out)
+    def _node_from_xml(self, xml):
+        return _etree_parse(xml)
+
+    def _node_get_text(self, node):
+        return "".join(node.itertext())
+    def _node_set_text(self, node, setval):
+        del node[:]
+        node.text = setval
+
+    def _node_get_property(self, node, propname):
+        return node.get(propname)
+    def _node_set_property(self, node, propname, setval):
+        if setval is None:
+            node.attrib.pop(propname, None)
+        else:
+            node.set(propname, setval)
+
+    def _node_new(self, xpathseg, parentnode):
+        if not xpathseg.nsname:
+            return ET.Element(xpathseg.nodename)
+
+        newnode = ET.Element("%s:%s" % (xpathseg.nsname, xpathseg.nodename))
+        nsattr = "xmlns:%s" % xpathseg.nsname
+        parent = parentnode
+        while parent is not None:
+            if nsattr in parent.attrib:
+                return newnode
+            parent = self._get_parent(parent)
+        newnode.set(nsattr, self.NAMESPACES[xpathseg.nsname])
+        return newnode
+
+    def node_clear(self, xpath):
+        node = self._find(xpath)
+        if node is not None:
+            for key in list(node.attrib):
+                if not _is_nsdef(key):
+                    node.attrib.pop(key)
+            del node[:]
+            node.text = None
+
+    def _node_has_content(self, node):
+        return bool(len(node) or node.text or
+                    [k for k in node.attrib if not _is_nsdef(k)])
+
+
+    ##########################
+    # Whitespace bookkeeping #
+    ##########################
+
+    # libxml2 stores whitespace as text nodes, ElementTree as the
+    # .text/.tail of elements. These helpers map the libxml2 backend's
+    # text node handling onto that, so we indent added and removed
+    # nodes identically
+
+    def _append_text(self, parentnode, text):
+        if len(parentnode):
+            parentnode[-1].tail = (parentnode[-1].tail or "") + text
+        else:
+            parentnode.text = (parentnode.text or "") + text
+
+    def _last_text(self, parentnode):
+        if len(parentnode):
+            return parentnode[-1].tail
+        return parentnode.text
+
+    def _prev_text(self, node):
+        parent = self._get_parent(node)
+        if parent is None:
+            return None
+        idx = list(parent).index(node)
+        if idx == 0:
+            return parent.text
+        return parent[idx - 1].tail
+
+    def _node_remove_child(self, parentnode, childnode):
+        children = list(parentnode)
+        idx = children.index(childnode)
+
+        # Drop preceding whitespace, keep the text that followed the node
+        if idx == 0:
+            parentnode.text = childnode.tail
+        else:
+            children[idx - 1].tail = childnode.tail
+        parentnode.remove(childnode)
+
+        if not len(parentnode):
+            parentnode.text = None
+
+    def _node_add_child(self, parentxpath, parentnode, newnode):
+        ignore = parentxpath
+        if not self._last_text(parentnode):
+            self._append_text(parentnode,
+                              self._prev_text(parentnode) or "\n")
+
+        endtext = self._last_text(parentnode)
+        self._append_text(parentnode, "  ")
+        newnode.tail = endtext
+        parentnode.append(newnode)
+
+
+#####################
+# Backend selection #
+#####################
+
+_BACKENDS = {
+    "etree": _ETreeAPI,
+}
+if libxml2:
+    _BACKENDS["libxml2"] = _Libxml2API
+
+
+def get_backends():
+    """
+    Return the names of all available XML backends
+    """
+    return sorted(_BACKENDS.keys())
+
+
+def get_backend():
+    """
+    Return the name of the currently selected XML backend
+    """
+    for name, cls in _BACKENDS.items():
+        if cls is XMLAPI:
+            return name
+
+
+def set_backend(name):
+    """
+    Select the XML backend used for all XML parsed or built after
+    this call. Can also be set with the VIRTINST_XML_BACKEND
+    environment variable.
+    """
+    global XMLAPI
+    if name not in _BACKENDS:
+        raise ValueError("Unknown XML backend '%s', available: %s" %
+                         (name, ", ".join(get_backends())))
+    XMLAPI = _BACKENDS[name]
+
+
+def make_xmlapi(xml):
+    """
+    Parse the passed XML string with the currently selected backend
+    """
+    return XMLAPI(xml)
+
+
+def register_namespace(nsname, uri):
+    _XMLBase.register_namespace(nsname, uri)
+
+
+def get_namespace_uri(nsname):
+    return _XMLBase.NAMESPACES[nsname]
+
+
+XMLAPI = libxml2 and _Libxml2API or _ETreeAPI
+if os.environ.get("VIRTINST_XML_BACKEND"):
+    set_backend(os.environ["VIRTINST_XML_BACKEND"])
@@ -8,12 +8,16 @@
 # See the COPYING file in the top-level directory.
 
 import collections
+import hashlib
 import logging
 import os
 import re
 import string  # pylint: disable=deprecated-module
+import threading
+import weakref
 
-from .xmlapi import XMLAPI
+from .xmlapi import (get_backend, get_namespace_uri, make_xmlapi,
+        register_namespace)
 from . import util
 
 
@@ -34,6 +38,7 @@ class _XMLPropertyCache(object):
     def __init__(self):
         self._name_to_prop = {}
         self._prop_to_name = {}
+        self._render_order = {}
 
     def _get_prop_cache(self, cls, checkclass):
         cachename = str(cls) + "-" + checkclass.__name__
@@ -56,6 +61,36 @@ class _XMLPropertyCache(object):
     def get_prop_name(self, propinst):
         return self._prop_to_name[propinst]
 
+    def get_render_order(self, inst):
+        """
+        Return the order XMLBuilder._do_add_parse_bits writes props in,
+        compiled once per class: (head, headkeys, tail). head is a list
+        of (propname, prop, is_child) for everything in _XML_PROP_ORDER.
+        Any other set XMLProperty follows in the order it was set, then
+        tail, the (propname, prop) of remaining child props sorted by name.
+        """
+        # Device extends _XML_PROP_ORDER per instance, so key on that too
+        cachekey = (inst.__class__, len(inst._XML_PROP_ORDER))
+        if cachekey not in self._render_order:
+            xmlprops = self.get_xml_props(inst)
+            childprops = self.get_child_props(inst)
+
+            head = []
+            headkeys = set()
+            for key in inst._XML_PROP_ORDER:
+                if key in headkeys:
+                    continue
+                headkeys.add(key)
+                if key in childprops:
+                    head.append((key, childprops[key], True))
+                else:
+                    head.append((key, xmlprops[key], False))
+
+            tail = [(key, childprops[key]) for key in sorted(childprops)
+                    if key not in headkeys]
+            self._render_order[cachekey] = (head, headkeys, tail)
+        return self._render_order[cachekey]
+
 
 _PropCache = _XMLPropertyCache()
 
@@ -65,13 +100,25 @@ class _XMLChildList(list):
     Little wrapper for a list containing XMLChildProperty output.
     This is just to insert a dynamically created add_new() function
     which instantiates and appends a new child object
+
+    The list is a read only snapshot, cached by the XMLBuilder until
+    add_child/remove_child replace it, so repeated property access
+    doesn't copy anything. Modifying it raises an error, since changes
+    wouldn't make it into the XML anyways.
     """
     def __init__(self, childclass, copylist, xmlbuilder):
-        list.__init__(self)
+        list.__init__(self, copylist)
         self._childclass = childclass
         self._xmlbuilder = xmlbuilder
-        for i in copylist:
-            self.append(i)
+
+    def _readonly(self, *args, **kwargs):
+        ignore = args
+        ignore = kwargs
+        raise RuntimeError("programming error: XMLChildProperty lists "
+                           "are read only, use add_child/remove_child")
+    append = extend = insert = remove = pop = clear = _readonly
+    sort = reverse = _readonly
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
 
     def new(self):
         """
@@ -141,9 +188,13 @@ class XMLChildProperty(_XMLPropertyBase):
     def _fget(self, xmlbuilder):
         if self.is_single:
             return self._get(xmlbuilder)
-        return _XMLChildList(self.child_class,
-                             self._get(xmlbuilder),
-                             xmlbuilder)
+        ret = xmlbuilder._childlists.get(self.propname)
+        if ret is None:
+            ret = _XMLChildList(self.child_class,
+                                self._get(xmlbuilder),
+                                xmlbuilder)
+            xmlbuilder._childlists[self.propname] = ret
+        return ret
 
     def clear(self, xmlbuilder):
         if self.is_single:
@@ -154,12 +205,16 @@ class XMLChildProperty(_XMLPropertyBase):
 
     def insert(self, xmlbuilder, newobj, idx):
         self._get(xmlbuilder).insert(idx, newobj)
+        xmlbuilder._child_list_changed(self.propname)
     def append(self, xmlbuilder, newobj):
         self._get(xmlbuilder).append(newobj)
+        xmlbuilder._child_list_changed(self.propname)
     def remove(self, xmlbuilder, obj):
         self._get(xmlbuilder).remove(obj)
+        xmlbuilder._child_list_changed(self.propname)
     def set(self, xmlbuilder, obj):
         xmlbuilder._propstore[self.propname] = obj
+        xmlbuilder._mark_dirty()
 
     def get_prop_xpath(self, _xmlbuilder, obj):
         return self.relative_xpath + "/" + obj.XML_NAME
@@ -263,6 +318,7 @@ class XMLProperty(_XMLPropertyBase):
         if self.propname in propstore:
             del(propstore[self.propname])
         propstore[self.propname] = val
+        xmlbuilder._mark_dirty(self.propname)
 
     def _nonxml_fget(self, xmlbuilder):
         """
@@ -331,14 +387,104 @@ class XMLProperty(_XMLPropertyBase):
         xmlbuilder._xmlstate.xmlapi.set_xpath_content(xpath, setval)
 
 
+class _XMLRenderState(object):
+    """
+    Shared by every _XMLState using the same xmlapi document. The
+    generation is bumped whenever the document or a propstore of any
+    XMLBuilder rooted in it changes, so cached get_xml output can be
+    validated without walking the object tree.
+
+    builddoc is the private document a build mode get_xml renders into.
+    It's kept between calls so later renders only need to write props
+    changed in place, and dropped on any structural change.
+    """
+    def __init__(self):
+        self.generation = 0
+        self.builddoc = None
+
+
+class _CopyOnWriteXMLAPI(object):
+    """
+    Wrapper around an xmlapi document handed out by _XMLInternPool,
+    which may be shared with other XMLBuilder objects parsed from the
+    same XML. Reads go straight to the shared document. The first write
+    switches to a private copy, so the other users never see it.
+
+    Every _XMLState in an XMLBuilder tree shares the one wrapper, so
+    the switch is transparent to child objects.
+    """
+    def __init__(self, xmlapi):
+        self._xmlapi = xmlapi
+        self._shared = True
+
+    def _writable(self):
+        if self._shared:
+            self._xmlapi = self._xmlapi.copy_api()
+            self._shared = False
+        return self._xmlapi
+
+    def is_shared(self):
+        return self._shared
+
+    def copy_api(self):
+        return self._xmlapi.copy_api()
+    def count(self, xpath):
+        return self._xmlapi.count(xpath)
+    def get_xml(self, xpath):
+        return self._xmlapi.get_xml(xpath)
+    def get_xpath_content(self, xpath, is_bool):
+        return self._xmlapi.get_xpath_content(xpath, is_bool)
+
+    def set_xpath_content(self, xpath, setval):
+        self._writable().set_xpath_content(xpath, setval)
+    def node_add_xml(self, xml, xpath):
+        self._writable().node_add_xml(xml, xpath)
+    def node_force_remove(self, fullxpath):
+        self._writable().node_force_remove(fullxpath)
+    def node_clear(self, xpath):
+        self._writable().node_clear(xpath)
+
+
+class _XMLInternPool(object):
+    """
+    Parsed xmlapi documents keyed by a hash of the XML content, for
+    XMLBuilder classes with _XML_INTERN set. Identical documents, like
+    the same capabilities or volume XML fetched over and over, are only
+    parsed once and share their nodes until someone modifies them.
+
+    Documents are weakly referenced, they are freed when the last
+    XMLBuilder using them goes away or switches to a private copy.
+    """
+    def __init__(self):
+        self._docs = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def get_xmlapi(self, xml):
+        data = xml
+        if not isinstance(data, bytes):
+            data = data.encode("utf-8")
+        key = (get_backend(), hashlib.sha256(data).hexdigest())
+        with self._lock:
+            xmlapi = self._docs.get(key)
+        if xmlapi is None:
+            xmlapi = make_xmlapi(xml)
+            with self._lock:
+                xmlapi = self._docs.setdefault(key, xmlapi)
+        return _CopyOnWriteXMLAPI(xmlapi)
+
+
+_InternPool = _XMLInternPool()
+
+
 class _XMLState(object):
     def __init__(self, root_name, parsexml, parentxmlstate,
-                 relative_object_xpath):
+                 relative_object_xpath, intern=False):
         self._root_name = root_name
+        self._intern = intern
         self._namespace = ""
         if ":" in self._root_name:
             ns = self._root_name.split(":")[0]
-            self._namespace = " xmlns:%s='%s'" % (ns, XMLAPI.NAMESPACES[ns])
+            self._namespace = " xmlns:%s='%s'" % (ns, get_namespace_uri(ns))
 
         # xpath of this object relative to its parent. So for a standalone
         # <disk> this is empty, but if the disk is the forth one in a <domain>
@@ -352,6 +498,7 @@ class _XMLState(object):
             parentxmlstate and parentxmlstate.abs_xpath()) or ""
 
         self.xmlapi = None
+        self.render = None
         self.is_build = not parsexml and not parentxmlstate
         self.parse(parsexml, parentxmlstate)
 
@@ -359,8 +506,13 @@ class _XMLState(object):
         if parentxmlstate:
             self.is_build = parentxmlstate.is_build or self.is_build
             self.xmlapi = parentxmlstate.xmlapi
+            self.render = parentxmlstate.render
+            self.render.generation += 1
             return
 
+        # Stub documents aren't worth sharing
+        intern = self._intern and bool(parsexml)
+
         # Make sure passed in XML has required xmlns inserted
         if not parsexml:
             parsexml = "<%s%s/>" % (self._root_name, self._namespace)
@@ -369,10 +521,14 @@ class _XMLState(object):
                     "<" + self._root_name + self._namespace)
 
         try:
-            self.xmlapi = XMLAPI(parsexml)
+            if intern:
+                self.xmlapi = _InternPool.get_xmlapi(parsexml)
+            else:
+                self.xmlapi = make_xmlapi(parsexml)
         except Exception:
             logging.debug("Error parsing xml=\n%s", parsexml)
             raise
+        self.render = _XMLRenderState()
 
     def set_relative_object_xpath(self, xpath):
         self._relative_object_xpath = xpath or ""
@@ -421,9 +577,14 @@ class XMLBuilder(object):
     # https://bugzilla.redhat.com/show_bug.cgi?id=1184131
     _XML_SANITIZE = False
 
+    # Share the parsed document with other objects of the class parsed
+    # from identical XML, see _XMLInternPool. For classes that are mostly
+    # parsed for reading, and whose XML tends to be fetched repeatedly.
+    _XML_INTERN = False
+
     @staticmethod
     def register_namespace(nsname, uri):
-        XMLAPI.register_namespace(nsname, uri)
+        register_namespace(nsname, uri)
 
 
     def __init__(self, conn, parsexml=None,
@@ -447,9 +608,24 @@ class XMLBuilder(object):
             parsexml = "".join([c for c in parsexml if c in string.printable])
 
         self._propstore = collections.OrderedDict()
+
+        # Names of props set since their value was last written to the
+        # backing XML, or None if they all need writing. And the names of
+        # props whose last write put a value in the XML rather than
+        # removing it. See _do_add_parse_bits
+        self._dirty_props = None
+        self._rendered_props = set()
+        # (render state, generation, get_xml output) of the last get_xml
+        # call. The render state is part of the key since add_child and
+        # remove_child move us to a document with its own counter
+        self._xml_cache = None
+        # propname -> cached _XMLChildList for XMLChildProperty access
+        self._childlists = {}
+
         self._xmlstate = _XMLState(self.XML_NAME,
                                    parsexml, parentxmlstate,
-                                   relative_object_xpath)
+                                   relative_object_xpath,
+                                   intern=self._XML_INTERN)
 
         self._validate_xmlbuilder()
         self._initial_child_parse()
@@ -512,15 +688,37 @@ class XMLBuilder(object):
         """
         Return XML string of the object
         """
+        render = self._xmlstate.render
+        generation = render.generation
+        if (self._xml_cache and
+            self._xml_cache[0] is render and
+            self._xml_cache[1] == generation):
+            return self._xml_cache[2]
+
         xmlapi = self._xmlstate.xmlapi
+        dirty_only = True
+        track = True
         if self._xmlstate.is_build:
-            xmlapi = xmlapi.copy_api()
+            if self._xmlstate.abs_xpath() != ".":
+                # Child of an object built from scratch, the parent's
+                # document doesn't contain us yet. Render into a
+                # throwaway copy
+                xmlapi = xmlapi.copy_api()
+                dirty_only = False
+                track = False
+            elif render.builddoc and self._can_render_dirty():
+                xmlapi = render.builddoc
+            else:
+                xmlapi = xmlapi.copy_api()
+                render.builddoc = xmlapi
+                dirty_only = False
 
-        self._add_parse_bits(xmlapi)
+        self._add_parse_bits(xmlapi, dirty_only, track)
         ret = xmlapi.get_xml(self._xmlstate.make_abs_xpath("."))
 
         if ret and not ret.endswith("\n"):
             ret += "\n"
+        self._xml_cache = (render, generation, ret)
         return ret
 
     def clear(self, leave_stub=False):
@@ -534,6 +732,7 @@ class XMLBuilder(object):
         props += list(self._all_child_props().values())
         for prop in props:
             prop.clear(self)
+        self._mark_dirty()
 
         is_child = bool(re.match(r"^.*\[\d+\]$", self._xmlstate.abs_xpath()))
         if is_child or leave_stub:
@@ -644,6 +843,9 @@ class XMLBuilder(object):
         Set new backing XML objects in ourselves and all our child props
         """
         self._xmlstate.parse(*args, **kwargs)
+        self._dirty_props = None
+        self._rendered_props = set()
+        self._xml_cache = None
         for propname in self._all_child_props():
             for p in util.listify(getattr(self, propname, [])):
                 p._parse_with_children(None, self._xmlstate)
@@ -686,6 +888,26 @@ class XMLBuilder(object):
         obj._parse_with_children(xml, None)
         self._xmlstate.xmlapi.node_force_remove(xpath)
         self._set_child_xpaths()
+        self._mark_dirty()
+
+    def _mark_dirty(self, propname=None):
+        """
+        Invalidate cached get_xml output for the whole document, and
+        note that @propname needs to be written out on the next render
+        """
+        self._xmlstate.render.generation += 1
+        if not propname:
+            self._xmlstate.render.builddoc = None
+        elif self._dirty_props is not None:
+            self._dirty_props.add(propname)
+
+    def _child_list_changed(self, propname):
+        """
+        Called when objects are added to or removed from the
+        XMLChildProperty list @propname
+        """
+        self._childlists.pop(propname, None)
+        self._mark_dirty()
 
     def _prop_is_unset(self, propname):
         """
@@ -700,7 +922,7 @@ class XMLBuilder(object):
     # Private XML building routines #
     #################################
 
-    def _add_parse_bits(self, xmlapi):
+    def _add_parse_bits(self, xmlapi, dirty_only, track):
         """
         Callback that adds the implicitly tracked XML properties to
         the backing xml.
@@ -709,33 +931,91 @@ class XMLBuilder(object):
         origapi = self._xmlstate.xmlapi
         try:
             self._xmlstate.xmlapi = xmlapi
-            return self._do_add_parse_bits()
+            return self._do_add_parse_bits(dirty_only, track)
         finally:
             self._xmlstate.xmlapi = origapi
             self._propstore = origpropstore
 
-    def _do_add_parse_bits(self):
-        # Set all defaults if the properties have one registered
-        xmlprops = self._all_xml_props()
-        childprops = self._all_child_props()
+    def _can_render_dirty(self):
+        """
+        Whether build mode get_xml can write only the props set since
+        the last render into the kept document. Element order there
+        comes from _XML_PROP_ORDER, so that only works if each changed
+        prop is listed there and just replaces a value it already wrote.
+        Creating or removing nodes could leave them in a different place
+        than a full render puts them.
+        """
+        if self._dirty_props is None:
+            return False
+
+        dummy, headkeys, dummy = _PropCache.get_render_order(self)
+        for key in self._dirty_props:
+            val = self._propstore.get(key)
+            if (key not in headkeys or
+                key not in self._rendered_props or
+                val in [None, False, ""]):
+                return False
 
-        # Set up preferred XML ordering
-        do_order = [p for p in self._propstore if p not in childprops]
-        for key in reversed(self._XML_PROP_ORDER):
-            if key in do_order:
-                do_order.remove(key)
-                do_order.insert(0, key)
-            elif key in childprops:
-                do_order.insert(0, key)
-
-        for key in sorted(list(childprops.keys())):
-            if key not in do_order:
-                do_order.append(key)
-
-        # Alter the XML
-        for key in do_order:
-            if key in xmlprops:
-                xmlprops[key]._set_xml(self, self._propstore[key])
-            elif key in childprops:
-                for obj in util.listify(getattr(self, key)):
-                    obj._add_parse_bits(self._xmlstate.xmlapi)
+        for propname, xmlprop in self._all_child_props().items():
+            for obj in util.listify(getattr(self, propname)):
+                # Child list members are found by index, which is only
+                # right if none of them rendered to nothing
+                if not xmlprop.is_single and not obj._rendered_props:
+                    return False
+                if not obj._can_render_dirty():
+                    return False
+        return True
+
+    def _do_add_parse_bits(self, dirty_only, track):
+        """
+        Write propstore values to the XML. With @dirty_only, props
+        written by a previous render are already present, so only props
+        set since then are written. With @track, the document is kept
+        around, so remember what's been written to it.
+        """
+        dirty = None
+        if dirty_only:
+            dirty = self._dirty_props
+
+        head, headkeys, tail = _PropCache.get_render_order(self)
+        xmlprops = self._all_xml_props()
+        propstore = self._propstore
+        xmlapi = self._xmlstate.xmlapi
+        rendered = self._rendered_props
+        if track and dirty is None:
+            rendered.clear()
+
+        def _render_children(key):
+            for obj in util.listify(getattr(self, key)):
+                obj._add_parse_bits(xmlapi, dirty_only, track)
+
+        def _write(key, prop):
+            val = propstore[key]
+            prop._set_xml(self, val)
+            if not track:
+                return
+            if val in [None, False, ""]:
+                rendered.discard(key)
+            else:
+                rendered.add(key)
+
+        # Preferred ordering first
+        for key, prop, is_child in head:
+            if is_child:
+                _render_children(key)
+            elif key in propstore and (dirty is None or key in dirty):
+                _write(key, prop)
+
+        # Then the rest of the props, in the order they were set
+        if dirty is None or dirty:
+            for key in list(propstore):
+                if key in headkeys or key not in xmlprops:
+                    continue
+                if dirty is None or key in dirty:
+                    _write(key, xmlprops[key])
+
+        for key, dummy in tail:
+            _render_children(key)
+
+        if track:
+            self._dirty_props = set()
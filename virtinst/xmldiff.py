@@ -0,0 +1,285 @@
+#
+# Copyright 2018 Red Hat, Inc.
+#
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import difflib
+
+from .xmlapi import make_xmlapi
+
+# pylint: disable=protected-access
+
+
+# Properties that identify a device across two versions of the same XML
+# when it doesn't have an alias. Devices of other types are paired up
+# by position.
+_DEVICE_IDENTITY_PROPS = {
+    "disk": ["target"],
+    "interface": ["macaddr"],
+    "controller": ["type", "index"],
+    "filesystem": ["target"],
+    "serial": ["type", "target_port"],
+    "parallel": ["type", "target_port"],
+    "console": ["type", "target_type", "target_port"],
+    "channel": ["type", "target_name"],
+}
+
+
+def _unified_diff(origxml, newxml, origname, newname):
+    return "".join(difflib.unified_diff(origxml.splitlines(1),
+                                        newxml.splitlines(1),
+                                        fromfile=origname,
+                                        tofile=newname))
+
+
+def _get_alias(obj):
+    alias = getattr(obj, "alias", None)
+    return alias and alias.name or None
+
+
+def _get_identity(obj):
+    props = _DEVICE_IDENTITY_PROPS.get(getattr(obj, "DEVICE_TYPE", None))
+    if not props:
+        return None
+    ret = tuple(getattr(obj, p) for p in props)
+    if None in ret:
+        return None
+    return ret
+
+
+def _match_children(origlist, newlist):
+    """
+    Return a list of (origidx, newidx) pairs. Unmatched entries are
+    paired with None
+    """
+    pairs = {}
+    origleft = list(range(len(origlist)))
+    newleft = list(range(len(newlist)))
+
+    def _match_by(keycb):
+        keymap = {}
+        for origidx in origleft:
+            key = keycb(origlist[origidx])
+            if key is not None:
+                keymap.setdefault(key, []).append(origidx)
+        for newidx in newleft[:]:
+            key = keycb(newlist[newidx])
+            if key is None or not keymap.get(key):
+                continue
+            origidx = keymap[key].pop(0)
+            pairs[newidx] = origidx
+            origleft.remove(origidx)
+            newleft.remove(newidx)
+
+    _match_by(lambda o: o.get_xml())
+    _match_by(_get_alias)
+    _match_by(_get_identity)
+
+    # Pair up whatever is left by position, unless both sides have
+    # an identity, which we already know doesn't match
+    for newidx in newleft[:]:
+        if _get_identity(newlist[newidx]) is not None:
+            continue
+        for origidx in origleft:
+            pairs[newidx] = origidx
+            origleft.remove(origidx)
+            newleft.remove(newidx)
+            break
+    for origidx in origleft[:]:
+        if _get_identity(origlist[origidx]) is not None:
+            continue
+        for newidx in newleft:
+            pairs[newidx] = origidx
+            origleft.remove(origidx)
+            newleft.remove(newidx)
+            break
+
+    ret = [(pairs.get(idx), idx) for idx in range(len(newlist))]
+    ret += [(idx, None) for idx in origleft]
+    return ret
+
+
+class XMLChange(object):
+    """
+    A single child object that was added, removed, or changed
+    """
+    ADD = "add"
+    REMOVE = "remove"
+    UPDATE = "update"
+
+    def __init__(self, action, propname, origobj, newobj):
+        self.action = action
+        self.propname = propname
+        self.origobj = origobj
+        self.newobj = newobj
+
+    def __repr__(self):
+        return "<XMLChange %s %s>" % (self.action, self.get_xml_id())
+
+    def get_obj(self):
+        """
+        The object to act on: the new version, unless it was removed
+        """
+        return self.newobj or self.origobj
+
+    def get_xml_id(self):
+        return self.get_obj().get_xml_id()
+
+    def is_device(self):
+        return bool(getattr(self.get_obj(), "DEVICE_TYPE", None))
+
+    def get_diff(self):
+        origxml = self.origobj and self.origobj.get_xml() or ""
+        newxml = self.newobj and self.newobj.get_xml() or ""
+        origid = (self.origobj or self.newobj).get_xml_id()
+        return _unified_diff(origxml, newxml,
+                             "Original %s" % origid,
+                             "New %s" % self.get_xml_id())
+
+
+class XMLDiff(object):
+    """
+    Structural diff between two versions of an XMLBuilder object, like
+    a Guest before and after an edit. Objects in XMLChildProperty lists,
+    which for a Guest includes all devices, are matched up between the
+    two versions and reported as individual XMLChange entries. The rest
+    of the XML is compared as a whole.
+
+    Children are matched by identical XML first, then by <alias name>,
+    then by device specific properties like disk target or interface MAC,
+    and finally by position.
+    """
+    def __init__(self, origobj, newobj):
+        self.origobj = origobj
+        self.newobj = newobj
+
+        # List of XMLChange
+        self.changes = []
+        # Whether matched children changed order
+        self.order_changed = False
+
+        self._origrest = None
+        self._newrest = None
+        self._diff()
+
+
+    ###################
+    # Private helpers #
+    ###################
+
+    def _collect_lists(self, obj, ret):
+        """
+        Return a list of (propname, children) for every XMLChildProperty
+        list in obj, and in the single child objects below it
+        """
+        for propname, xmlprop in obj._all_child_props().items():
+            if xmlprop.is_single:
+                self._collect_lists(getattr(obj, propname), ret)
+            else:
+                ret.append((propname, getattr(obj, propname)))
+        return ret
+
+    def _get_rest_xml(self, obj, childlists):
+        """
+        Return obj XML with every collected child removed
+        """
+        rootid = obj.get_xml_id()
+        xmlapi = make_xmlapi(obj.get_xml())
+        for dummy, children in reversed(childlists):
+            for child in reversed(children):
+                xpath = "." + child.get_xml_id()[len(rootid):]
+                xmlapi.node_force_remove(xpath)
+        return xmlapi.get_xml(".")
+
+    def _diff(self):
+        origlists = self._collect_lists(self.origobj, [])
+        newlists = self._collect_lists(self.newobj, [])
+
+        for (propname, origlist), (dummy, newlist) in zip(origlists,
+                                                          newlists):
+            lastorigidx = -1
+            for origidx, newidx in _match_children(origlist, newlist):
+                origchild = origidx is not None and origlist[origidx] or None
+                newchild = newidx is not None and newlist[newidx] or None
+
+                if not origchild:
+                    action = XMLChange.ADD
+                elif not newchild:
+                    action = XMLChange.REMOVE
+                else:
+                    if origidx < lastorigidx:
+                        self.order_changed = True
+                    lastorigidx = origidx
+                    if origchild.get_xml() == newchild.get_xml():
+                        continue
+                    action = XMLChange.UPDATE
+                self.changes.append(
+                    XMLChange(action, propname, origchild, newchild))
+
+        self._origrest = self._get_rest_xml(self.origobj, origlists)
+        self._newrest = self._get_rest_xml(self.newobj, newlists)
+
+
+    ###############
+    # Public APIs #
+    ###############
+
+    def is_noop(self):
+        """
+        True if both versions are equivalent, and defining the new
+        one would be pointless
+        """
+        return (not self.changes and not self.order_changed and
+                not self.rest_changed())
+
+    def rest_changed(self):
+        """
+        True if anything outside the XMLChildProperty lists changed
+        """
+        return self._origrest != self._newrest
+
+    @staticmethod
+    def find_match(obj, origlist, newlist):
+        """
+        Return the entry of newlist that a diff would pair with obj,
+        an entry of origlist, or None if obj was removed. Used to find
+        a device from one version of the XML in another, like the
+        running config and the inactive config.
+        """
+        idx = [id(o) for o in origlist].index(id(obj))
+        for origidx, newidx in _match_children(origlist, newlist):
+            if origidx == idx:
+                return newidx is not None and newlist[newidx] or None
+
+    def get_device_changes(self):
+        return [c for c in self.changes if c.is_device()]
+
+    def get_hotplug_actions(self):
+        """
+        Return a list of (action, device) for applying the diff to a
+        running VM, with virt-xml's action names: hotplug, hotunplug,
+        update. Returns None if some change can only be done with a
+        define, like changes outside of <devices>.
+        """
+        if (self.rest_changed() or self.order_changed or
+            len(self.get_device_changes()) != len(self.changes)):
+            return None
+
+        actionmap = {
+            XMLChange.ADD: "hotplug",
+            XMLChange.REMOVE: "hotunplug",
+            XMLChange.UPDATE: "update",
+        }
+        return [(actionmap[c.action], c.get_obj()) for c in self.changes]
+
+    def format(self):
+        """
+        Return a compact text diff: a unified diff of everything outside
+        the child lists, followed by one per changed child
+        """
+        ret = _unified_diff(self._origrest, self._newrest,
+                            "Original XML", "New XML")
+        for change in self.changes:
+            ret += change.get_diff()
+        return ret
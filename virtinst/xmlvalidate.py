@@ -0,0 +1,176 @@
+#
+# Copyright 2018 Red Hat, Inc.
+#
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import logging
+import os
+import threading
+
+try:
+    import libxml2
+except ImportError:
+    libxml2 = None
+
+
+# Where libvirt installs its relaxng schemas
+SCHEMA_DIR = "/usr/share/libvirt/schemas"
+
+# Document root element name -> schema file
+_SCHEMA_FILES = {
+    "domain": "domain.rng",
+    "domainsnapshot": "domainsnapshot.rng",
+    "network": "network.rng",
+    "pool": "storagepool.rng",
+    "volume": "storagevol.rng",
+    "interface": "interface.rng",
+    "capabilities": "capabilities.rng",
+    "domainCapabilities": "domaincaps.rng",
+    "device": "nodedev.rng",
+}
+
+# Devices can't be validated on their own, domain.rng only has
+# <domain> as a start element. Wrap them in the smallest valid domain.
+_DEVICE_WRAPPER = ("<domain type='qemu'><name>validate</name>"
+                   "<memory>65536</memory><os><type>hvm</type></os>"
+                   "<devices>%s</devices></domain>")
+
+# Compiled schemas, shared by every XMLValidator. Maps schema path
+# to the libxml2 relaxNgSchema, or None if it failed to compile
+_schemas = {}
+_schemas_lock = threading.Lock()
+
+
+def _get_schema(path):
+    with _schemas_lock:
+        if path not in _schemas:
+            schema = None
+            try:
+                ctxt = libxml2.relaxNGNewParserCtxt(path)
+                schema = ctxt.relaxNGParse()
+                logging.debug("Compiled relaxng schema %s", path)
+            except Exception:
+                logging.debug("Error compiling relaxng schema %s",
+                              path, exc_info=True)
+            _schemas[path] = schema
+        return _schemas[path]
+
+
+class XMLValidator(object):
+    """
+    Validate XML in-process against the relaxng schemas shipped with
+    libvirt, so invalid configs are reported before a define or create
+    round trip to the daemon. Schemas are compiled on first use and
+    cached for the life of the process.
+
+    The installed schemas may be older or newer than the libvirt
+    daemon we are talking to, particularly for remote connections,
+    so this is only an optional early check. libvirt is still the
+    authority on what it accepts.
+    """
+    def __init__(self, schemadir=None):
+        self.schemadir = schemadir or SCHEMA_DIR
+
+
+    ###################
+    # Private helpers #
+    ###################
+
+    def _get_xml(self, obj):
+        if not hasattr(obj, "get_xml"):
+            return obj
+        xml = obj.get_xml()
+        if getattr(obj, "DEVICE_TYPE", None):
+            xml = _DEVICE_WRAPPER % xml
+        return xml
+
+    def _validate_xml(self, xml):
+        errors = []
+
+        def _error_cb(ignore, msg):
+            errors.append(msg.strip())
+
+        def _warning_cb(ignore, msg):
+            logging.debug("relaxng validation warning: %s", msg.strip())
+
+        try:
+            doc = libxml2.parseDoc(xml)
+        except Exception as e:
+            return [str(e)]
+
+        try:
+            rootname = doc.getRootElement().name
+            if rootname not in _SCHEMA_FILES:
+                logging.debug("No relaxng schema for <%s>, skipping "
+                              "validation", rootname)
+                return []
+
+            path = os.path.join(self.schemadir, _SCHEMA_FILES[rootname])
+            schema = _get_schema(path)
+            if not schema:
+                return []
+
+            ctxt = schema.relaxNGNewValidCtxt()
+            ctxt.setValidityErrorHandler(_error_cb, _warning_cb)
+            ret = ctxt.relaxNGValidateDoc(doc)
+            if ret != 0 and not errors:
+                errors.append(_("Document does not validate against %s") %
+                              path)
+            return errors
+        finally:
+            doc.freeDoc()
+
+
+    ###############
+    # Public APIs #
+    ###############
+
+    def is_supported(self):
+        """
+        Whether validation can be done: libxml2 is available and the
+        libvirt schemas are installed
+        """
+        return bool(libxml2 and os.path.isdir(self.schemadir))
+
+    def validate(self, obj):
+        """
+        Validate a single document
+
+        :param obj: XML string, or an XMLBuilder object like a Guest
+            or a Device
+        :returns: List of error strings, empty if the XML is valid or
+            there's no schema to check it against
+        """
+        if not self.is_supported():
+            return []
+        return self._validate_xml(self._get_xml(obj))
+
+    def validate_bulk(self, objlist):
+        """
+        Validate a batch of documents, like virt-install's install and
+        boot XML. Every document is checked, a failure doesn't stop
+        validation of the rest.
+
+        :returns: List of error lists, in the same order as objlist
+        """
+        return [self.validate(obj) for obj in objlist]
+
+    def check(self, objlist, names=None):
+        """
+        Validate a batch of documents, and raise ValueError listing
+        the errors of every invalid document
+
+        :param names: Optional list of document names for the error
+            message, in the same order as objlist
+        """
+        msgs = []
+        for idx, errors in enumerate(self.validate_bulk(objlist)):
+            if not errors:
+                continue
+            name = names and names[idx] or _("Document %d") % (idx + 1)
+            msgs.append("%s:\n  %s" % (name, "\n  ".join(errors)))
+
+        if msgs:
+            raise ValueError(_("XML failed schema validation:\n%s") %
+                             "\n".join(msgs))